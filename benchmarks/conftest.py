@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+from typing import Dict, Generator, List, Tuple
+
+import pytest
+
+from runexpy.campaign import DATABASES, Campaign
+from runexpy.database import BaseDatabase
+from runexpy.result import Result
+from runexpy.space import ParamSpace
+from runexpy.utils import DefaultParamsT, IterParamsT, ParamsT
+
+SIZES = [1_000, 10_000, 100_000]
+N_PARAMS = [2, 8, 32]
+BACKENDS = list(DATABASES)
+# runs stored for each combination of parameters
+RUNS = 10
+# parameters taking more than one value, the others are fixed
+VARYING = 3
+
+
+def default_params(n_params: int) -> DefaultParamsT:
+    return {f"p{i}": 0 for i in range(n_params)}
+
+
+def param_ranges(n_results: int, n_params: int) -> IterParamsT:
+    """Ranges of ``n_params`` parameters with ``n_results // RUNS`` combinations"""
+    binary = min(n_params, VARYING) - 1
+    ranges: IterParamsT = {"p0": range(n_results // RUNS // 2**binary)}
+    ranges.update({f"p{i}": [0, 1] for i in range(1, binary + 1)})
+    ranges.update({f"p{i}": 1 for i in range(binary + 1, n_params)})
+    return ranges
+
+
+def param_space(n_results: int, n_params: int) -> ParamSpace:
+    return ParamSpace(param_ranges(n_results, n_params))
+
+
+def first_params(db: BaseDatabase, n_results: int, n_params: int) -> ParamsT:
+    space = param_space(n_results, n_params).with_defaults(db.get_default_params())
+    return next(iter(space))
+
+
+def results(n_results: int, n_params: int) -> List[Result]:
+    space = param_space(n_results, n_params).with_defaults(default_params(n_params))
+    return [
+        Result(f"run_{i}_{j}", 0.01, 0, params)
+        for i, params in enumerate(space)
+        for j in range(RUNS)
+    ]
+
+
+@pytest.fixture(scope="session")
+def bench_dir() -> Generator[str, None, None]:
+    with tempfile.TemporaryDirectory() as tempdir:
+        yield tempdir
+
+
+@pytest.fixture(scope="session")
+def campaign_dirs(bench_dir) -> Dict[Tuple[str, int, int], str]:
+    # campaigns are expensive to fill, each is built once and only read
+    return {}
+
+
+@pytest.fixture()
+def campaign_dir(bench_dir) -> Generator[str, None, None]:
+    with tempfile.TemporaryDirectory(dir=bench_dir) as tempdir:
+        yield os.path.join(tempdir, "campaign")
+
+
+def filled_campaign_dir(
+    dirs: Dict[Tuple[str, int, int], str],
+    bench_dir: str,
+    backend: str,
+    n_results: int,
+    n_params: int,
+) -> str:
+    key = (backend, n_results, n_params)
+    if key not in dirs:
+        # same name as the copies, database files are named after the campaign
+        campaign_dir = os.path.join(bench_dir, "-".join(map(str, key)), "campaign")
+        db = DATABASES[backend].new(
+            ["true"], default_params(n_params), campaign_dir, False
+        )
+        db.insert_results(results(n_results, n_params))
+        dirs[key] = campaign_dir
+    return dirs[key]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> str:
+    return request.param
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}results")
+def n_results(request) -> int:
+    return request.param
+
+
+@pytest.fixture(params=N_PARAMS, ids=lambda n: f"{n}params")
+def n_params(request) -> int:
+    return request.param
+
+
+@pytest.fixture()
+def db(campaign_dirs, bench_dir, backend, n_results, n_params) -> BaseDatabase:
+    campaign_dir = filled_campaign_dir(
+        campaign_dirs, bench_dir, backend, n_results, n_params
+    )
+    return DATABASES[backend].load(campaign_dir)
+
+
+@pytest.fixture()
+def campaign(db) -> Campaign:
+    return Campaign(db)
+
+
+@pytest.fixture()
+def db_copy(campaign_dirs, bench_dir, campaign_dir, backend, n_results, n_params):
+    # a copy which can be written to
+    shutil.copytree(
+        filled_campaign_dir(campaign_dirs, bench_dir, backend, n_results, n_params),
+        campaign_dir,
+    )
+    return DATABASES[backend].load(campaign_dir)
@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.conftest import RUNS, default_params, param_ranges, param_space
+from runexpy.campaign import Campaign
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_list_param_combinations(benchmark, campaign_dir, n_results, n_params):
+    campaign = Campaign.new(["true"], campaign_dir, default_params(n_params))
+    ranges = param_ranges(n_results, n_params)
+    combinations = benchmark(lambda: list(campaign.list_param_combinations(ranges)))
+    assert len(combinations) == n_results // RUNS
+
+
+def test_get_missing_experiments_none(benchmark, campaign, n_results, n_params):
+    space = param_space(n_results, n_params)
+    missing = benchmark(lambda: list(campaign.get_missing_experiments(space, RUNS)))
+    assert missing == []
+
+
+def test_get_missing_experiments_all(benchmark, campaign, n_results, n_params):
+    # one more run of each combination
+    space = param_space(n_results, n_params)
+    missing = benchmark(lambda: list(campaign.get_missing_experiments(space, RUNS + 1)))
+    assert len(missing) == n_results // RUNS
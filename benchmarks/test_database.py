@@ -0,0 +1,45 @@
+import itertools
+
+import pytest
+
+from benchmarks.conftest import first_params
+from runexpy.result import Result
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_insert_result(benchmark, db_copy, n_results, n_params):
+    params = first_params(db_copy, n_results, n_params)
+    ids = itertools.count()
+    benchmark(
+        lambda: db_copy.insert_result(Result(f"new_{next(ids)}", 0.01, 0, params))
+    )
+
+
+def test_count_results_for(benchmark, db, n_results, n_params):
+    params = first_params(db, n_results, n_params)
+    assert benchmark(db.count_results_for, params) > 0
+
+
+def test_count_results_for_subset(benchmark, db):
+    # only some of the parameters, matching a share of the results
+    assert benchmark(db.count_results_for, {"p0": 0}) > 0
+
+
+def test_count_all_results(benchmark, db, n_results):
+    assert sum(benchmark(db.count_all_results).values()) == n_results
+
+
+def test_get_results_for(benchmark, db, n_results, n_params):
+    params = first_params(db, n_results, n_params)
+    assert benchmark(db.get_results_for, params)
+
+
+def test_get_result_batch(benchmark, db, n_results):
+    assert len(benchmark(db.get_result_batch, {})) == n_results
+
+
+def test_load(benchmark, db, n_results):
+    # the campaign has already been loaded once, which indexes it
+    loaded = benchmark(type(db).load, db.dir)
+    assert loaded.count_results_for({}) == n_results
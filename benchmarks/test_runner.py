@@ -0,0 +1,41 @@
+import itertools
+import shutil
+import sys
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.runner import AsyncRunner, ParallelRunner, SimpleRunner
+
+pytest.importorskip("pytest_benchmark")
+
+# experiments run in each round
+EXPERIMENTS = 20
+
+RUNNERS = {
+    "simple": SimpleRunner(),
+    "parallel": ParallelRunner(2),
+    "async": AsyncRunner(2),
+}
+
+
+@pytest.fixture()
+def noop_script():
+    # the cheapest command, so that only the overhead of runexpy is measured
+    true = shutil.which("true")
+    return [true] if true is not None else [sys.executable, "-c", "pass"]
+
+
+@pytest.mark.parametrize("runner", RUNNERS.values(), ids=RUNNERS.keys())
+def test_runner_overhead(benchmark, runner, noop_script, campaign_dir):
+    campaign = Campaign.new(noop_script, campaign_dir, {"x": 0})
+    batches = itertools.count()
+
+    def run():
+        start = next(batches) * EXPERIMENTS
+        campaign.run_missing_experiments(
+            runner, {"x": range(start, start + EXPERIMENTS)}
+        )
+
+    benchmark.pedantic(run, rounds=5, warmup_rounds=1)
+    assert campaign.db.count_results_for({}) >= EXPERIMENTS
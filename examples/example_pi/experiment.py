@@ -47,6 +47,8 @@ def main():
     }
 
     # runner = ParallelRunner(10)
+    # run approx_pi.main in 10 warm processes, importing numpy only once each
+    # runner = PythonFunctionRunner(10)
     runner = SimpleRunner()
     campaign.run_missing_experiments(runner, configs)
     results = campaign.get_results_for(configs)
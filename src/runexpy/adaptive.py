@@ -0,0 +1,163 @@
+import math
+from dataclasses import dataclass, replace
+from typing import Callable, Optional, Sequence
+
+from runexpy.files import RunFiles
+from runexpy.result import Result
+
+# extract the metric of a run from its result and output files
+MetricT = Callable[[Result, RunFiles], float]
+
+
+def _normal_quantile(p: float) -> float:
+    # bisection on the CDF, precise to about 1e-12
+    low, high = -40.0, 40.0
+    for _ in range(80):
+        mid = (low + high) / 2
+        if (1 + math.erf(mid / math.sqrt(2))) / 2 < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def _t_central(theta: float, df: int) -> float:
+    # probability that |T| < sqrt(df) tan(theta), in closed form for an integer
+    # number of degrees of freedom (Abramowitz and Stegun 26.7.3 and 26.7.4)
+    sin, cos2 = math.sin(theta), math.cos(theta) ** 2
+    total = 0.0
+    if df % 2:
+        term = math.cos(theta)
+        for k in range(1, df - 1, 2):
+            total += term
+            term *= cos2 * (k + 1) / (k + 2)
+        return 2 / math.pi * (theta + sin * total)
+    term = 1.0
+    for k in range(1, df, 2):
+        total += term
+        term *= cos2 * k / (k + 1)
+    return sin * total
+
+
+# degrees of freedom above which the quantile is approximated
+_EXACT_DF = 100
+
+
+def t_quantile(p: float, df: int) -> float:
+    """Quantile of the Student's t distribution with ``df`` degrees of freedom.
+
+    Exact up to 100 degrees of freedom, inverting the distribution function by
+    bisection. Above, approximated by the Cornish-Fisher expansion
+    around the normal quantile, with a relative error below 1e-8 for ``p`` up
+    to 0.9995.
+    """
+    if not 0 < p < 1:
+        raise ValueError("p must be between 0 and 1")
+    if df < 1:
+        raise ValueError("At least one degree of freedom is needed")
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    if df <= _EXACT_DF:
+        # bisection on the angle, which maps [0, pi/2) to all the t >= 0
+        target = abs(2 * p - 1)
+        low, high = 0.0, math.pi / 2
+        for _ in range(60):
+            mid = (low + high) / 2
+            if _t_central(mid, df) < target:
+                low = mid
+            else:
+                high = mid
+        t = math.sqrt(df) * math.tan((low + high) / 2)
+        return t if p >= 0.5 else -t
+    z = _normal_quantile(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5 * z**5 + 16 * z**3 + 3 * z) / 96
+    g3 = (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384
+    g4 = (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df**2 + g3 / df**3 + g4 / df**4
+
+
+@dataclass(frozen=True)
+class Estimate:
+    """Mean of the metric of a parameter combination, with its confidence interval.
+
+    ``runs`` counts the stored results, ``values`` only the successful ones,
+    from which the metric is extracted.
+    """
+
+    runs: int
+    values: int
+    mean: Optional[float]
+    # half width of the confidence interval, infinite with less than 2 values
+    half_width: float
+    converged: bool
+
+    @property
+    def low(self) -> Optional[float]:
+        return None if self.mean is None else self.mean - self.half_width
+
+    @property
+    def high(self) -> Optional[float]:
+        return None if self.mean is None else self.mean + self.half_width
+
+    @property
+    def rel_width(self) -> float:
+        """Width of the confidence interval relative to the mean"""
+        if self.mean is None or self.half_width == math.inf:
+            return math.inf
+        if self.mean == 0:
+            return 0.0 if self.half_width == 0 else math.inf
+        return 2 * self.half_width / abs(self.mean)
+
+
+@dataclass
+class ConvergencePolicy:
+    """When to stop repeating the runs of a parameter combination.
+
+    The repetitions of a combination stop once the confidence interval, at
+    level ``confidence``, of the mean of its ``metric`` is narrower than
+    ``rel_width`` times the mean, or once it has ``max_runs`` results (failed
+    runs included). At least ``min_runs`` successful runs are always made.
+    Each round adds ``batch`` runs to every combination not converged yet.
+    """
+
+    metric: MetricT
+    rel_width: float = 0.05
+    confidence: float = 0.95
+    min_runs: int = 3
+    max_runs: int = 30
+    batch: int = 1
+
+    def __post_init__(self):
+        if not 0 < self.confidence < 1:
+            raise ValueError("The confidence must be between 0 and 1")
+        if self.min_runs < 2:
+            raise ValueError("At least 2 runs are needed to estimate the variance")
+        if self.max_runs < self.min_runs:
+            raise ValueError("max_runs must not be smaller than min_runs")
+        if self.batch < 1:
+            raise ValueError("Each round must add at least one run")
+
+    def estimate(self, values: Sequence[float], runs: int) -> Estimate:
+        n = len(values)
+        if n == 0:
+            return Estimate(runs, 0, None, math.inf, False)
+        mean = sum(values) / n
+        half_width = math.inf
+        if n > 1:
+            std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+            t = t_quantile((1 + self.confidence) / 2, n - 1)
+            half_width = t * std / math.sqrt(n)
+        estimate = Estimate(runs, n, mean, half_width, False)
+        if n >= self.min_runs and estimate.rel_width <= self.rel_width:
+            estimate = replace(estimate, converged=True)
+        return estimate
+
+    def missing_runs(self, estimate: Estimate) -> int:
+        """Runs to add to a combination in the next round"""
+        if estimate.converged or estimate.runs >= self.max_runs:
+            return 0
+        n = max(self.batch, self.min_runs - estimate.values)
+        return min(n, self.max_runs - estimate.runs)
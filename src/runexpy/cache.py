@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import replace
+from typing import Iterable, List, Optional
+
+from runexpy.result import Result
+from runexpy.utils import ParamsT, params_key
+
+
+def _hash_file(h, path: str) -> None:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def _hash_path(h, path: str) -> None:
+    # contents of a file, or of all the files in a directory
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file = os.path.join(root, name)
+                h.update(os.path.relpath(file, path).encode() + b"\0")
+                _hash_file(h, file)
+    else:
+        _hash_file(h, path)
+
+
+def script_fingerprint(script: List[str], inputs: Iterable[str] = ()) -> str:
+    """Hash of a script command and of the files it depends on.
+
+    Arguments of the command which are files are hashed by content, commands
+    found in the ``PATH`` (e.g. the interpreter) by modification time and
+    size. ``inputs`` are additional files or directories hashed by content.
+    """
+    h = hashlib.sha256()
+    for item in script:
+        h.update(item.encode() + b"\0")
+        if os.path.isfile(item):
+            _hash_path(h, item)
+            continue
+        executable = shutil.which(item)
+        if executable is not None:
+            stat = os.stat(executable)
+            h.update(f"{stat.st_mtime_ns}:{stat.st_size}".encode())
+    for path in inputs:
+        h.update(b"\0input\0" + os.path.abspath(path).encode() + b"\0")
+        _hash_path(h, path)
+    return h.hexdigest()
+
+
+def _link_or_copy(src_dir: str, dst_dir: str) -> None:
+    # hard link the files when possible, they are never modified after a run
+    for root, _, files in os.walk(src_dir):
+        target = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            src, dst = os.path.join(root, name), os.path.join(target, name)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """Results and output files shared among campaigns, keyed by content.
+
+    Results are keyed by the parameters and the fingerprint of the script, so
+    that campaigns running the same script on the same inputs reuse each
+    other's runs, while changing the script or one of the declared ``inputs``
+    invalidates them. Each key holds the successful runs stored for it, in the
+    order they were stored.
+    """
+
+    _RESULT_FILE = "result.json"
+    _FILES_DIR = "files"
+
+    def __init__(self, dir: str, inputs: Iterable[str] = ()):
+        self.dir = os.path.abspath(os.path.expanduser(dir))
+        self.inputs = [os.path.abspath(path) for path in inputs]
+        os.makedirs(os.path.join(self.dir, "tmp"), exist_ok=True)
+
+    def fingerprint(self, script: List[str]) -> str:
+        return script_fingerprint(script, self.inputs)
+
+    @staticmethod
+    def key(fingerprint: str, params: ParamsT) -> str:
+        data = json.dumps([fingerprint, params_key(params)], default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _key_dir(self, fingerprint: str, params: ParamsT) -> str:
+        key = self.key(fingerprint, params)
+        return os.path.join(self.dir, key[:2], key)
+
+    def entries(self, fingerprint: str, params: ParamsT) -> List[str]:
+        """Directories of the runs stored for a key, oldest first"""
+        key_dir = self._key_dir(fingerprint, params)
+        try:
+            names = sorted(os.listdir(key_dir))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(key_dir, name) for name in names]
+
+    def store(self, result: Result, run_dir: str) -> None:
+        """Store a run of a script with a fingerprint, if successful"""
+        if result.fingerprint is None or result.exitcode != 0:
+            return
+        tmp_dir = os.path.join(self.dir, "tmp", str(uuid.uuid4()))
+        _link_or_copy(run_dir, os.path.join(tmp_dir, self._FILES_DIR))
+        with open(os.path.join(tmp_dir, self._RESULT_FILE), "w") as f:
+            json.dump(result.to_json(), f)
+        key_dir = self._key_dir(result.fingerprint, result.params)
+        os.makedirs(key_dir, exist_ok=True)
+        # the entry only becomes visible once complete
+        os.rename(tmp_dir, os.path.join(key_dir, f"{time.time_ns():020d}-{result.id}"))
+
+    @staticmethod
+    def entry_id(entry: str) -> str:
+        """Id of the run stored in an entry"""
+        return os.path.basename(entry).split("-", 1)[1]
+
+    def restore(self, entry: str, data_dir: str, params: ParamsT) -> Optional[Result]:
+        """Copy a stored run into ``data_dir``, keeping its id"""
+        try:
+            with open(os.path.join(entry, self._RESULT_FILE)) as f:
+                cached = Result.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
+        _link_or_copy(
+            os.path.join(entry, self._FILES_DIR), os.path.join(data_dir, cached.id)
+        )
+        return replace(cached, params=params)
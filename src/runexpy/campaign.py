@@ -1,25 +1,167 @@
 from __future__ import annotations
 
 import itertools
-from dataclasses import dataclass, field
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import partial
 from pathlib import Path
-from typing import Dict, Generator, List, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
-from runexpy.database import Database
-from runexpy.result import Result
-from runexpy.runner import Runner, SimpleRunner
-from runexpy.utils import DefaultParamsT, IterParamsT, ParamsT, to_abs_if_path
+from tinydb.storages import Storage
+
+from runexpy.adaptive import ConvergencePolicy, Estimate
+from runexpy.cache import ResultCache
+from runexpy.cost import CostModel
+from runexpy.database import BaseDatabase, Database
+from runexpy.files import RunFile, RunFiles
+from runexpy.lock import FileLock
+from runexpy.output import OutputPolicy
+from runexpy.plan import ExperimentPlan
+from runexpy.progress import ProgressListener, ProgressTracker
+from runexpy.result import Result, ResultBatch
+from runexpy.runner import AsyncRunner, Runner, SimpleRunner, monitoring
+from runexpy.space import ParamSpace
+from runexpy.sqlite import SQLiteDatabase
+from runexpy.table import LoaderT, ResultTable, build_table
+from runexpy.usage import UsageSummary
+from runexpy.utils import (
+    DefaultParamsT,
+    IterParamsT,
+    ParamsKeyT,
+    ParamsT,
+    freeze_value,
+    params_key,
+    to_abs_if_path,
+)
+
+ParamRangesT = Union[IterParamsT, ParamSpace, List[Union[IterParamsT, ParamSpace]]]
+
+DATABASES: Dict[str, Type[BaseDatabase]] = {
+    "tinydb": Database,
+    "sqlite": SQLiteDatabase,
+}
+
+
+def _database_options(backend: str, storage: Optional[Type[Storage]]) -> dict:
+    if backend not in DATABASES:
+        raise ValueError(
+            f"Unknown database backend {backend}, "
+            f"available backends: {list(DATABASES)}"
+        )
+    if storage is None:
+        return {}
+    if backend != "tinydb":
+        raise ValueError("A storage can only be specified for the tinydb backend")
+    return {"storage": storage}
+
+
+def _exit(signum, frame):
+    sys.exit(128 + signum)
+
+
+_forking = threading.local()
+
+
+def _before_fork() -> None:
+    # processes forked by the runners get the default SIGTERM back: a SIGTERM
+    # reaching them before Python resets its signal state would be lost, so it
+    # is held until then
+    _forking.blocked = signal.getsignal(signal.SIGTERM) is _exit
+    if _forking.blocked:
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+
+
+def _after_fork(child: bool) -> None:
+    if not getattr(_forking, "blocked", False):
+        return
+    _forking.blocked = False
+    if child:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+
+
+if hasattr(os, "register_at_fork") and hasattr(signal, "pthread_sigmask"):
+    os.register_at_fork(
+        before=_before_fork,
+        after_in_parent=partial(_after_fork, False),
+        after_in_child=partial(_after_fork, True),
+    )
+
+
+@contextmanager
+def _exit_on_sigterm() -> Generator[None, None, None]:
+    # turn SIGTERM into SystemExit, so that pending results are written on the way
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGTERM, _exit)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+@dataclass
+class FlushPolicy:
+    """When the results produced by a runner are written to the database.
+
+    Results are buffered until ``every`` of them are available or ``interval``
+    seconds have passed since the last write, whichever comes first. The
+    interval is checked by a background thread, so results are written on
+    time during long experiments too. Pending results are always written when
+    the run ends, fails or gets a SIGTERM.
+    """
+
+    every: Optional[int] = 1
+    interval: Optional[float] = None
+
+    def should_write(self, pending: int, elapsed: float) -> bool:
+        return (self.every is not None and pending >= self.every) or (
+            self.interval is not None and elapsed >= self.interval
+        )
 
 
 @dataclass
 class Campaign:
-    db: Database = field(compare=False)
+    db: BaseDatabase = field(compare=False)
 
     _script: List[str] = field(init=False)
     _campaign_dir: str = field(init=False)
     _default_params: DefaultParamsT = field(init=False)
 
+    flush_policy: FlushPolicy = field(default_factory=FlushPolicy, compare=False)
+    output_policy: Optional[OutputPolicy] = field(default=None, compare=False)
+    # notified of the progress of the runs
+    listeners: List[ProgressListener] = field(default_factory=list, compare=False)
+
+    # serializes the accesses to the database while results are flushed on
+    # time by another thread, neither TinyDB nor a SQLite connection shared by
+    # threads are safe otherwise
+    _db_lock: threading.RLock = field(init=False, repr=False, compare=False)
+
     def __post_init__(self):
+        self._db_lock = threading.RLock()
         self._script = self.db.get_script()
         self._campaign_dir = self.db.get_campaign_dir()
         self._default_params = self.db.get_default_params()
@@ -31,6 +173,8 @@ class Campaign:
         campaign_dir: str,
         default_params: DefaultParamsT,
         overwrite: bool = False,
+        storage: Optional[Type[Storage]] = None,
+        backend: Optional[str] = None,
     ):
         # Convert paths to be absolute
         campaign_dir = to_abs_if_path(campaign_dir)
@@ -39,10 +183,33 @@ class Campaign:
 
         script = list(map(to_abs_if_path, script))
 
+        # processes creating the same campaign at the same time, e.g. the
+        # shards of a run, are serialized by a lock next to its directory
+        parent, name = os.path.split(campaign_dir)
+        os.makedirs(parent, exist_ok=True)
+        lock = FileLock(os.path.join(parent, f".{name}.lock"))
+        try:
+            with lock.exclusive():
+                return cls._new(
+                    script, campaign_dir, default_params, overwrite, storage, backend
+                )
+        finally:
+            lock.close()
+
+    @classmethod
+    def _new(
+        cls,
+        script: List[str],
+        campaign_dir: str,
+        default_params: DefaultParamsT,
+        overwrite: bool,
+        storage: Optional[Type[Storage]],
+        backend: Optional[str],
+    ):
         # Verify if the specified campaign is already available
         if Path(campaign_dir).exists() and not overwrite:
             # Try loading
-            campaign = Campaign.load(campaign_dir)
+            campaign = Campaign.load(campaign_dir, storage, backend)
             if campaign.db.get_script() != script:
                 raise ValueError("Found database with a different script")
             if campaign.db.get_default_params() != default_params:
@@ -53,78 +220,411 @@ class Campaign:
                 )
             return campaign
 
-        db = Database.new(script, default_params, campaign_dir, overwrite)
+        backend = backend or "tinydb"
+        options = _database_options(backend, storage)
+        db = DATABASES[backend].new(
+            script, default_params, campaign_dir, overwrite, **options
+        )
         return cls(db)
 
     @classmethod
-    def load(cls, campaign_dir):
+    def load(
+        cls,
+        campaign_dir,
+        storage: Optional[Type[Storage]] = None,
+        backend: Optional[str] = None,
+    ):
         # Convert paths to be absolute
         campaign_dir = to_abs_if_path(campaign_dir)
+        # Detect the backend, asking for sqlite migrates TinyDB campaigns
+        if backend is None:
+            backend = "sqlite" if SQLiteDatabase.exists(campaign_dir) else "tinydb"
+        options = _database_options(backend, storage)
         # Read the existing configuration into the new DatabaseManager
-        db = Database.load(campaign_dir)
+        db = DATABASES[backend].load(campaign_dir, **options)
         return cls(db)
 
     def run_missing_experiments(
         self,
         runner: Runner,
-        param_combinations: Union[IterParamsT, List[IterParamsT]],
+        param_combinations: ParamRangesT,
         count: int = 1,
+        longest_first: bool = False,
+        cache: Optional[ResultCache] = None,
+        successful_only: bool = False,
+    ) -> None:
+        """Run the experiments missing to reach ``count`` results each.
+
+        With a ``cache``, only the results of the current version of the script
+        are counted, runs stored in the cache are reused instead of being run
+        again, and new runs are added to the cache. With ``successful_only``,
+        failed results are not counted, so that failed experiments run again.
+        """
+        fingerprint = None if cache is None else cache.fingerprint(self._script)
+        plan = self.plan_missing_experiments(
+            param_combinations, count, fingerprint, successful_only
+        )
+        self._run_plan(runner, plan, longest_first, cache, fingerprint)
+
+    def _run_plan(
+        self,
+        runner: Runner,
+        plan: ExperimentPlan,
+        longest_first: bool,
+        cache: Optional[ResultCache],
+        fingerprint: Optional[str],
     ) -> None:
-        missing_experiments = self.get_missing_experiments(param_combinations, count)
         script = self._script
-        for result in runner.run_experiments(
-            script, self.db.get_data_dir(), missing_experiments
-        ):
-            self.write_result(result)
+        with self._tracking(plan, runner) as tracker, self._result_writer() as write:
+
+            def restored(result: Result) -> None:
+                write(result)
+                tracker.add(result, cached=True)
+
+            missing_experiments = self._prepare_run(
+                plan, longest_first, cache, fingerprint, restored
+            )
+            for result in runner.run_experiments(
+                script, self.db.get_data_dir(), missing_experiments
+            ):
+                start = time.monotonic()
+                result = self._finish_run(result, cache, fingerprint)
+                write(result)
+                tracker.add(result, bookkeeping=time.monotonic() - start)
+
+    async def arun_missing_experiments(
+        self,
+        runner: AsyncRunner,
+        param_combinations: ParamRangesT,
+        count: int = 1,
+        longest_first: bool = False,
+        cache: Optional[ResultCache] = None,
+        successful_only: bool = False,
+    ) -> None:
+        fingerprint = None if cache is None else cache.fingerprint(self._script)
+        script = self._script
+        plan = self.plan_missing_experiments(
+            param_combinations, count, fingerprint, successful_only
+        )
+        with self._tracking(plan, runner) as tracker, self._result_writer() as write:
+
+            def restored(result: Result) -> None:
+                write(result)
+                tracker.add(result, cached=True)
+
+            missing_experiments = self._prepare_run(
+                plan, longest_first, cache, fingerprint, restored
+            )
+            async for result in runner.arun_experiments(
+                script, self.db.get_data_dir(), missing_experiments
+            ):
+                start = time.monotonic()
+                result = self._finish_run(result, cache, fingerprint)
+                write(result)
+                tracker.add(result, bookkeeping=time.monotonic() - start)
+
+    def run_until_converged(
+        self,
+        runner: Runner,
+        param_combinations: ParamRangesT,
+        policy: ConvergencePolicy,
+        longest_first: bool = False,
+    ) -> List[Tuple[ParamsT, Estimate]]:
+        """Repeat the experiments until the metric of each combination converges.
+
+        Experiments are run in rounds, each adding runs to the combinations
+        whose estimate of the metric has not converged yet according to the
+        ``policy``. The results already stored count as the first runs.
+        Returns the final estimate of every combination.
+        """
+        combs = self.list_param_combinations(param_combinations)
+        combinations = list({params_key(c): c for c in combs}.values())
+        values: Dict[ParamsKeyT, List[float]] = {}
+        runs: Dict[ParamsKeyT, int] = {}
+        seen: Set[str] = set()
+        estimates: Dict[ParamsKeyT, Estimate] = {}
+        pending = combinations
+        while pending:
+            missing = []
+            for comb in pending:
+                key = params_key(comb)
+                for result in self.db.iter_results_for(comb):
+                    if result.id in seen:
+                        continue
+                    seen.add(result.id)
+                    runs[key] = runs.get(key, 0) + 1
+                    if result.exitcode == 0:
+                        files = self.db.get_run_files(result)
+                        values.setdefault(key, []).append(policy.metric(result, files))
+                estimate = policy.estimate(values.get(key, []), runs.get(key, 0))
+                estimates[key] = estimate
+                n = policy.missing_runs(estimate)
+                if n > 0:
+                    missing.append((comb, n))
+            if missing:
+                plan = ExperimentPlan(
+                    missing, policy.batch, len(combinations), sum(runs.values())
+                )
+                self._run_plan(runner, plan, longest_first, None, None)
+            pending = [comb for comb, _ in missing]
+        return [(comb, estimates[params_key(comb)]) for comb in combinations]
+
+    @contextmanager
+    def _tracking(
+        self, plan: ExperimentPlan, runner: Runner
+    ) -> Generator[ProgressTracker, None, None]:
+        if not self.listeners:
+            # nothing to track, the runners do not report their runs
+            yield ProgressTracker([], plan.runs, runner.concurrency)
+            return
+        tracker = ProgressTracker(
+            self.listeners, plan.runs, runner.concurrency, self.db.mean_time()
+        )
+        tracker.start()
+        try:
+            with monitoring(tracker):
+                yield tracker
+        finally:
+            tracker.end()
+
+    def _prepare_run(
+        self,
+        plan: ExperimentPlan,
+        longest_first: bool,
+        cache: Optional[ResultCache],
+        fingerprint: Optional[str],
+        write: Callable[[Result], None],
+    ) -> Iterable[ParamsT]:
+        if cache is not None and fingerprint is not None:
+            plan = self._restore_cached(plan, cache, fingerprint, write)
+        if longest_first:
+            return self.sort_by_expected_time(plan)
+        return plan
+
+    def _restore_cached(
+        self,
+        plan: ExperimentPlan,
+        cache: ResultCache,
+        fingerprint: str,
+        write: Callable[[Result], None],
+    ) -> ExperimentPlan:
+        # restored runs keep their id, which tells the entries already in the
+        # campaign, either run or restored by it, from the others
+        data_dir = self.db.get_data_dir()
+        missing = []
+        restored = 0
+        for comb, n in plan.missing:
+            entries = cache.entries(fingerprint, comb)
+            if entries:
+                with self._db_lock:
+                    ids = {result.id for result in self.db.iter_results_for(comb)}
+                entries = [e for e in entries if cache.entry_id(e) not in ids]
+            for entry in entries:
+                if n == 0:
+                    break
+                result = cache.restore(entry, data_dir, comb)
+                if result is not None:
+                    write(result)
+                    restored += 1
+                    n -= 1
+            if n > 0:
+                missing.append((comb, n))
+        return replace(plan, missing=missing, stored=plan.stored + restored)
+
+    def _finish_run(
+        self, result: Result, cache: Optional[ResultCache], fingerprint: Optional[str]
+    ) -> Result:
+        run_dir = os.path.join(self.db.get_data_dir(), result.id)
+        if self.output_policy is not None:
+            self.output_policy.apply(
+                run_dir, os.path.join(self._campaign_dir, "objects")
+            )
+        if cache is None:
+            return result
+        result = replace(result, fingerprint=fingerprint)
+        cache.store(result, run_dir)
+        return result
+
+    @contextmanager
+    def _result_writer(self) -> Generator[Callable[[Result], None], None, None]:
+        # buffer the results and write them according to the flush policy
+        pending: List[Result] = []
+        last_write = time.monotonic()
+        done = threading.Event()
+
+        def flush() -> None:
+            nonlocal last_write
+            if pending:
+                self.write_results(pending)
+                pending.clear()
+            last_write = time.monotonic()
+
+        def write(result: Result) -> None:
+            with self._db_lock:
+                pending.append(result)
+                elapsed = time.monotonic() - last_write
+                if self.flush_policy.should_write(len(pending), elapsed):
+                    flush()
+
+        def flush_on_time(interval: float) -> None:
+            # results are written on time also while no new one arrives
+            while not done.wait(max(0.0, last_write + interval - time.monotonic())):
+                with self._db_lock:
+                    if time.monotonic() - last_write >= interval:
+                        flush()
+
+        flusher = None
+        if self.flush_policy.interval is not None:
+            flusher = threading.Thread(
+                target=flush_on_time, args=(self.flush_policy.interval,), daemon=True
+            )
+            flusher.start()
+        with _exit_on_sigterm():
+            try:
+                yield write
+            finally:
+                done.set()
+                if flusher is not None:
+                    flusher.join()
+                with self._db_lock:
+                    flush()
+
+    def plan_missing_experiments(
+        self,
+        param_combinations: ParamRangesT,
+        count: int = 1,
+        fingerprint: Optional[str] = None,
+        successful_only: bool = False,
+    ) -> ExperimentPlan:
+        """Find the runs missing to reach ``count`` results per combination.
+
+        The stored results are counted in a single pass over the database, so
+        the plan can be inspected (e.g. ``plan.summary()``) before running it.
+        With a script ``fingerprint``, only the results it produced are counted,
+        with ``successful_only`` only the results with exit code 0.
+        """
+        with self._db_lock:
+            counts = self.db.count_all_results(fingerprint, successful_only)
+        return ExperimentPlan.build(
+            self.list_param_combinations(param_combinations), counts, count
+        )
 
     def get_missing_experiments(
         self,
-        param_combinations: Union[IterParamsT, List[IterParamsT]],
+        param_combinations: ParamRangesT,
         count: int = 1,
+        successful_only: bool = False,
     ) -> Generator[ParamsT, None, None]:
-        for comb in self.list_param_combinations(param_combinations):
-            missing = max(0, count - self.db.count_results_for(comb))
-            for _ in range(missing):
-                yield comb
+        yield from self.plan_missing_experiments(
+            param_combinations, count, successful_only=successful_only
+        )
+
+    def sort_by_expected_time(self, experiments: Iterable[ParamsT]) -> List[ParamsT]:
+        """Sort experiments by decreasing running time, predicted from results"""
+        with self._db_lock:
+            model = CostModel(self.db.get_results_for({}))
+        return sorted(experiments, key=model.predict, reverse=True)
 
     def write_result(self, result: Result) -> None:
-        self.db.insert_result(result)
+        with self._db_lock:
+            self.db.insert_result(result)
+
+    def write_results(self, results: Iterable[Result]) -> None:
+        with self._db_lock:
+            self.db.insert_results(results)
 
     def get_results_for(
-        self, param_combinations: Union[IterParamsT, List[IterParamsT]]
-    ) -> List[Tuple[Result, Dict[str, str]]]:
+        self, param_combinations: ParamRangesT
+    ) -> List[Tuple[Result, Dict[str, RunFile]]]:
         combs = self.list_param_combinations(param_combinations)
-        results = itertools.chain.from_iterable(map(self.db.get_results_for, combs))
+        with self._db_lock:
+            results = list(
+                itertools.chain.from_iterable(map(self.db.get_results_for, combs))
+            )
         return [(res, self.db.get_files_for(res)) for res in results]
 
     def get_all_results(
         self,
-    ) -> List[Tuple[Result, Dict[str, str]]]:
-        results = self.db.get_results_for({})
+    ) -> List[Tuple[Result, Dict[str, RunFile]]]:
+        with self._db_lock:
+            results = self.db.get_results_for({})
         return [(res, self.db.get_files_for(res)) for res in results]
 
+    def iter_results_for(
+        self, param_combinations: ParamRangesT
+    ) -> Iterator[Tuple[Result, RunFiles]]:
+        """Stream the results, listing the files of a run only when accessed"""
+        combs = self.list_param_combinations(param_combinations)
+        results = itertools.chain.from_iterable(map(self.db.iter_results_for, combs))
+        return ((res, self.db.get_run_files(res)) for res in results)
+
+    def iter_all_results(self) -> Iterator[Tuple[Result, RunFiles]]:
+        """Stream all the results, listing the files of a run only when accessed"""
+        results = self.db.iter_results_for({})
+        return ((res, self.db.get_run_files(res)) for res in results)
+
+    def _iter_results(
+        self, param_combinations: Optional[ParamRangesT]
+    ) -> Iterator[Result]:
+        if param_combinations is None:
+            return self.db.iter_results_for({})
+        combs = self.list_param_combinations(param_combinations)
+        return itertools.chain.from_iterable(map(self.db.iter_results_for, combs))
+
+    def usage_summary(
+        self,
+        param_combinations: Optional[ParamRangesT] = None,
+        group_by: Sequence[str] = (),
+    ) -> Dict[Tuple[Any, ...], UsageSummary]:
+        """Sum the resources used by the results, grouped by some parameters.
+
+        Groups are keyed by the values of the ``group_by`` parameters. All the
+        results are summed if no parameter combination is given.
+        """
+        summaries: Dict[Tuple[Any, ...], UsageSummary] = {}
+        for result in self._iter_results(param_combinations):
+            key = tuple(freeze_value(result.params[name]) for name in group_by)
+            summaries.setdefault(key, UsageSummary()).add(result)
+        return summaries
+
+    def to_table(
+        self,
+        param_combinations: Optional[ParamRangesT] = None,
+        loaders: Optional[Mapping[str, LoaderT]] = None,
+        executor: Optional[Executor] = None,
+        cache: bool = True,
+    ) -> ResultTable:
+        """Collect the results by column, with the fields parsed by ``loaders``.
+
+        ``loaders`` maps output file names to functions parsing a file into a
+        dictionary of fields. Parsed fields are cached in the campaign
+        directory unless ``cache`` is False. All the results are collected if
+        no parameter combination is given.
+        """
+        if param_combinations is None:
+            results = self.db.get_result_batch({})
+        else:
+            results = ResultBatch(self.db.get_schema())
+            for comb in self.list_param_combinations(param_combinations):
+                results.extend(self.db.get_result_batch(comb))
+        cache_dir = os.path.join(self._campaign_dir, "cache", "table")
+        return build_table(
+            results,
+            self.db.get_data_dir(),
+            list(self._default_params),
+            loaders or {},
+            cache_dir if cache else None,
+            executor,
+        )
+
     def list_param_combinations(
         self,
-        param_ranges: Union[IterParamsT, List[IterParamsT]],
+        param_ranges: ParamRangesT,
     ) -> Generator[ParamsT, None, None]:
         if isinstance(param_ranges, dict):
-            param_lists = []
-            if not set(param_ranges.keys()).issubset(self._default_params.keys()):
-                raise ValueError(
-                    "Unknown parameters: "
-                    f"{set(param_ranges.keys()) - self._default_params.keys()}"
-                )
-            for param, default in self._default_params.items():
-                if param_ranges.get(param) is None:
-                    if default is None:
-                        raise ValueError(f"Non-default field {param} has not been set")
-                    value = default
-                else:
-                    value = param_ranges[param]
-                values_list = value if isinstance(value, list) else [value]
-                param_lists.append(map(to_abs_if_path, values_list))
-            for param_comb in itertools.product(*param_lists):
-                yield dict(zip(self._default_params.keys(), param_comb))
+            param_ranges = ParamSpace(param_ranges)
+        if isinstance(param_ranges, ParamSpace):
+            yield from param_ranges.with_defaults(self._default_params)
         else:
             for x in param_ranges:
                 yield from self.list_param_combinations(x)
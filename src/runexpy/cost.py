@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from runexpy.result import Result
+from runexpy.utils import ParamsKeyT, ParamsT, params_key
+
+PointT = Tuple[Tuple[float, ...], float]
+
+
+def _is_numeric(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _split(params: ParamsT) -> Tuple[ParamsKeyT, Tuple[float, ...]]:
+    # group by the non-numeric parameters, regress on the numeric ones
+    key = params_key(params)
+    group = tuple((k, v) for k, v in key if not _is_numeric(v))
+    return group, tuple(float(v) for _, v in key if _is_numeric(v))
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    # Gaussian elimination with partial pivoting
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def _fit(points: List[PointT]) -> Optional[Tuple[List[int], List[float]]]:
+    # least squares linear model: time = w[0] + sum(w[j + 1] * x[i_j])
+    # only on the parameters i_j which are not constant within the points
+    columns = [
+        i for i in range(len(points[0][0])) if len({x[i] for x, _ in points}) > 1
+    ]
+    d = len(columns) + 1
+    if len(points) < d:
+        return None
+    xtx = [[0.0] * d for _ in range(d)]
+    xty = [0.0] * d
+    for x, y in points:
+        row = [1.0] + [x[i] for i in columns]
+        for i in range(d):
+            xty[i] += row[i] * y
+            for j in range(d):
+                xtx[i][j] += row[i] * row[j]
+    w = _solve(xtx, xty)
+    return None if w is None else (columns, w)
+
+
+class CostModel:
+    """Predict the running time of experiments from the results already stored.
+
+    Experiments already run are predicted with the mean time of their runs.
+    The others are predicted by a linear regression on the numeric parameters
+    over the results sharing the same non-numeric parameters, falling back to
+    the nearest run experiment when the regression is ill-conditioned, and to
+    the overall mean time when no such result exists.
+    """
+
+    def __init__(self, results: Iterable[Result]):
+        results = list(results)
+        # failed runs usually end early and do not tell how long runs take
+        successful = [r for r in results if r.exitcode == 0]
+        results = successful or results
+
+        times: Dict[ParamsKeyT, List[float]] = {}
+        combinations: Dict[ParamsKeyT, ParamsT] = {}
+        for result in results:
+            key = params_key(result.params)
+            times.setdefault(key, []).append(result.time)
+            combinations.setdefault(key, result.params)
+        self._means = {key: sum(t) / len(t) for key, t in times.items()}
+        self._mean = sum(r.time for r in results) / len(results) if results else 0.0
+
+        self._groups: Dict[ParamsKeyT, List[PointT]] = {}
+        for key, params in combinations.items():
+            group, x = _split(params)
+            self._groups.setdefault(group, []).append((x, self._means[key]))
+        self._models: Dict[ParamsKeyT, Optional[Tuple[List[int], List[float]]]] = {}
+
+    def _regression(self, group: ParamsKeyT) -> Optional[Tuple[List[int], List[float]]]:
+        if group not in self._models:
+            self._models[group] = _fit(self._groups[group])
+        return self._models[group]
+
+    def predict(self, params: ParamsT) -> float:
+        key = params_key(params)
+        if key in self._means:
+            return self._means[key]
+        group, x = _split(params)
+        points = self._groups.get(group)
+        if not points:
+            return self._mean
+        model = self._regression(group)
+        if model is not None:
+            columns, w = model
+            return max(0.0, w[0] + sum(wi * x[i] for wi, i in zip(w[1:], columns)))
+        # nearest experiment, with parameters scaled by their range
+        scale = [
+            (max(p[0][i] for p in points) - min(p[0][i] for p in points)) or 1.0
+            for i in range(len(x))
+        ]
+        _, time = min(
+            points,
+            key=lambda p: sum(((a - b) / s) ** 2 for a, b, s in zip(p[0], x, scale)),
+        )
+        return time
@@ -1,31 +1,46 @@
 import copy
-import operator
 import os
 import shutil
+from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from functools import partial, reduce
+from functools import partial
 from pathlib import Path
-from typing import ClassVar, Dict, List, Set, cast
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    cast,
+)
 
-import tinydb
 from tinydb.database import TinyDB
 from tinydb.middlewares import CachingMiddleware
-from tinydb.queries import Query, QueryInstance, where
-from tinydb.storages import JSONStorage
-from tinydb.table import Document, Table
-
-from runexpy.result import Result, ResultJSON
-from runexpy.utils import DefaultParamsT, ParamsT
-
-
-@dataclass
-class Database:
-    # public fields
-    db: TinyDB
-    dir: str
-
-    # private fields
-    _fields: Set[str] = field(init=False)
+from tinydb.storages import JSONStorage, MemoryStorage, Storage
+from tinydb.table import Table
+
+from runexpy.files import RunFile, RunFiles, list_run_files
+from runexpy.index import IndexFile, ResultIndex
+from runexpy.lock import FileLock
+from runexpy.result import (
+    OPTIONAL_FIELDS,
+    ParamsSchema,
+    Result,
+    ResultBatch,
+    ResultJSON,
+)
+from runexpy.storage import JournalStorage, RecordT, file_stamp
+from runexpy.utils import DefaultParamsT, ParamsKeyT, ParamsT, params_key
+
+
+class BaseDatabase(ABC):
+    """Common interface of the databases storing a campaign."""
 
     # private class fields
 
@@ -36,32 +51,48 @@ class Database:
     # tables
     _T_CONFIG: ClassVar[str] = "config"
     _T_RESULT: ClassVar[str] = "result"
-
-    def __post_init__(self):
-        self._fields = set(self.get_default_params().keys())
-
-    @staticmethod
-    def _name(dir: str) -> str:
-        return f"{os.path.basename(dir)}.json"
+    # suffixes of the files of all the database implementations
+    _DB_SUFFIXES: ClassVar[Set[str]] = {
+        ".json",
+        ".json.journal",
+        ".json.lock",
+        ".json.idx",
+        ".sqlite",
+        ".sqlite-wal",
+        ".sqlite-shm",
+    }
+
+    _fields: Set[str]
+    _schema: ParamsSchema
 
     @classmethod
+    @abstractmethod
     def new(
         cls,
         script: List[str],
         default_params: DefaultParamsT,
         campaign_dir: str,
         overwrite: bool,
-    ):
+    ) -> "BaseDatabase":
+        pass
+
+    @classmethod
+    @abstractmethod
+    def load(cls, campaign_dir: str) -> "BaseDatabase":
+        pass
+
+    @classmethod
+    def _prepare_dir(cls, campaign_dir: str, overwrite: bool) -> None:
         # Make sure the directory does not exist already
         if Path(campaign_dir).exists() and not overwrite:
             raise FileExistsError("The specified directory already exists")
 
-        db_name = cls._name(campaign_dir)
-
         if Path(campaign_dir).exists() and overwrite:
             # Verify we are not deleting files belonging to the user
             folder_contents = set(os.listdir(campaign_dir))
-            allowed_files = {"data", db_name}
+            name = os.path.basename(campaign_dir)
+            allowed_files = {"data", "queue", "cache", "objects"}
+            allowed_files |= {name + ext for ext in cls._DB_SUFFIXES}
 
             if not folder_contents.issubset(allowed_files):
                 raise ValueError(
@@ -71,28 +102,220 @@ class Database:
             # This operation destroys data.
             shutil.rmtree(campaign_dir)
 
-        # Create the directory and database file in it
-        # The indent and separators ensure the database is human readable.
+        # Create the directory which will contain the database
         os.makedirs(campaign_dir)
-        db = tinydb.TinyDB(
-            os.path.join(campaign_dir, db_name),
-            storage=CachingMiddleware(partial(JSONStorage, indent=2)),
-        )
 
-        # Save the configuration in the database
-        config = {
+    @classmethod
+    def _make_config(
+        cls, script: List[str], default_params: DefaultParamsT, campaign_dir: str
+    ) -> Dict[str, Any]:
+        return {
             cls._F_SCRIPT: copy.deepcopy(script),
             cls._F_CMPDIR: campaign_dir,
             cls._F_PARAMS: copy.deepcopy(default_params),
         }
 
+    @abstractmethod
+    def get_config(self) -> Mapping[str, Any]:
+        pass
+
+    def get_script(self) -> List[str]:
+        return self.get_config()[self._F_SCRIPT]
+
+    def get_campaign_dir(self) -> str:
+        return self.get_config()[self._F_CMPDIR]
+
+    def get_data_dir(self) -> str:
+        return os.path.join(self.get_campaign_dir(), "data")
+
+    def get_default_params(self) -> DefaultParamsT:
+        return self.get_config()[self._F_PARAMS]
+
+    def get_schema(self) -> ParamsSchema:
+        """Names of the parameters, shared by the results loaded"""
+        return self._schema
+
+    def _correct_structure(self, result: ParamsT) -> bool:
+        return self._fields == set(result.keys())
+
+    def _check_structure(self, result: Result) -> None:
+        if not self._correct_structure(result.params):
+            raise ValueError(
+                f"Bad structure for result {result}, the following fields "
+                f"are expected: {self._fields}"
+            )
+
+    @abstractmethod
+    def count_results_for(self, problem: ParamsT) -> int:
+        pass
+
+    @abstractmethod
+    def count_all_results(
+        self, fingerprint: Optional[str] = None, successful_only: bool = False
+    ) -> Dict[ParamsKeyT, int]:
+        """Count the results of every parameter combination, by its key.
+
+        Only the results produced by a script with the given ``fingerprint``
+        are counted, if any, and only those with exit code 0 if
+        ``successful_only``.
+        """
+        pass
+
+    @abstractmethod
+    def iter_results_for(self, problem: ParamsT) -> Iterator[Result]:
+        pass
+
+    def get_results_for(self, problem: ParamsT) -> List[Result]:
+        return list(self.iter_results_for(problem))
+
+    def mean_time(self) -> Optional[float]:
+        """Mean running time of the successful results, None without any"""
+        times = [r.time for r in self.iter_results_for({}) if r.exitcode == 0]
+        return sum(times) / len(times) if times else None
+
+    def get_result_batch(self, problem: ParamsT) -> ResultBatch:
+        """Results for ``problem`` stored by column, which take less memory"""
+        return ResultBatch.from_results(self.iter_results_for(problem), self._schema)
+
+    def get_files_for(self, result: Result) -> Dict[str, RunFile]:
+        return list_run_files(os.path.join(self.get_data_dir(), result.id))
+
+    def get_run_files(self, result: Result) -> RunFiles:
+        return RunFiles(os.path.join(self.get_data_dir(), result.id))
+
+    def insert_result(self, result: Result) -> None:
+        self.insert_results([result])
+
+    @abstractmethod
+    def insert_results(self, results: Iterable[Result]) -> None:
+        pass
+
+    @abstractmethod
+    def flush(self) -> None:
+        pass
+
+
+def _count_docs(
+    docs: Iterable[Mapping[str, Any]],
+    fingerprint: Optional[str],
+    successful_only: bool,
+    counts: Dict[ParamsKeyT, int],
+) -> Dict[ParamsKeyT, int]:
+    # add the matching result documents to counts
+    for doc in docs:
+        if (fingerprint is None or doc.get("fingerprint") == fingerprint) and (
+            not successful_only or doc["exitcode"] == 0
+        ):
+            key = params_key(doc["params"])
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _sum_times(
+    docs: Iterable[Mapping[str, Any]], times: Tuple[float, int] = (0.0, 0)
+) -> Tuple[float, int]:
+    # total and number of the running times of the successful results
+    total, n = times
+    for doc in docs:
+        if doc["exitcode"] == 0:
+            total += doc["time"]
+            n += 1
+    return total, n
+
+
+@dataclass
+class Database(BaseDatabase):
+    """Campaign database stored in a JSON file handled by TinyDB.
+
+    Several processes can open the same campaign: writes are serialized by a
+    file lock and first load the results written by the other processes. With
+    ``JournalStorage`` these are read incrementally from the journal, with the
+    default storage the whole file is read again when it has changed.
+
+    Loading a campaign writes a binary ``IndexFile`` of its results next to the
+    database. While it is up to date the next loads only read its header and
+    answer counts from it, the JSON file is parsed by the first query needing
+    the results themselves. With ``JournalStorage`` the index stays valid until
+    the journal is compacted, the results appended meanwhile being read from it.
+    Writes keep the index up to date.
+    """
+
+    # public fields
+    db: TinyDB
+    dir: str
+
+    # private fields
+    _fields: Set[str] = field(init=False)
+    _schema: ParamsSchema = field(init=False, repr=False, compare=False)
+    _index: ResultIndex = field(init=False, repr=False, compare=False)
+    _ids: Set[str] = field(init=False, repr=False, compare=False)
+    _lock: FileLock = field(init=False, repr=False, compare=False)
+    _config: Dict[str, Any] = field(init=False, repr=False, compare=False)
+    # binary index answering counts until the database is read, with the
+    # results appended to the journal after it was written
+    _snapshot: Optional[IndexFile] = field(init=False, repr=False, compare=False)
+    _tail: List[ResultJSON] = field(init=False, repr=False, compare=False)
+    _tail_index: ResultIndex = field(init=False, repr=False, compare=False)
+    # total and number of the running times of the successful results
+    _times: Tuple[float, int] = field(init=False, repr=False, compare=False)
+    # version of the database file last read or written
+    _stamp: Optional[Tuple[int, int, int]] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self._lock = FileLock(f"{self._path()}.lock")
+        with self._lock.shared():
+            self._snapshot = self._open_index()
+            if self._snapshot is not None:
+                self._config = self._snapshot.config
+            else:
+                self._tail = []
+                self._tail_index = ResultIndex()
+                self._build_index()
+                self._stamp = file_stamp(self._path())
+                self._config = self._config_table().all()[0]
+            self._fields = set(self.get_default_params().keys())
+            self._schema = ParamsSchema(self.get_default_params())
+            if self._snapshot is None and len(self._index):
+                self._write_index()
+
+    @staticmethod
+    def _name(dir: str) -> str:
+        return f"{os.path.basename(dir)}.json"
+
+    @staticmethod
+    def _open(filepath: str, storage: Type[Storage]) -> TinyDB:
+        if issubclass(storage, MemoryStorage):
+            return TinyDB(storage=CachingMiddleware(storage))
+        if issubclass(storage, (JSONStorage, JournalStorage)):
+            # The indent and separators ensure the database is human readable.
+            storage = cast(Type[Storage], partial(storage, indent=2))
+        return TinyDB(filepath, storage=CachingMiddleware(storage))
+
+    @classmethod
+    def new(
+        cls,
+        script: List[str],
+        default_params: DefaultParamsT,
+        campaign_dir: str,
+        overwrite: bool,
+        storage: Optional[Type[Storage]] = None,
+    ):
+        # Create the directory and database file in it
+        cls._prepare_dir(campaign_dir, overwrite)
+        db_name = cls._name(campaign_dir)
+        db = cls._open(os.path.join(campaign_dir, db_name), storage or JSONStorage)
+
+        # Save the configuration in the database
+        config = cls._make_config(script, default_params, campaign_dir)
         db.table("config").insert(config)
         db = cls(db, campaign_dir)
         db.flush()
         return db
 
     @classmethod
-    def load(cls, campaign_dir: str):
+    def load(cls, campaign_dir: str, storage: Optional[Type[Storage]] = None):
         # Verify file exists
         if not Path(campaign_dir).exists():
             raise ValueError("Directory does not exist")
@@ -101,8 +324,13 @@ class Database:
         db_name = cls._name(campaign_dir)
         filepath = os.path.join(campaign_dir, db_name)
 
+        # Detect the storage used to create the database if not specified
+        if storage is None:
+            journal = JournalStorage.journal_path(filepath)
+            storage = JournalStorage if Path(journal).exists() else JSONStorage
+
         # Read TinyDB instance from file
-        db = TinyDB(filepath, storage=CachingMiddleware(partial(JSONStorage, indent=2)))
+        db = cls._open(filepath, storage)
 
         # # Make sure the configuration is a valid dictionary
         # if set(tinydb.table("config").get.all()[0].keys()) != {"script", "params"}:
@@ -112,67 +340,242 @@ class Database:
 
         return cls(db, campaign_dir)
 
-    def _result_table(self) -> Table:
-        return self.db.table(self._T_RESULT)
+    def _path(self) -> str:
+        return os.path.join(self.dir, self._name(self.dir))
 
-    def _config_table(self) -> Table:
-        return self.db.table(self._T_CONFIG)
+    def _index_path(self) -> str:
+        return f"{self._path()}.idx"
 
-    def get_config(self) -> Document:
-        return self._config_table().all()[0]
+    def _storage(self) -> Storage:
+        assert isinstance(self.db.storage, CachingMiddleware)
+        return self.db.storage.storage
 
-    def get_script(self) -> List[str]:
-        return self.get_config()[self._F_SCRIPT]
+    def _reset_tables(self) -> None:
+        # TinyDB tables cache the next document id and the results of queries
+        for table in self.db._tables.values():
+            table._next_id = None
+            table.clear_cache()
 
-    def get_campaign_dir(self) -> str:
-        return self.get_config()[self._F_CMPDIR]
+    def _add_records(self, records: List[RecordT]) -> None:
+        if not records:
+            return
+        assert isinstance(self.db.storage, CachingMiddleware)
+        data = self.db.storage.read()
+        for record in records:
+            doc = record["doc"]
+            data.setdefault(record["table"], {})[record["id"]] = doc
+            # the next id stays known, instead of being found again by
+            # scanning the whole table
+            table = self.db._tables.get(record["table"])
+            if table is not None and table._next_id is not None:
+                table._next_id = max(table._next_id, int(record["id"]) + 1)
+            if record["table"] == self._T_RESULT:
+                self._index.add(int(record["id"]), doc["params"])
+                self._ids.add(doc["id"])
+                self._times = _sum_times([doc], self._times)
+        for table in self.db._tables.values():
+            table.clear_cache()
+
+    def _append_docs(self, docs: List[ResultJSON]) -> List[int]:
+        # added to the cached data in place, Table.insert_multiple copies the
+        # whole table on every write
+        assert isinstance(self.db.storage, CachingMiddleware)
+        data = self.db.storage.read()
+        table = self._result_table()
+        doc_ids = [table._get_next_id() for _ in docs]
+        stored = data.setdefault(self._T_RESULT, {})
+        for doc_id, doc in zip(doc_ids, docs):
+            stored[str(doc_id)] = doc
+        table.clear_cache()
+        self.db.storage.write(data)
+        return doc_ids
+
+    def _add_tail(self, records: List[RecordT]) -> None:
+        for record in records:
+            if record["table"] == self._T_RESULT:
+                self._tail_index.add(len(self._tail), record["doc"]["params"])
+                self._tail.append(record["doc"])
+                self._times = _sum_times([record["doc"]], self._times)
+
+    def _open_index(self) -> Optional[IndexFile]:
+        # the index if it is up to date, without reading the database
+        try:
+            index = IndexFile(self._index_path())
+        except (OSError, ValueError):
+            return None
+        snapshot, offset = index.source
+        self._tail = []
+        self._tail_index = ResultIndex()
+        self._times = index.times
+        storage = self._storage()
+        if isinstance(storage, JournalStorage):
+            storage.seek(index.source)
+            records = storage.read_new()
+            if records is None:
+                return None
+            self._add_tail(records)
+        elif offset or snapshot != file_stamp(self._path()):
+            return None
+        self._index = ResultIndex()
+        self._ids = set()
+        self._stamp = snapshot
+        return index
+
+    def _write_index(self) -> None:
+        assert isinstance(self.db.storage, CachingMiddleware)
+        docs = self.db.storage.read().get(self._T_RESULT, {}).values()
+        storage = self._storage()
+        if isinstance(storage, JournalStorage):
+            source = storage.position()
+        else:
+            source = (self._stamp, 0)
+        try:
+            IndexFile.write(
+                self._index_path(), self._config, self._schema.names, docs, source
+            )
+        except OSError:
+            # e.g. a read-only campaign, which is only slower to load
+            pass
 
-    def get_data_dir(self) -> str:
-        return os.path.join(self.get_campaign_dir(), "data")
+    def _load(self) -> None:
+        # read the whole database, dropping the binary index
+        assert isinstance(self.db.storage, CachingMiddleware)
+        self.db.storage.cache = None
+        self._reset_tables()
+        self._snapshot = None
+        self._tail = []
+        self._tail_index = ResultIndex()
+        self._build_index()
+        self._stamp = file_stamp(self._path())
+
+    def _ensure_loaded(self) -> None:
+        if self._snapshot is not None:
+            with self._lock.shared():
+                self._load()
+
+    def _refresh(self) -> None:
+        storage = self._storage()
+        if isinstance(storage, JournalStorage):
+            records = storage.read_new()
+            if records is not None:
+                if self._snapshot is not None:
+                    self._add_tail(records)
+                else:
+                    self._add_records(records)
+                return
+        elif file_stamp(self._path()) == self._stamp:
+            return
+        # read everything again
+        self._load()
+
+    def refresh(self) -> None:
+        """Load the results written by other processes since the last access"""
+        with self._lock.shared():
+            self._refresh()
+
+    def _build_index(self) -> None:
+        docs = self._result_table().all()
+        self._index = ResultIndex.build((doc.doc_id, doc["params"]) for doc in docs)
+        self._ids = {doc["id"] for doc in docs}
+        self._times = _sum_times(docs)
 
-    def get_default_params(self) -> DefaultParamsT:
-        return self.get_config()[self._F_PARAMS]
+    def _result_table(self) -> Table:
+        return self.db.table(self._T_RESULT)
 
-    def _correct_structure(self, result: ParamsT) -> bool:
-        return self._fields == set(result.keys())
+    def _config_table(self) -> Table:
+        return self.db.table(self._T_CONFIG)
 
-    @staticmethod
-    def _problem_query(problem: ParamsT) -> QueryInstance:
-        query = Query()
-        if not problem:
-            return query.noop()
-        return reduce(
-            operator.and_, map(lambda p: query.params[p[0]] == p[1], problem.items())
-        )
+    def get_config(self) -> Dict[str, Any]:
+        return self._config
 
     def count_results_for(self, problem: ParamsT) -> int:
-        query = self._problem_query(problem)
-        return self._result_table().count(query)
-
-    def _search_results_for(self, problem: ParamsT) -> List[ResultJSON]:
-        query = self._problem_query(problem)
-        return list(
-            map(lambda x: cast(ResultJSON, x), self._result_table().search(query))
-        )
-
-    def get_results_for(self, problem: ParamsT) -> List[Result]:
-        return list(map(Result.from_json, self._search_results_for(problem)))
-
-    def get_files_for(self, result: Result) -> Dict[str, str]:
-        experiment_dir = os.path.join(self.get_data_dir(), result.id)
-        return {f: os.path.join(experiment_dir, f) for f in os.listdir(experiment_dir)}
-
-    def insert_result(self, result: Result) -> None:
-        if not self._correct_structure(result.params):
-            raise ValueError(
-                f"Bad structure for result {result}, the following fields "
-                f"are expected: {self._fields}"
+        self.refresh()
+        if self._snapshot is not None:
+            return self._snapshot.count(problem) + self._tail_index.count(problem)
+        return self._index.count(problem)
+
+    def count_all_results(
+        self, fingerprint: Optional[str] = None, successful_only: bool = False
+    ) -> Dict[ParamsKeyT, int]:
+        self.refresh()
+        if self._snapshot is not None:
+            counts = self._snapshot.counts(fingerprint, successful_only)
+            return _count_docs(self._tail, fingerprint, successful_only, counts)
+        if fingerprint is None and not successful_only:
+            return self._index.counts()
+        return _count_docs(self._result_table(), fingerprint, successful_only, {})
+
+    def _search_results_for(self, problem: ParamsT) -> Iterator[ResultJSON]:
+        # the stored documents, without the copy made by Table.get
+        assert isinstance(self.db.storage, CachingMiddleware)
+        docs = self.db.storage.read().get(self._T_RESULT, {})
+        for doc_id in self._index.search(problem):
+            yield cast(ResultJSON, docs[str(doc_id)])
+
+    def iter_results_for(self, problem: ParamsT) -> Iterator[Result]:
+        self.refresh()
+        self._ensure_loaded()
+        return (Result.from_json(doc) for doc in self._search_results_for(problem))
+
+    def mean_time(self) -> Optional[float]:
+        # kept up to date with the results, without reading them
+        self.refresh()
+        total, n = self._times
+        return total / n if n else None
+
+    def get_result_batch(self, problem: ParamsT) -> ResultBatch:
+        self.refresh()
+        self._ensure_loaded()
+        batch = ResultBatch(self._schema)
+        for doc in self._search_results_for(problem):
+            batch.append(
+                doc["id"],
+                doc["time"],
+                doc["exitcode"],
+                self._schema.values(doc["params"]),
+                [doc.get(name) for name in OPTIONAL_FIELDS],
             )
-        if self._result_table().contains(where("id") == result.id):
-            raise ValueError("An entry with the same id is present")
-        self._result_table().insert(result.to_json())
-        self.flush()
+        return batch
+
+    def insert_results(self, results: Iterable[Result]) -> None:
+        results = list(results)
+        with self._lock.exclusive():
+            self._refresh()
+            self._ensure_loaded()
+            docs = []
+            ids = set()
+            for result in results:
+                self._check_structure(result)
+                if result.id in self._ids or result.id in ids:
+                    raise ValueError("An entry with the same id is present")
+                ids.add(result.id)
+                docs.append(result.to_json())
+            if not docs:
+                return
+            doc_ids = self._append_docs(docs)
+            for doc_id, doc in zip(doc_ids, docs):
+                self._index.add(doc_id, doc["params"])
+            self._ids |= ids
+            self._times = _sum_times(docs, self._times)
+            self.flush()
+
+    def _index_stale(self) -> bool:
+        # the results appended to the journal are read on top of the index,
+        # which only needs to be written again once the journal is compacted
+        storage = self._storage()
+        if not isinstance(storage, JournalStorage):
+            return True
+        try:
+            snapshot, _ = IndexFile(self._index_path()).source
+        except (OSError, ValueError):
+            return True
+        return snapshot != storage.position()[0]
 
     def flush(self):
         assert isinstance(self.db.storage, CachingMiddleware)
-        self.db.storage.flush()
+        with self._lock.exclusive():
+            self.db.storage.flush()
+            self._stamp = file_stamp(self._path())
+            # results are only inserted once the database is read
+            if self._snapshot is None and len(self._index) and self._index_stale():
+                self._write_index()
@@ -0,0 +1,409 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from multiprocessing import Process
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+
+from runexpy.result import Result, ResultJSON
+from runexpy.runner import (
+    RetryPolicy,
+    RunMonitor,
+    Runner,
+    ScratchPolicy,
+    current_monitor,
+    monitoring,
+)
+from runexpy.utils import ParamsT
+
+TaskT = Dict[str, Any]
+
+# exit code recorded for experiments whose workers kept dying, as if they had
+# been killed by SIGKILL (e.g. by the out of memory killer)
+LOST_EXITCODE = 137
+
+
+class WorkQueue:
+    """Work queue stored in a directory, possibly shared among hosts.
+
+    Work items are files moved between the ``pending``, ``claimed`` and
+    ``done`` subdirectories with atomic renames, so no lock is needed. The
+    modification time of a claimed item is its lease: workers refresh it while
+    running the item, and expired items are moved back to ``pending``. The
+    name of the worker running a claimed item is written next to it.
+
+    Several coordinators can share the queue: the names of the items hold the
+    ``id`` of the queue which published them, and only those are collected
+    and requeued by it.
+    """
+
+    def __init__(self, dir: str):
+        self.dir = dir
+        self.id = uuid.uuid4().hex
+        self._pending = os.path.join(dir, "pending")
+        self._claimed = os.path.join(dir, "claimed")
+        self._done = os.path.join(dir, "done")
+        for d in (self._pending, self._claimed, self._done):
+            os.makedirs(d, exist_ok=True)
+        self._seq = 0
+
+    @staticmethod
+    def _write_atomic(path: str, data: Any) -> None:
+        tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def _items(dir: str) -> List[str]:
+        return sorted(f for f in os.listdir(dir) if f.endswith(".json"))
+
+    def _own_items(self, dir: str) -> List[str]:
+        return [name for name in self._items(dir) if name.split("-")[1] == self.id]
+
+    def publish(self, task: TaskT) -> str:
+        # names keep the publication order, the id of the queue avoids collisions
+        self._seq += 1
+        name = f"{time.time_ns():020d}-{self.id}-{self._seq:09d}.json"
+        self._write_atomic(os.path.join(self._pending, name), task)
+        return name
+
+    def claim(self, worker: str = "") -> Optional[Tuple[str, TaskT]]:
+        for name in self._items(self._pending):
+            pending = os.path.join(self._pending, name)
+            claimed = os.path.join(self._claimed, name)
+            try:
+                # start the lease before the item becomes visible as claimed
+                os.utime(pending)
+                os.rename(pending, claimed)
+                with open(claimed) as f:
+                    task = json.load(f)
+                with open(f"{claimed}.worker", "w") as f:
+                    f.write(worker)
+                return name, task
+            except FileNotFoundError:
+                # claimed by another worker in the meantime
+                continue
+        return None
+
+    def heartbeat(self, name: str) -> None:
+        try:
+            os.utime(os.path.join(self._claimed, name))
+        except FileNotFoundError:
+            pass
+
+    def worker(self, name: str) -> Optional[str]:
+        """Name of the worker which claimed the item, if known"""
+        try:
+            with open(os.path.join(self._claimed, f"{name}.worker")) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def workers(self) -> Dict[str, str]:
+        """Names of the workers of the claimed items, by name of the items"""
+        workers = {}
+        for name in self._own_items(self._claimed):
+            worker = self.worker(name)
+            if worker is not None:
+                workers[name] = worker
+        return workers
+
+    def complete(self, name: str, result: ResultJSON) -> None:
+        self._write_atomic(os.path.join(self._done, name), result)
+        self._remove(os.path.join(self._claimed, name))
+
+    def collect(self) -> List[Tuple[str, ResultJSON]]:
+        """Take the results of the items published by this queue"""
+        results = []
+        for name in self._own_items(self._done):
+            path = os.path.join(self._done, name)
+            with open(path) as f:
+                results.append((name, json.load(f)))
+            self._remove(path)
+        return results
+
+    def _now(self) -> float:
+        # use the clock of the file system, hosts clocks may be skewed
+        clock = os.path.join(self.dir, "clock")
+        with open(clock, "w"):
+            pass
+        return os.stat(clock).st_mtime
+
+    def requeue_expired(self, lease_timeout: float) -> List[str]:
+        """Publish again the own items whose lease expired, return their names"""
+        now = self._now()
+        requeued = []
+        for name in self._own_items(self._claimed):
+            claimed = os.path.join(self._claimed, name)
+            try:
+                if now - os.stat(claimed).st_mtime > lease_timeout:
+                    os.rename(claimed, os.path.join(self._pending, name))
+                    self._remove(f"{claimed}.worker")
+                    requeued.append(name)
+            except FileNotFoundError:
+                pass
+        return requeued
+
+    def cancel(self, names: Iterable[str]) -> None:
+        for name in names:
+            self._remove(os.path.join(self._pending, name))
+            self._remove(os.path.join(self._claimed, name))
+            self._remove(os.path.join(self._claimed, f"{name}.worker"))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def _heartbeat(queue: WorkQueue, name: str, interval: float) -> Generator:
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            queue.heartbeat(name)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _scratch(scratch: Optional[Dict[str, Any]]) -> Optional[ScratchPolicy]:
+    if scratch is None:
+        return None
+    keep = scratch["keep"]
+    return ScratchPolicy(scratch["dir"], None if keep is None else tuple(keep))
+
+
+def _local_worker(queue_dir: str, poll_interval: float) -> None:
+    # the runs are reported by the runner, not by the forked worker
+    with monitoring(RunMonitor()):
+        run_worker(queue_dir, poll_interval)
+
+
+def run_worker(
+    queue_dir: str, poll_interval: float = 1.0, idle_timeout: Optional[float] = None
+) -> int:
+    """Execute the experiments published in a queue directory.
+
+    The worker stops after ``idle_timeout`` seconds without work, if given.
+    Return the number of experiments executed.
+    """
+    queue = WorkQueue(queue_dir)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    executed = 0
+    idle_since = time.monotonic()
+    while True:
+        item = queue.claim(worker)
+        if item is None:
+            if (
+                idle_timeout is not None
+                and time.monotonic() - idle_since > idle_timeout
+            ):
+                return executed
+            time.sleep(poll_interval)
+            continue
+        name, task = item
+        with _heartbeat(queue, name, task["heartbeat"]):
+            retry = task.get("retry") or {}
+            if retry.get("exitcodes") is not None:
+                retry["exitcodes"] = tuple(retry["exitcodes"])
+            result = Runner._run_experiment(
+                task["script"],
+                task["data_dir"],
+                task["params"],
+                task.get("timeout"),
+                RetryPolicy(**retry),
+                _scratch(task.get("scratch")),
+            )
+        queue.complete(name, result.to_json())
+        executed += 1
+        idle_since = time.monotonic()
+
+
+@dataclass
+class DistributedRunner(Runner):
+    """Run experiments on workers claiming them from a shared queue directory.
+
+    The runner publishes the experiments in ``queue_dir`` (by default the
+    ``queue`` directory of the campaign) and collects the results reported by
+    workers started on any host sharing the file system with::
+
+        python -m runexpy.distributed <queue_dir>
+
+    The campaign directory must be reachable with the same path on every host.
+    Experiments whose worker did not renew its lease for ``lease_timeout``
+    seconds are published again, up to ``max_expirations`` times: then the
+    experiment is reported as failed with exit code ``LOST_EXITCODE``, so that
+    an experiment crashing its workers does not keep the run going forever.
+    The first result reported for an experiment is kept, even when it comes
+    from a worker whose lease expired; the later ones, and those of given up
+    experiments, are discarded together with their run directory. Runners
+    sharing the queue directory, e.g. running several campaigns or shards of
+    the same one, only collect the results of their own experiments.
+    ``local_workers`` workers are also started on the current host for the
+    duration of the run. Experiments are reported running once the runner sees
+    them claimed, which takes up to ``poll_interval`` seconds.
+    """
+
+    queue_dir: Optional[str] = None
+    local_workers: int = 0
+    lease_timeout: float = 60.0
+    max_expirations: int = 3
+    poll_interval: float = 1.0
+    max_published: int = 1000
+    # seconds after which experiments are killed by the workers
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    # scratch directories are created on the hosts of the workers
+    scratch: Optional[ScratchPolicy] = None
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        # workers on other hosts are not known
+        return self.local_workers or None
+
+    def _lost(self, data_dir: str, params: ParamsT) -> Result:
+        run_id, run_dir = self._make_run_dir(data_dir)
+        with open(os.path.join(run_dir, "stdout"), "w"):
+            pass
+        with open(os.path.join(run_dir, "stderr"), "w") as stderr:
+            print(
+                f"The lease of the experiment expired {self.max_expirations} "
+                "times, its workers stopped running it",
+                file=stderr,
+            )
+        return Result(run_id, 0.0, LOST_EXITCODE, params)
+
+    def _start_workers(self, queue_dir: str) -> List[Process]:
+        workers = []
+        for _ in range(self.local_workers):
+            worker = Process(
+                target=_local_worker,
+                args=(queue_dir, min(self.poll_interval, 0.1)),
+                daemon=True,
+            )
+            worker.start()
+            workers.append(worker)
+        return workers
+
+    def run_experiments(
+        self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
+    ) -> Iterable[Result]:
+        """Run several simulations through the queue"""
+        queue_dir = self.queue_dir or os.path.join(os.path.dirname(data_dir), "queue")
+        queue = WorkQueue(queue_dir)
+        param_combinations = iter(param_combinations)
+        # parameters of the published experiments, and leases they lost
+        outstanding: Dict[str, ParamsT] = {}
+        expirations: Dict[str, int] = {}
+        # workers of the experiments seen running, and since when
+        monitor = current_monitor()
+        started: Dict[str, Tuple[str, float]] = {}
+        exhausted = False
+        workers = self._start_workers(queue_dir)
+        last_check = time.monotonic()
+        try:
+            while True:
+                while not exhausted and len(outstanding) < self.max_published:
+                    params = next(param_combinations, None)
+                    if params is None:
+                        exhausted = True
+                        break
+                    task = {
+                        "script": script,
+                        "data_dir": data_dir,
+                        "params": params,
+                        "heartbeat": self.lease_timeout / 4,
+                        "timeout": self.timeout,
+                        "retry": asdict(self.retry),
+                        "scratch": self.scratch and asdict(self.scratch),
+                    }
+                    outstanding[queue.publish(task)] = params
+                if exhausted and not outstanding:
+                    break
+
+                if monitor is not None:
+                    for name, worker in queue.workers().items():
+                        if name in outstanding and name not in started:
+                            started[name] = (worker, time.monotonic())
+                            monitor.run_started(worker)
+
+                collected = False
+                for name, result in queue.collect():
+                    # late results of requeued experiments are discarded
+                    if name in outstanding:
+                        del outstanding[name]
+                        if monitor is not None:
+                            if name in started:
+                                worker, _ = started.pop(name)
+                            else:
+                                # ended before it was seen running
+                                worker = queue.worker(name) or "unknown"
+                                monitor.run_started(worker)
+                            monitor.run_ended(worker, result["time"])
+                        queue.cancel([name])
+                        collected = True
+                        yield Result.from_json(result)
+                    else:
+                        queue.cancel([name])
+                        self._discard(data_dir, Result.from_json(result))
+
+                if time.monotonic() - last_check > self.lease_timeout / 4:
+                    for name in queue.requeue_expired(self.lease_timeout):
+                        if monitor is not None and name in started:
+                            worker, start = started.pop(name)
+                            monitor.run_ended(worker, time.monotonic() - start)
+                        expirations[name] = expirations.get(name, 0) + 1
+                        if name in outstanding and (
+                            expirations[name] >= self.max_expirations
+                        ):
+                            queue.cancel([name])
+                            collected = True
+                            yield self._lost(data_dir, outstanding.pop(name))
+                    last_check = time.monotonic()
+                if not collected:
+                    time.sleep(self.poll_interval)
+        finally:
+            queue.cancel(outstanding)
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+
+
+def main() -> None:
+    ap = ArgumentParser("Run the experiments published in a runexpy queue")
+    ap.add_argument("queue_dir", help="Queue directory of the DistributedRunner")
+    ap.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between checks of the queue when it is empty",
+    )
+    ap.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Stop after this many seconds without work",
+    )
+    args = ap.parse_args()
+    executed = run_worker(args.queue_dir, args.poll_interval, args.idle_timeout)
+    print(f"Executed {executed} experiments", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
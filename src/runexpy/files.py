@@ -0,0 +1,107 @@
+import gzip
+import io
+import os
+from typing import IO, Dict, Iterator, Mapping, Optional
+
+# suffix added to the name of the files compressed by an OutputPolicy
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "zstd compression requires the zstandard package, "
+            "install the compress extra"
+        ) from None
+    return zstandard
+
+
+class RunFile(str):
+    """Path of a file produced by a run.
+
+    ``open`` reads the file transparently if it was compressed with gzip or
+    zstd after the run, which is told by its ``.gz`` or ``.zst`` suffix.
+    """
+
+    @classmethod
+    def find(cls, run_dir: str, name: str) -> "RunFile":
+        """File ``name`` of a run, or its compressed version if there is one"""
+        path = os.path.join(run_dir, name)
+        if not os.path.exists(path):
+            for suffix in SUFFIXES.values():
+                if os.path.exists(path + suffix):
+                    return cls(path + suffix)
+        return cls(path)
+
+    @property
+    def compression(self) -> Optional[str]:
+        for compression, suffix in SUFFIXES.items():
+            if self.endswith(suffix):
+                return compression
+        return None
+
+    def open(self, mode: str = "r", **kwargs) -> IO:
+        if "r" not in mode:
+            raise ValueError("Files produced by a run can only be read")
+        compression = self.compression
+        if compression == "gzip":
+            return gzip.open(self, "rt" if "b" not in mode else "rb", **kwargs)
+        if compression == "zstd":
+            stream = _zstd().ZstdDecompressor().stream_reader(open(self, "rb"))
+            if "b" in mode:
+                return stream
+            return io.TextIOWrapper(stream, **kwargs)
+        return open(self, mode, **kwargs)
+
+
+def list_run_files(run_dir: str) -> Dict[str, RunFile]:
+    """Files of a run keyed by their name before compression"""
+    files: Dict[str, RunFile] = {}
+    for f in sorted(os.listdir(run_dir)):
+        file = RunFile(os.path.join(run_dir, f))
+        compression = file.compression
+        name = f[: -len(SUFFIXES[compression])] if compression else f
+        # an uncompressed file wins, as in RunFile.find
+        if name not in files or not compression:
+            files[name] = file
+    return files
+
+
+class RunFiles(Mapping):
+    """Files of a run by name, the run directory is only listed when needed.
+
+    Files are keyed by their name before compression, looking up a single file
+    only checks it exists, iterating over the files lists the directory once.
+    """
+
+    def __init__(self, run_dir: str):
+        self.dir = run_dir
+        self._files: Dict[str, RunFile] = {}
+        self._listed = False
+
+    def _list(self) -> Dict[str, RunFile]:
+        if not self._listed:
+            self._files = list_run_files(self.dir)
+            self._listed = True
+        return self._files
+
+    def __getitem__(self, name: str) -> RunFile:
+        if name in self._files:
+            return self._files[name]
+        if os.sep in name:
+            raise KeyError(name)
+        file = RunFile.find(self.dir, name)
+        if not os.path.exists(file):
+            raise KeyError(name)
+        return file
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._list())
+
+    def __len__(self) -> int:
+        return len(self._list())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.dir!r})"
@@ -0,0 +1,284 @@
+import json
+import mmap
+import os
+import struct
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from runexpy.utils import ParamsKeyT, ParamsT, freeze_value, params_key
+
+
+class ResultIndex:
+    """In-memory index over the parameters of the stored results.
+
+    Complete parameter combinations are looked up through their canonical key,
+    partial ones through per-parameter inverted indexes.
+    """
+
+    def __init__(self) -> None:
+        self._params: Dict[int, ParamsT] = {}
+        self._by_key: Dict[ParamsKeyT, List[int]] = {}
+        self._by_param: Dict[str, Dict[object, List[int]]] = {}
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[int, ParamsT]]) -> "ResultIndex":
+        index = cls()
+        for doc_id, params in entries:
+            index.add(doc_id, params)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._params)
+
+    def add(self, doc_id: int, params: ParamsT) -> None:
+        self._params[doc_id] = params
+        self._by_key.setdefault(params_key(params), []).append(doc_id)
+        for name, value in params.items():
+            postings = self._by_param.setdefault(name, {})
+            postings.setdefault(freeze_value(value), []).append(doc_id)
+
+    def _is_complete(self, problem: ParamsT) -> bool:
+        return problem.keys() == self._by_param.keys()
+
+    def search(self, problem: ParamsT) -> List[int]:
+        if not problem:
+            return list(self._params)
+        if self._is_complete(problem):
+            return list(self._by_key.get(params_key(problem), ()))
+
+        postings = []
+        for name, value in problem.items():
+            docs = self._by_param.get(name, {}).get(freeze_value(value))
+            if not docs:
+                return []
+            postings.append((len(docs), name, docs))
+        # scan the most selective parameter and check the others on the fly
+        _, first, docs = min(postings)
+        others = [(n, freeze_value(v)) for n, v in problem.items() if n != first]
+        return [
+            doc_id
+            for doc_id in docs
+            if all(freeze_value(self._params[doc_id][n]) == v for n, v in others)
+        ]
+
+    def count(self, problem: ParamsT) -> int:
+        if not problem:
+            return len(self._params)
+        if self._is_complete(problem):
+            return len(self._by_key.get(params_key(problem), ()))
+        return len(self.search(problem))
+
+    def counts(self) -> Dict[ParamsKeyT, int]:
+        return {key: len(docs) for key, docs in self._by_key.items()}
+
+
+def _row_struct(n_params: int) -> struct.Struct:
+    # exit code, fingerprint code (0 if None) and the code of every parameter
+    return struct.Struct("<iI" + "I" * n_params)
+
+
+class IndexFile:
+    """Binary index of the results of a database, read through ``mmap``.
+
+    The file starts with a JSON header holding the campaign configuration, the
+    version of the database it was built from and the total running time of
+    the successful results. One fixed-size row per result follows, with its
+    exit code, fingerprint and parameters encoded as positions in the lists of
+    their distinct values, stored at the end of the file. Rows are sorted by
+    parameters, so counting the results of a complete combination only reads
+    the few pages holding its rows.
+    """
+
+    MAGIC: ClassVar[bytes] = b"RUNEXIDX"
+    VERSION: ClassVar[int] = 2
+    # magic, version and header size
+    _PREFIX: ClassVar[struct.Struct] = struct.Struct("<8sII")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            prefix = f.read(self._PREFIX.size)
+            if len(prefix) < self._PREFIX.size:
+                raise ValueError(f"{path} is not a result index")
+            magic, version, header_size = self._PREFIX.unpack(prefix)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f"{path} is not a result index")
+            header = json.loads(f.read(header_size))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.config: Dict[str, Any] = header["config"]
+        # total and number of the running times of the successful results
+        total, n = header["times"]
+        self.times: Tuple[float, int] = (total, n)
+        snapshot, offset = header["source"]
+        # version of the database snapshot and journal offset indexed
+        self.source: Tuple[Optional[Tuple[int, ...]], int] = (
+            None if snapshot is None else tuple(snapshot),
+            offset,
+        )
+        self._names: List[str] = header["names"]
+        self._positions = {name: i for i, name in enumerate(self._names)}
+        self._rows: int = header["rows"]
+        self._row = _row_struct(len(self._names))
+        self._start = self._PREFIX.size + header_size
+        self._end = self._start + self._rows * self._row.size
+        if len(self._mmap) < self._end:
+            raise ValueError(f"{path} is truncated")
+        # distinct values, only read by the queries needing them
+        self._values: Optional[List[List[Any]]] = None
+        self._codes: Optional[List[Dict[Any, int]]] = None
+        self._fingerprints: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        config: Mapping[str, Any],
+        names: Sequence[str],
+        docs: Iterable[Mapping[str, Any]],
+        source: Tuple[Optional[Tuple[int, ...]], int],
+    ) -> None:
+        """Index the result documents ``docs`` of the database version ``source``"""
+        values: List[List[Any]] = [[] for _ in names]
+        codes: List[Dict[Any, int]] = [{} for _ in names]
+        fingerprints: Dict[str, int] = {}
+        rows = []
+        total_time, successful = 0.0, 0
+        for doc in docs:
+            params = doc["params"]
+            row = []
+            for i, name in enumerate(names):
+                value = params[name]
+                frozen = freeze_value(value)
+                code = codes[i].get(frozen)
+                if code is None:
+                    code = codes[i][frozen] = len(values[i])
+                    values[i].append(value)
+                row.append(code)
+            fingerprint = doc.get("fingerprint")
+            fp_code = 0
+            if fingerprint is not None:
+                fp_code = fingerprints.setdefault(fingerprint, len(fingerprints) + 1)
+            rows.append((tuple(row), doc["exitcode"], fp_code))
+            if doc["exitcode"] == 0:
+                total_time += doc["time"]
+                successful += 1
+        rows.sort()
+
+        snapshot, offset = source
+        header = {
+            "config": config,
+            "names": list(names),
+            "rows": len(rows),
+            "source": [snapshot, offset],
+            "times": [total_time, successful],
+        }
+        header_bytes = json.dumps(header).encode()
+        row_struct = _row_struct(len(names))
+        # written aside and renamed, processes having it mapped keep the old one
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(cls._PREFIX.pack(cls.MAGIC, cls.VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.writelines(row_struct.pack(e, fp, *c) for c, e, fp in rows)
+            f.write(
+                json.dumps({"values": values, "fingerprints": fingerprints}).encode()
+            )
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _read_values(self) -> None:
+        data = json.loads(self._mmap[self._end :])
+        self._values = data["values"]
+        self._codes = [
+            {freeze_value(value): code for code, value in enumerate(values)}
+            for values in data["values"]
+        ]
+        self._fingerprints = data["fingerprints"]
+
+    def _iter_rows(self, low: int, high: int) -> Iterator[Tuple[int, ...]]:
+        start = self._start + low * self._row.size
+        end = self._start + high * self._row.size
+        return self._row.iter_unpack(memoryview(self._mmap)[start:end])
+
+    def _params_codes(self, row: int, n: int) -> Tuple[int, ...]:
+        offset = self._start + row * self._row.size
+        return self._row.unpack_from(self._mmap, offset)[2 : 2 + n]
+
+    def _bound(self, prefix: Tuple[int, ...], upper: bool) -> int:
+        # first row whose parameters start after (or with, unless upper) prefix
+        low, high = 0, self._rows
+        while low < high:
+            mid = (low + high) // 2
+            codes = self._params_codes(mid, len(prefix))
+            if codes < prefix or (upper and codes == prefix):
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def count(self, problem: ParamsT) -> int:
+        if not problem:
+            return self._rows
+        if self._codes is None:
+            self._read_values()
+        assert self._codes is not None
+        wanted: Dict[int, int] = {}
+        for name, value in problem.items():
+            position = self._positions.get(name)
+            if position is None:
+                return 0
+            code = self._codes[position].get(freeze_value(value))
+            if code is None:
+                return 0
+            wanted[position] = code
+
+        # the leading parameters fixed by the problem delimit a range of rows
+        prefix: List[int] = []
+        while len(prefix) in wanted:
+            prefix.append(wanted[len(prefix)])
+        low = self._bound(tuple(prefix), upper=False)
+        high = self._bound(tuple(prefix), upper=True)
+        others = [(2 + i, code) for i, code in wanted.items() if i >= len(prefix)]
+        if not others:
+            return high - low
+        return sum(
+            all(row[i] == code for i, code in others)
+            for row in self._iter_rows(low, high)
+        )
+
+    def counts(
+        self, fingerprint: Optional[str] = None, successful_only: bool = False
+    ) -> Dict[ParamsKeyT, int]:
+        if self._values is None:
+            self._read_values()
+        assert self._values is not None and self._fingerprints is not None
+        fp_code = None
+        if fingerprint is not None:
+            fp_code = self._fingerprints.get(fingerprint)
+            if fp_code is None:
+                return {}
+
+        by_codes: Dict[Tuple[int, ...], int] = {}
+        for exitcode, fp, *codes in self._iter_rows(0, self._rows):
+            if (fp_code is None or fp == fp_code) and (
+                not successful_only or exitcode == 0
+            ):
+                key = tuple(codes)
+                by_codes[key] = by_codes.get(key, 0) + 1
+        values = self._values
+        return {
+            params_key(dict(zip(self._names, map(list.__getitem__, values, codes)))): n
+            for codes, n in by_codes.items()
+        }
@@ -0,0 +1,58 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None  # type: ignore
+
+
+class FileLock:
+    """Advisory lock shared by the processes opening the same file.
+
+    Any number of processes can hold the ``shared`` lock, only one the
+    ``exclusive`` one. Acquisitions nest within a process: an exclusive lock
+    taken while holding the shared one upgrades it until it is released. Where
+    ``fcntl`` is not available locking does nothing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._mode: Optional[int] = None
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        previous = self._mode
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if previous is None or (exclusive and previous == fcntl.LOCK_SH):
+            fcntl.flock(self._fd, mode)
+            self._mode = mode
+        try:
+            yield
+        finally:
+            if previous is None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            elif previous != self._mode:
+                fcntl.flock(self._fd, previous)
+            self._mode = previous
+
+    def shared(self):
+        return self._locked(exclusive=False)
+
+    def exclusive(self):
+        return self._locked(exclusive=True)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,112 @@
+import fnmatch
+import gzip
+import hashlib
+import os
+import shutil
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from runexpy.files import SUFFIXES, _zstd
+
+COMPRESSIONS = tuple(SUFFIXES)
+
+
+def _is_compressed(path: str) -> bool:
+    return path.endswith(tuple(SUFFIXES.values()))
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@dataclass
+class OutputPolicy:
+    """How the files of a run are stored once the run has finished.
+
+    Files whose path relative to the run directory matches one of the
+    ``compress`` glob patterns are compressed with ``compression`` (``gzip`` or
+    ``zstd``, which requires the zstandard package) and renamed with a ``.gz``
+    or ``.zst`` suffix: ``stdout`` becomes ``stdout.gz``. The files of a
+    result are still keyed by their original name, and read back transparently
+    with ``RunFile.open``.
+
+    Compression is deterministic, so that with ``dedup`` identical files of
+    different runs are hard linked to a single copy kept in the ``objects``
+    directory of the campaign. The copies are the same file: modifying one of
+    them in place modifies them all.
+    """
+
+    compress: Sequence[str] = ()
+    compression: str = "gzip"
+    level: Optional[int] = None
+    dedup: bool = False
+
+    def __post_init__(self):
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {self.compression}, "
+                f"available compressions: {list(COMPRESSIONS)}"
+            )
+        if self.compression == "zstd":
+            _zstd()
+
+    def _matches(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.compress)
+
+    def _compress(self, path: str) -> str:
+        compressed = path + SUFFIXES[self.compression]
+        tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            if self.compression == "gzip":
+                level = 6 if self.level is None else self.level
+                # no name nor time in the header, equal files compress equally
+                with gzip.GzipFile("", "wb", level, dst, mtime=0) as out:
+                    shutil.copyfileobj(src, out)
+            else:
+                level = 3 if self.level is None else self.level
+                _zstd().ZstdCompressor(level=level).copy_stream(src, dst)
+        shutil.copystat(path, tmp_path)
+        os.replace(tmp_path, compressed)
+        os.remove(path)
+        return compressed
+
+    @staticmethod
+    def _dedup(path: str, objects_dir: str) -> None:
+        digest = _hash_file(path)
+        obj = os.path.join(objects_dir, digest[:2], digest)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        try:
+            if os.path.samefile(path, obj):
+                return
+            tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+            os.link(obj, tmp_path)
+            os.replace(tmp_path, path)
+        except FileNotFoundError:
+            # first file with this content
+            try:
+                os.link(path, obj)
+            except FileExistsError:
+                # stored concurrently, link to it next time
+                pass
+        except OSError:
+            # e.g. too many links to the object, keep the file as it is
+            pass
+
+    def apply(self, run_dir: str, objects_dir: str) -> None:
+        for root, _, files in os.walk(run_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, run_dir)
+                if (
+                    self._matches(relpath)
+                    and os.path.getsize(path) > 0
+                    and not _is_compressed(path)
+                ):
+                    path = self._compress(path)
+                if self.dedup and os.path.getsize(path) > 0:
+                    self._dedup(path, objects_dir)
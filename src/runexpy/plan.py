@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from runexpy.utils import ParamsKeyT, ParamsT, params_key
+
+
+@dataclass
+class ExperimentPlan:
+    """Experiments to run for every parameter combination still lacking results.
+
+    ``missing`` holds each incomplete combination with its number of missing
+    runs, in the order of the requested combinations.
+    """
+
+    missing: List[Tuple[ParamsT, int]]
+    count: int
+    requested: int
+    stored: int
+
+    @classmethod
+    def build(
+        cls,
+        combinations: Iterable[ParamsT],
+        counts: Dict[ParamsKeyT, int],
+        count: int = 1,
+    ) -> "ExperimentPlan":
+        """Diff the requested combinations against the stored result counts"""
+        seen = set()
+        missing = []
+        stored = 0
+        for comb in combinations:
+            key = params_key(comb)
+            if key in seen:
+                continue
+            seen.add(key)
+            n = min(count, counts.get(key, 0))
+            stored += n
+            if n < count:
+                missing.append((comb, count - n))
+        return cls(missing, count, len(seen), stored)
+
+    @property
+    def runs(self) -> int:
+        """Number of runs to execute"""
+        return sum(n for _, n in self.missing)
+
+    @property
+    def complete(self) -> int:
+        """Number of requested combinations which need no more runs"""
+        return self.requested - len(self.missing)
+
+    def __len__(self) -> int:
+        return self.runs
+
+    def __iter__(self) -> Iterator[ParamsT]:
+        for comb, n in self.missing:
+            for _ in range(n):
+                yield comb
+
+    def summary(self) -> str:
+        return (
+            f"{self.runs} runs to execute for {len(self.missing)} of "
+            f"{self.requested} combinations ({self.complete} complete, "
+            f"{self.stored} of {self.requested * self.count} runs stored)"
+        )
@@ -0,0 +1,352 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import IO, Dict, List, Optional, Sequence, Tuple
+
+from runexpy.result import Result
+from runexpy.runner import RunMonitor
+
+
+@dataclass(frozen=True)
+class Progress:
+    """Snapshot of the progress of a run of experiments.
+
+    ``completed`` counts all the finished runs, including the ``failed`` ones
+    and those ``cached`` (restored from a result cache). ``busy_time`` sums the
+    running time of the completed runs, ``bookkeeping_time`` the time spent by
+    the campaign storing their results. The runs in progress and the time each
+    worker spent running experiments are only known when the runner reports
+    them, see ``RunMonitor``.
+    """
+
+    planned: int
+    concurrency: Optional[int] = None
+    # mean running time of the stored results, if any
+    expected_time: Optional[float] = None
+    completed: int = 0
+    failed: int = 0
+    cached: int = 0
+    elapsed: float = 0.0
+    busy_time: float = 0.0
+    bookkeeping_time: float = 0.0
+    running: Optional[int] = None
+    # seconds spent running experiments, by worker
+    worker_busy: Tuple[Tuple[str, float], ...] = ()
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.planned - self.completed)
+
+    @property
+    def throughput(self) -> float:
+        """Completed runs per second"""
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mean_time(self) -> Optional[float]:
+        """Mean running time of the runs, observed or expected"""
+        executed = self.completed - self.cached
+        if executed > 0:
+            return self.busy_time / executed
+        return self.expected_time
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until all the planned runs are completed"""
+        if self.remaining == 0:
+            return 0.0
+        mean_time = self.mean_time
+        if self.concurrency and mean_time is not None:
+            return self.remaining * mean_time / self.concurrency
+        if self.throughput > 0:
+            return self.remaining / self.throughput
+        return None
+
+    @property
+    def utilization(self) -> Optional[float]:
+        """Fraction of the time the workers spent running experiments"""
+        if not self.concurrency or self.elapsed <= 0:
+            return None
+        return min(1.0, self.busy_time / (self.elapsed * self.concurrency))
+
+    @property
+    def worker_utilization(self) -> Dict[str, float]:
+        """Fraction of the time each worker spent running experiments"""
+        if self.elapsed <= 0:
+            return {}
+        return {
+            worker: min(1.0, busy / self.elapsed) for worker, busy in self.worker_busy
+        }
+
+
+class ProgressListener:
+    """Receives the progress of a run of experiments.
+
+    Subclasses override the hooks they need. Hooks are called from the thread
+    running the experiments, so they should return quickly.
+    """
+
+    def on_start(self, progress: Progress) -> None:
+        pass
+
+    def on_result(self, result: Result, progress: Progress) -> None:
+        pass
+
+    def on_end(self, progress: Progress) -> None:
+        pass
+
+
+class ProgressTracker(RunMonitor):
+    # keeps the progress up to date and notifies the listeners
+
+    def __init__(
+        self,
+        listeners: Sequence[ProgressListener],
+        planned: int,
+        concurrency: Optional[int] = None,
+        expected_time: Optional[float] = None,
+    ):
+        self.listeners = list(listeners)
+        self.progress = Progress(planned, concurrency, expected_time)
+        self._start = time.monotonic()
+        # start of the runs in progress and time spent in the ended ones, by
+        # worker, as reported by the runner
+        self._runs: Dict[str, List[float]] = {}
+        self._busy: Dict[str, float] = {}
+
+    def _update(self, **changes) -> Progress:
+        now = time.monotonic()
+        changes["elapsed"] = now - self._start
+        if self._busy:
+            changes["running"] = sum(map(len, self._runs.values()))
+            changes["worker_busy"] = tuple(
+                (worker, busy + sum(now - start for start in self._runs[worker]))
+                for worker, busy in sorted(self._busy.items())
+            )
+        self.progress = replace(self.progress, **changes)
+        return self.progress
+
+    def run_started(self, worker: str) -> None:
+        self._runs.setdefault(worker, []).append(time.monotonic())
+        self._busy.setdefault(worker, 0.0)
+
+    def run_ended(self, worker: str, seconds: float) -> None:
+        runs = self._runs.setdefault(worker, [])
+        if runs:
+            runs.pop(0)
+        self._busy[worker] = self._busy.get(worker, 0.0) + seconds
+
+    def start(self) -> None:
+        progress = self._update()
+        for listener in self.listeners:
+            listener.on_start(progress)
+
+    def add(self, result: Result, cached: bool = False, bookkeeping: float = 0.0):
+        p = self.progress
+        progress = self._update(
+            completed=p.completed + 1,
+            failed=p.failed + (result.exitcode != 0),
+            cached=p.cached + cached,
+            busy_time=p.busy_time + (0.0 if cached else result.time),
+            bookkeeping_time=p.bookkeeping_time + bookkeeping,
+        )
+        for listener in self.listeners:
+            listener.on_result(result, progress)
+
+    def end(self) -> None:
+        progress = self._update()
+        for listener in self.listeners:
+            listener.on_end(progress)
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class TerminalProgress(ProgressListener):
+    """Progress bar redrawn on a single line of the terminal"""
+
+    def __init__(self, stream: Optional[IO[str]] = None, interval: float = 0.2):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self._last = 0.0
+
+    def _line(self, p: Progress, width: int = 20) -> str:
+        done = width * p.completed // p.planned if p.planned else width
+        line = (
+            f"[{'#' * done}{' ' * (width - done)}] {p.completed}/{p.planned} done, "
+            f"{p.failed} failed"
+        )
+        if p.cached:
+            line += f", {p.cached} cached"
+        if p.running is not None:
+            line += f", {p.running} running"
+        line += f", {p.throughput:.2f} runs/s, ETA {_format_duration(p.eta)}"
+        if p.utilization is not None:
+            line += f", {p.utilization:.0%} busy"
+        return line
+
+    def _draw(self, progress: Progress) -> None:
+        self.stream.write("\r\033[K" + self._line(progress))
+        self.stream.flush()
+        self._last = time.monotonic()
+
+    def on_start(self, progress: Progress) -> None:
+        self._draw(progress)
+
+    def on_result(self, result: Result, progress: Progress) -> None:
+        if time.monotonic() - self._last >= self.interval:
+            self._draw(progress)
+
+    def on_end(self, progress: Progress) -> None:
+        self._draw(progress)
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+def _label(value: str) -> str:
+    # escaped as a label value of the text format
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(progress: Progress) -> str:
+    """Progress in the Prometheus text exposition format"""
+    metrics = [
+        ("runs_planned", "gauge", "Runs planned", progress.planned),
+        ("runs_completed_total", "counter", "Runs completed", progress.completed),
+        ("runs_failed_total", "counter", "Runs failed", progress.failed),
+        ("runs_cached_total", "counter", "Runs restored from cache", progress.cached),
+        ("runs_running", "gauge", "Runs running", progress.running),
+        ("elapsed_seconds", "gauge", "Seconds since the start", progress.elapsed),
+        (
+            "run_seconds_total",
+            "counter",
+            "Running time of the completed runs",
+            progress.busy_time,
+        ),
+        (
+            "bookkeeping_seconds_total",
+            "counter",
+            "Time spent storing results",
+            progress.bookkeeping_time,
+        ),
+        (
+            "throughput_runs_per_second",
+            "gauge",
+            "Completed runs per second",
+            progress.throughput,
+        ),
+        ("eta_seconds", "gauge", "Estimated time to completion", progress.eta),
+        (
+            "worker_utilization_ratio",
+            "gauge",
+            "Fraction of time workers ran experiments",
+            progress.utilization,
+        ),
+    ]
+    lines: List[str] = []
+    for name, kind, help, value in metrics:
+        if value is None:
+            continue
+        lines += [
+            f"# HELP runexpy_{name} {help}.",
+            f"# TYPE runexpy_{name} {kind}",
+            f"runexpy_{name} {float(value):g}",
+        ]
+    utilization = progress.worker_utilization
+    if utilization:
+        lines += [
+            "# HELP runexpy_worker_busy_ratio Fraction of time each worker ran "
+            "experiments.",
+            "# TYPE runexpy_worker_busy_ratio gauge",
+        ]
+        lines += [
+            f'runexpy_worker_busy_ratio{{worker="{_label(worker)}"}} {ratio:g}'
+            for worker, ratio in utilization.items()
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusTextFile(ProgressListener):
+    """Metrics written to a file, e.g. for the node exporter textfile collector"""
+
+    def __init__(self, path: str, interval: float = 5.0):
+        self.path = path
+        self.interval = interval
+        self._last = 0.0
+
+    def _write(self, progress: Progress) -> None:
+        tmp_path = f"{self.path}.{uuid.uuid4()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(format_prometheus(progress))
+        os.replace(tmp_path, self.path)
+        self._last = time.monotonic()
+
+    def on_start(self, progress: Progress) -> None:
+        self._write(progress)
+
+    def on_result(self, result: Result, progress: Progress) -> None:
+        if time.monotonic() - self._last >= self.interval:
+            self._write(progress)
+
+    def on_end(self, progress: Progress) -> None:
+        self._write(progress)
+
+
+class PrometheusServer(ProgressListener):
+    """Metrics served over HTTP at ``/metrics`` while experiments run.
+
+    With ``port=0`` a free port is chosen, available in ``port`` once started.
+    """
+
+    def __init__(self, port: int = 9100, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port
+        self._progress: Optional[Progress] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _handler(self):
+        listener = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics" or listener._progress is None:
+                    self.send_error(404)
+                    return
+                body = format_prometheus(listener._progress).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def on_start(self, progress: Progress) -> None:
+        self._progress = progress
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def on_result(self, result: Result, progress: Progress) -> None:
+        self._progress = progress
+
+    def on_end(self, progress: Progress) -> None:
+        self._progress = progress
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
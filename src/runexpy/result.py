@@ -1,38 +1,270 @@
 from __future__ import annotations
 
-import copy
-from dataclasses import dataclass
+import sys
+from array import array
+from dataclasses import dataclass, fields
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    overload,
+)
+
 from typing_extensions import TypedDict
 
 from runexpy.utils import ParamsT
 
+# slots make results smaller, where dataclasses support them
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+class ParamsSchema:
+    """Names of the parameters of a campaign, shared by the results it loads"""
+
+    __slots__ = ("names", "_positions")
+
+    def __init__(self, names: Iterable[str]):
+        self.names = tuple(names)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    def __reduce__(self):
+        return ParamsSchema, (self.names,)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ParamsSchema):
+            return NotImplemented
+        return self.names == other.names
+
+    def __hash__(self) -> int:
+        return hash(self.names)
+
+    def values(self, params: Mapping[str, Any]) -> Tuple[Any, ...]:
+        """Values of the parameters, in the order of the schema"""
+        if isinstance(params, ParamsView) and params._schema == self:
+            return params._values
+        return tuple(params[name] for name in self.names)
+
+    def view(self, params: Mapping[str, Any]) -> ParamsView:
+        return ParamsView(self, self.values(params))
+
+
+class ParamsView(Mapping[str, Any]):
+    """Read-only parameters stored as a tuple of values.
+
+    The names of the parameters are shared through a ``ParamsSchema``, so that
+    a ``ResultBatch`` does not keep a dictionary for each of its results.
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: ParamsSchema, values: Tuple[Any, ...]):
+        self._schema = schema
+        self._values = values
+
+    def __reduce__(self):
+        return ParamsView, (self._schema, self._values)
+
+    def __getitem__(self, name: str) -> Any:
+        return self._values[self._schema._positions[name]]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._schema._positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._schema.names)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ParamsView) and other._schema == self._schema:
+            return self._values == other._values
+        return super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
 
-class ResultJSON(TypedDict):
+class _ResultJSON(TypedDict):
     id: str
     time: float
     exitcode: int
     params: ParamsT
 
 
-@dataclass(frozen=True)
+class ResultJSON(_ResultJSON, total=False):
+    fingerprint: str
+    user_time: float
+    system_time: float
+    max_rss: int
+    voluntary_switches: int
+    involuntary_switches: int
+    read_bytes: int
+    write_bytes: int
+
+
+@dataclass(frozen=True, **_SLOTS)
 class Result:
     id: str
     time: float
     exitcode: int
+    # not copied, the parameters must not be modified afterwards
     params: ParamsT
-
-    def __post_init__(self):
-        object.__setattr__(self, "params", copy.deepcopy(self.params))
+    # fingerprint of the script which produced the result, if known
+    fingerprint: Optional[str] = None
+    # resources used by the run, if measured: CPU times in seconds, peak
+    # resident memory of the largest process in bytes, context switches, and
+    # bytes read and written
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+    voluntary_switches: Optional[int] = None
+    involuntary_switches: Optional[int] = None
+    read_bytes: Optional[int] = None
+    write_bytes: Optional[int] = None
 
     def to_json(self) -> ResultJSON:
         data: ResultJSON = {
             "id": self.id,
             "time": self.time,
             "exitcode": self.exitcode,
-            "params": self.params,
+            "params": dict(self.params),
         }
+        for name in OPTIONAL_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value  # type: ignore[literal-required]
         return data
 
     @classmethod
-    def from_json(cls, params: ResultJSON) -> Result:
-        return cls(**params)
+    def from_json(cls, data: ResultJSON) -> Result:
+        # the parameters are copied, data may be the document of a database
+        return cls(**{**data, "params": dict(data["params"])})
+
+
+# fields of a result which may be None, in order
+OPTIONAL_FIELDS = tuple(
+    f.name for f in fields(Result) if f.name not in ("id", "time", "exitcode", "params")
+)
+
+
+class ResultBatch(Sequence[Result]):
+    """Results stored by column, built into ``Result`` objects only on access.
+
+    Times and exit codes are kept in arrays and the parameters as tuples of
+    values ordered by ``schema``, read through ``params_view`` without building
+    a dictionary. Optional fields get a column once one of the results sets
+    them.
+    """
+
+    def __init__(self, schema: ParamsSchema):
+        self.schema = schema
+        self.ids: List[str] = []
+        self.times = array("d")
+        self.exitcodes = array("q")
+        self.params: List[Tuple[Any, ...]] = []
+        self._optional: Dict[str, List[Any]] = {}
+
+    @classmethod
+    def from_results(
+        cls, results: Iterable[Result], schema: ParamsSchema
+    ) -> ResultBatch:
+        batch = cls(schema)
+        for result in results:
+            batch.add(result)
+        return batch
+
+    def append(
+        self,
+        id: str,
+        time: float,
+        exitcode: int,
+        params: Tuple[Any, ...],
+        optional: Sequence[Any] = (),
+    ) -> None:
+        """Add a result, with the values of its ``OPTIONAL_FIELDS`` if any"""
+        n = len(self.ids)
+        self.ids.append(id)
+        self.times.append(time)
+        self.exitcodes.append(exitcode)
+        self.params.append(params)
+        values = dict(zip(OPTIONAL_FIELDS, optional))
+        for name, value in values.items():
+            if value is not None and name not in self._optional:
+                self._optional[name] = [None] * n
+        for name, column in self._optional.items():
+            column.append(values.get(name))
+
+    def add(self, result: Result) -> None:
+        self.append(
+            result.id,
+            result.time,
+            result.exitcode,
+            self.schema.values(result.params),
+            [getattr(result, name) for name in OPTIONAL_FIELDS],
+        )
+
+    def _optional_values(self, i: int) -> List[Any]:
+        return [
+            self._optional[name][i] if name in self._optional else None
+            for name in OPTIONAL_FIELDS
+        ]
+
+    def extend(self, other: ResultBatch) -> None:
+        for i in range(len(other)):
+            self.append(
+                other.ids[i],
+                other.times[i],
+                other.exitcodes[i],
+                self.schema.values(other.params_view(i)),
+                other._optional_values(i),
+            )
+
+    def params_view(self, i: int) -> ParamsView:
+        """Parameters of the ``i``-th result, as a read-only mapping"""
+        return ParamsView(self.schema, self.params[i])
+
+    def column(self, name: str) -> List[Any]:
+        """Values of a field or of a parameter of all the results"""
+        if name == "id":
+            return list(self.ids)
+        if name == "time":
+            return self.times.tolist()
+        if name == "exitcode":
+            return self.exitcodes.tolist()
+        if name in self._optional:
+            return list(self._optional[name])
+        if name in OPTIONAL_FIELDS:
+            return [None] * len(self)
+        i = self.schema._positions[name]
+        return [values[i] for values in self.params]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, i: int) -> Result: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Result]: ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        optional = {name: column[i] for name, column in self._optional.items()}
+        return Result(
+            self.ids[i],
+            self.times[i],
+            self.exitcodes[i],
+            dict(zip(self.schema.names, self.params[i])),
+            **optional,
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.schema.names)}, rows={len(self)})"
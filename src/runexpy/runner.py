@@ -1,15 +1,50 @@
+import asyncio
+import fnmatch
+import importlib
+import importlib.util
+import itertools
 import os
+import select
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import traceback
 import uuid
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from functools import partial
-from multiprocessing import Pool
-from typing import Iterable, List, Union
+from multiprocessing import Pool, SimpleQueue
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from runexpy.result import Result
+from runexpy.usage import (
+    UsageT,
+    poll_usage,
+    self_usage,
+    usage_since,
+    wait_exit,
+    wait_usage,
+)
 from runexpy.utils import ParamsT
 
 
@@ -20,7 +55,255 @@ def format_option(name: str, value: Union[int, str, bool]) -> List[str]:
         return [f"--{name}", f"{value}"]
 
 
+# exit code recorded for experiments killed after their timeout, as timeout(1)
+TIMEOUT_EXITCODE = 124
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times failed experiments are run again, and after how long.
+
+    An experiment is run again, up to ``attempts`` runs in total, when its exit
+    code is one of ``exitcodes``, or is not 0 if ``exitcodes`` is None. The
+    n-th retry waits ``backoff * factor ** (n - 1)`` seconds, at most
+    ``max_backoff``. Only the result of the last run is kept.
+    """
+
+    attempts: int = 1
+    exitcodes: Optional[Tuple[int, ...]] = None
+    backoff: float = 0.0
+    factor: float = 2.0
+    max_backoff: float = 60.0
+
+    def should_retry(self, exitcode: int, attempt: int) -> bool:
+        return (
+            attempt < self.attempts
+            and exitcode != 0
+            and (self.exitcodes is None or exitcode in self.exitcodes)
+        )
+
+    def delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * self.factor ** (attempt - 1))
+
+
+@dataclass(frozen=True)
+class ScratchPolicy:
+    """Run experiments in a scratch directory, then move their files to the campaign.
+
+    Each run is executed in a new directory under ``dir`` (the system temporary
+    directory if None), e.g. on a local disk or a tmpfs, so that the writes of
+    the experiment do not reach the campaign directory, which may be on a
+    network file system. Once the run has exited its files are moved to the
+    campaign in one step, a temporary directory renamed to the run directory.
+    If ``keep`` is given, only the files whose path relative to the run
+    directory matches one of its glob patterns are kept, besides stdout and
+    stderr.
+    """
+
+    dir: Optional[str] = None
+    keep: Optional[Tuple[str, ...]] = None
+
+    def make_dir(self, run_id: str) -> str:
+        scratch_dir = os.path.join(self.dir or tempfile.gettempdir(), run_id)
+        os.makedirs(scratch_dir)
+        return scratch_dir
+
+    def _kept(self, relpath: str) -> bool:
+        return (
+            self.keep is None
+            or relpath in ("stdout", "stderr")
+            or any(fnmatch.fnmatch(relpath, pattern) for pattern in self.keep)
+        )
+
+    def publish(self, scratch_dir: str, run_dir: str) -> None:
+        """Move the files of the run executed in ``scratch_dir`` to ``run_dir``"""
+        if self.keep is not None:
+            for root, _, files in os.walk(scratch_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if not self._kept(os.path.relpath(path, scratch_dir)):
+                        os.remove(path)
+        os.makedirs(os.path.dirname(run_dir), exist_ok=True)
+        tmp_dir = f"{run_dir}.tmp"
+        try:
+            os.rename(scratch_dir, tmp_dir)
+        except OSError:
+            # on another file system
+            shutil.copytree(scratch_dir, tmp_dir, symlinks=True)
+            shutil.rmtree(scratch_dir)
+        os.rename(tmp_dir, run_dir)
+
+
+def _open_pidfd(pid: int) -> Optional[int]:
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        # not supported by the kernel
+        return None
+
+
+def _kill(pid: int, group: bool) -> None:
+    # with a timeout experiments lead their own process group, kill all of it
+    try:
+        if group and hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _wait(process: subprocess.Popen, timeout: Optional[float]) -> Tuple[int, UsageT]:
+    # wait for an experiment, killing it after the timeout or on errors
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        _kill(process.pid, group=True)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+    try:
+        try:
+            wait_exit(process)
+        finally:
+            # once reaped the pid may be reused, the timer must not kill it
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+        usage = wait_usage(process)
+    except BaseException:
+        if process.returncode is None:
+            _kill(process.pid, group=timeout is not None)
+        process.wait()
+        raise
+    if timed_out.is_set():
+        return TIMEOUT_EXITCODE, usage
+    return process.returncode, usage
+
+
+async def _await_exit(process: subprocess.Popen, poll_interval: float) -> UsageT:
+    # wait for an experiment in the event loop, through a pidfd if available
+    pidfd = _open_pidfd(process.pid)
+    try:
+        if pidfd is not None:
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+
+            def on_exit():
+                if not exited.done():
+                    exited.set_result(None)
+
+            loop.add_reader(pidfd, on_exit)
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+        while True:
+            usage = poll_usage(process)
+            if usage is not None:
+                return usage
+            await asyncio.sleep(poll_interval)
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+class RunMonitor:
+    """Notified by the runners when they start and end running experiments.
+
+    ``worker`` names what runs the experiment, e.g. a process of a pool or the
+    cores given to it, so that the time spent running experiments is known
+    for every worker. Hooks are called from the thread iterating over the
+    results of the runner.
+    """
+
+    def run_started(self, worker: str) -> None:
+        pass
+
+    def run_ended(self, worker: str, seconds: float) -> None:
+        pass
+
+
+_monitor: ContextVar[Optional[RunMonitor]] = ContextVar("monitor", default=None)
+
+
+@contextmanager
+def monitoring(monitor: RunMonitor) -> Iterator[None]:
+    """Report to ``monitor`` the runs of the runners used within the context"""
+    token = _monitor.set(monitor)
+    try:
+        yield
+    finally:
+        _monitor.reset(token)
+
+
+def current_monitor() -> Optional[RunMonitor]:
+    """Monitor the runners report their runs to, if any"""
+    return _monitor.get()
+
+
+@contextmanager
+def _reported(worker: str) -> Iterator[None]:
+    # report the run of an experiment within the context
+    monitor = _monitor.get()
+    if monitor is None:
+        yield
+        return
+    start = time.monotonic()
+    monitor.run_started(worker)
+    try:
+        yield
+    finally:
+        monitor.run_ended(worker, time.monotonic() - start)
+
+
+class _QueueMonitor(RunMonitor):
+    # sends the runs of a pool worker to the process iterating over the results
+
+    def __init__(self, events: Any):
+        self.events = events
+
+    def run_started(self, worker: str) -> None:
+        self.events.put((worker, None))
+
+    def run_ended(self, worker: str, seconds: float) -> None:
+        self.events.put((worker, seconds))
+
+
+def _init_worker(events: Any, initializer: Optional[Callable] = None, *args) -> None:
+    # forked workers inherit the monitor of the parent, which they cannot use
+    _monitor.set(None if events is None else _QueueMonitor(events))
+    if initializer is not None:
+        initializer(*args)
+
+
+def _pool_events() -> Any:
+    # queue of the runs of the pool workers, if they are monitored
+    return SimpleQueue() if _monitor.get() is not None else None
+
+
+def _relay(events: Any) -> None:
+    # report the runs sent by the pool workers so far
+    monitor = _monitor.get()
+    while events is not None and monitor is not None and not events.empty():
+        worker, seconds = events.get()
+        if seconds is None:
+            monitor.run_started(worker)
+        else:
+            monitor.run_ended(worker, seconds)
+
+
 class Runner(ABC):
+    @property
+    def concurrency(self) -> Optional[int]:
+        """Maximum number of experiments run at the same time, if known"""
+        return None
+
     @abstractmethod
     def run_experiments(
         self, script: List[str], dir: str, param_combinations: Iterable[ParamsT]
@@ -28,50 +311,743 @@ class Runner(ABC):
         pass
 
     @staticmethod
-    def _run_experiment(script, data_dir, params) -> Result:
+    def _options(params: ParamsT) -> List[str]:
+        return [i for p, v in params.items() for i in format_option(p, v)]
+
+    @staticmethod
+    def _make_run_dir(
+        data_dir: str, scratch: Optional[ScratchPolicy] = None
+    ) -> Tuple[str, str]:
+        # the directory the experiment runs in
         run_id = str(uuid.uuid4())
-        start_time = time.time()
+        if scratch is not None:
+            return run_id, scratch.make_dir(run_id)
         run_dir = os.path.join(data_dir, run_id)
-        command = script + [i for p, v in params.items() for i in format_option(p, v)]
-        print(" ".join(command), file=sys.stderr)
         os.makedirs(run_dir)
+        return run_id, run_dir
+
+    @staticmethod
+    def _publish(
+        data_dir: str, run_id: str, run_dir: str, scratch: Optional[ScratchPolicy]
+    ) -> None:
+        if scratch is not None:
+            scratch.publish(run_dir, os.path.join(data_dir, run_id))
+
+    @staticmethod
+    def _discard(data_dir: str, result: Result) -> None:
+        shutil.rmtree(os.path.join(data_dir, result.id), ignore_errors=True)
+
+    @staticmethod
+    def _retrying(
+        run: Callable[[], Result], data_dir: str, retry: Optional[RetryPolicy]
+    ) -> Result:
+        retry = retry or RetryPolicy()
+        attempt = 1
+        while True:
+            with _reported(f"pid {os.getpid()}"):
+                result = run()
+            if not retry.should_retry(result.exitcode, attempt):
+                return result
+            Runner._discard(data_dir, result)
+            time.sleep(retry.delay(attempt))
+            attempt += 1
+
+    @staticmethod
+    def _run_once(script, data_dir, params, timeout=None, scratch=None) -> Result:
+        start_time = time.time()
+        command = script + Runner._options(params)
+        print(" ".join(command), file=sys.stderr)
+        run_id, run_dir = Runner._make_run_dir(data_dir, scratch)
         outfile = os.path.join(run_dir, "stdout")
         errfile = os.path.join(run_dir, "stderr")
         with open(outfile, "w") as stdout, open(errfile, "w") as stderr:
-            subprocess.call(
+            process = subprocess.Popen(
                 command,
                 cwd=run_dir,
-                # env=env,
                 stdout=stdout,
                 stderr=stderr,
+                start_new_session=timeout is not None,
             )
-        # subprocess.call(script, params, stdout=...)
+            return_code, usage = _wait(process, timeout)
+        Runner._publish(data_dir, run_id, run_dir, scratch)
         tot_time = time.time() - start_time
-        return_code = 0
-        return Result(run_id, tot_time, return_code, params)
+        return Result(run_id, tot_time, return_code, params, **usage)
+
+    @staticmethod
+    def _run_experiment(
+        script,
+        data_dir,
+        params,
+        timeout: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+        scratch: Optional[ScratchPolicy] = None,
+    ) -> Result:
+        run = partial(Runner._run_once, script, data_dir, params, timeout, scratch)
+        return Runner._retrying(run, data_dir, retry)
 
 
 @dataclass
 class SimpleRunner(Runner):
     delay: int = 0
+    # seconds after which experiments are killed
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    scratch: Optional[ScratchPolicy] = None
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        return 1
 
     def run_experiments(
         self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
     ) -> Iterable:
         """Run several simulations"""
         for params in param_combinations:
-            yield self._run_experiment(script, data_dir, params)
+            yield self._run_experiment(
+                script, data_dir, params, self.timeout, self.retry, self.scratch
+            )
             time.sleep(self.delay)
 
 
 @dataclass
 class ParallelRunner(Runner):
     max_processes: int
+    # seconds after which experiments are killed
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    scratch: Optional[ScratchPolicy] = None
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        return self.max_processes
 
     def run_experiments(
         self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
     ) -> Iterable[Result]:
         """Run several simulations in parallel"""
-        sim_fn = partial(self._run_experiment, script, data_dir)
-        with Pool(self.max_processes) as p:
-            yield from p.imap_unordered(sim_fn, param_combinations)
+        sim_fn = partial(
+            self._run_experiment,
+            script,
+            data_dir,
+            timeout=self.timeout,
+            retry=self.retry,
+            scratch=self.scratch,
+        )
+        events = _pool_events()
+        with Pool(self.max_processes, _init_worker, (events,)) as p:
+            for result in p.imap_unordered(sim_fn, param_combinations):
+                _relay(events)
+                yield result
+
+
+# entry point of the experiments run by the current PythonFunctionRunner worker
+_entry_point: Optional[Callable] = None
+_entry_name: str = ""
+
+
+def _load_entry_point(module: str, function: str) -> None:
+    global _entry_point, _entry_name
+    if module.endswith(".py") or os.path.isfile(module):
+        module_dir = os.path.dirname(os.path.abspath(module))
+        name = os.path.splitext(os.path.basename(module))[0]
+        # make the modules next to the script importable, as when running it
+        sys.path.insert(0, module_dir)
+        spec = importlib.util.spec_from_file_location(name, module)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"Cannot import {module}")
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[name] = mod
+        spec.loader.exec_module(mod)
+    else:
+        mod = importlib.import_module(module)
+    _entry_point = getattr(mod, function)
+    _entry_name = module
+
+
+def _exit_code(exit: SystemExit) -> int:
+    if exit.code is None:
+        return 0
+    if isinstance(exit.code, int):
+        return exit.code
+    print(exit.code, file=sys.stderr)
+    return 1
+
+
+class _Timeout(BaseException):
+    # not an Exception, so that experiments do not catch it by mistake
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _Timeout()
+
+
+def _call_entry_point_once(
+    use_argv: bool,
+    timeout: Optional[float],
+    scratch: Optional[ScratchPolicy],
+    data_dir: str,
+    params: ParamsT,
+) -> Result:
+    assert _entry_point is not None
+    start_time = time.time()
+    options = Runner._options(params)
+    print(" ".join([_entry_name] + options), file=sys.stderr)
+    run_id, run_dir = Runner._make_run_dir(data_dir, scratch)
+
+    outfile = os.path.join(run_dir, "stdout")
+    errfile = os.path.join(run_dir, "stderr")
+    cwd, argv = os.getcwd(), sys.argv
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_streams = sys.stdout, sys.stderr
+    saved_fds = os.dup(1), os.dup(2)
+    with open(outfile, "w") as stdout, open(errfile, "w") as stderr:
+        # redirect the file descriptors too, to capture the output of extensions
+        sys.stdout, sys.stderr = stdout, stderr
+        os.dup2(stdout.fileno(), 1)
+        os.dup2(stderr.fileno(), 2)
+        os.chdir(run_dir)
+        if timeout is not None:
+            signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        snapshot = self_usage()
+        try:
+            if use_argv:
+                sys.argv = [_entry_name] + options
+                _entry_point()
+            else:
+                _entry_point(**params)
+            return_code = 0
+        except SystemExit as e:
+            return_code = _exit_code(e)
+        except _Timeout:
+            return_code = TIMEOUT_EXITCODE
+        except Exception:
+            traceback.print_exc()
+            return_code = 1
+        finally:
+            if timeout is not None:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = saved_streams
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            list(map(os.close, saved_fds))
+            os.chdir(cwd)
+            sys.argv = argv
+    Runner._publish(data_dir, run_id, run_dir, scratch)
+    tot_time = time.time() - start_time
+    # the peak RSS is the one of the worker
+    usage = usage_since(snapshot)
+    return Result(run_id, tot_time, return_code, params, **usage)
+
+
+def _call_entry_point(
+    use_argv: bool,
+    timeout: Optional[float],
+    retry: RetryPolicy,
+    scratch: Optional[ScratchPolicy],
+    data_dir: str,
+    params: ParamsT,
+) -> Result:
+    run = partial(_call_entry_point_once, use_argv, timeout, scratch, data_dir, params)
+    return Runner._retrying(run, data_dir, retry)
+
+
+@dataclass
+class PythonFunctionRunner(Runner):
+    """Run Python experiments in a pool of long-lived worker processes.
+
+    Each worker imports the experiment module once, then calls its entry
+    function for every parameter combination, from within the run directory and
+    with stdout and stderr redirected to the run files. By default the function
+    is called without arguments and the options are passed through
+    ``sys.argv``, as for a script run from the command line; with
+    ``use_argv=False`` the parameters are passed as keyword arguments instead.
+
+    The module is either a path to a file or the name of an importable module.
+    If not given, the first ``.py`` file in the campaign script is used.
+    Module level state is shared by the runs executed by the same worker, use
+    ``maxtasksperchild`` to replace workers periodically. The ``timeout`` is
+    enforced with ``SIGALRM``, which cannot interrupt long calls to extensions.
+    """
+
+    max_processes: int
+    module: Optional[str] = None
+    function: str = "main"
+    use_argv: bool = True
+    maxtasksperchild: Optional[int] = None
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    scratch: Optional[ScratchPolicy] = None
+
+    @staticmethod
+    def _find_module(script: List[str]) -> str:
+        for i, item in enumerate(script):
+            if item.endswith(".py"):
+                return item
+            if item == "-m" and i + 1 < len(script):
+                return script[i + 1]
+        raise ValueError(f"Cannot find a Python module in the script {script}")
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        return self.max_processes
+
+    def run_experiments(
+        self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
+    ) -> Iterable[Result]:
+        """Run several simulations in parallel in warm worker processes"""
+        module = self.module or self._find_module(script)
+        sim_fn = partial(
+            _call_entry_point,
+            self.use_argv,
+            self.timeout,
+            self.retry,
+            self.scratch,
+            data_dir,
+        )
+        events = _pool_events()
+        with Pool(
+            self.max_processes,
+            initializer=_init_worker,
+            initargs=(events, _load_entry_point, module, self.function),
+            maxtasksperchild=self.maxtasksperchild,
+        ) as p:
+            for result in p.imap_unordered(sim_fn, param_combinations):
+                _relay(events)
+                yield result
+
+
+@dataclass
+class AsyncRunner(Runner):
+    """Run experiments as subprocesses of the current process, from asyncio.
+
+    At most ``max_concurrency`` experiments run at the same time, and results
+    are produced as soon as experiments complete. The event loop waits for
+    experiments to end through pidfds where available, else polling them every
+    ``poll_interval`` seconds.
+    """
+
+    max_concurrency: int
+    # seconds after which experiments are killed
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    scratch: Optional[ScratchPolicy] = None
+    # seconds between the checks of the experiments when pidfds are not available
+    poll_interval: float = 0.01
+
+    async def _arun_process(
+        self, script: List[str], data_dir: str, params: ParamsT
+    ) -> Result:
+        start_time = time.time()
+        command = script + self._options(params)
+        print(" ".join(command), file=sys.stderr)
+        run_id, run_dir = self._make_run_dir(data_dir, self.scratch)
+        outfile = os.path.join(run_dir, "stdout")
+        errfile = os.path.join(run_dir, "stderr")
+        # asyncio subprocesses are reaped by the child watcher, which does
+        # not report the resources they used
+        with open(outfile, "w") as stdout, open(errfile, "w") as stderr:
+            process = subprocess.Popen(
+                command,
+                cwd=run_dir,
+                stdout=stdout,
+                stderr=stderr,
+                start_new_session=self.timeout is not None,
+            )
+        try:
+            usage = await asyncio.wait_for(
+                _await_exit(process, self.poll_interval), self.timeout
+            )
+            return_code = process.returncode
+        except asyncio.TimeoutError:
+            _kill(process.pid, group=True)
+            usage = await _await_exit(process, self.poll_interval)
+            return_code = TIMEOUT_EXITCODE
+        except asyncio.CancelledError:
+            _kill(process.pid, group=self.timeout is not None)
+            await _await_exit(process, self.poll_interval)
+            raise
+        if self.scratch is not None:
+            # copying the files may take a while, out of the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._publish, data_dir, run_id, run_dir, self.scratch
+            )
+        tot_time = time.time() - start_time
+        return Result(run_id, tot_time, return_code, params, **usage)
+
+    async def _arun_once(
+        self,
+        slots: asyncio.Queue,
+        script: List[str],
+        data_dir: str,
+        params: ParamsT,
+    ) -> Result:
+        # at most max_concurrency experiments hold one of the slots
+        slot = await slots.get()
+        try:
+            with _reported(f"slot {slot}"):
+                return await self._arun_process(script, data_dir, params)
+        finally:
+            slots.put_nowait(slot)
+
+    async def _arun_experiment(
+        self,
+        slots: asyncio.Queue,
+        script: List[str],
+        data_dir: str,
+        params: ParamsT,
+    ) -> Result:
+        attempt = 1
+        while True:
+            result = await self._arun_once(slots, script, data_dir, params)
+            if not self.retry.should_retry(result.exitcode, attempt):
+                return result
+            self._discard(data_dir, result)
+            # the slot is released while waiting
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    async def arun_experiments(
+        self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
+    ) -> AsyncIterator[Result]:
+        """Run several simulations concurrently, yielding results as they end"""
+        slots: asyncio.Queue = asyncio.Queue()
+        for slot in range(self.max_concurrency):
+            slots.put_nowait(slot)
+        param_combinations = iter(param_combinations)
+        pending: Set[asyncio.Future] = set()
+        # only a window of the experiments is scheduled at any time, so that
+        # the parameter combinations are consumed lazily
+        window = 2 * self.max_concurrency
+        try:
+            while True:
+                for params in itertools.islice(
+                    param_combinations, window - len(pending)
+                ):
+                    pending.add(
+                        asyncio.ensure_future(
+                            self._arun_experiment(slots, script, data_dir, params)
+                        )
+                    )
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        return self.max_concurrency
+
+    def run_experiments(
+        self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
+    ) -> Iterable[Result]:
+        """Run several simulations concurrently on a private event loop"""
+        loop = asyncio.new_event_loop()
+        results = self.arun_experiments(script, data_dir, param_combinations)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
+
+
+# environment variables bounding the threads used by common numerical libraries
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+@dataclass(frozen=True)
+class Resources:
+    """Resources needed by an experiment, memory is in MiB."""
+
+    cores: int = 1
+    memory: float = 0
+
+
+def _available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _total_memory() -> float:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return float("inf")
+
+
+@dataclass
+class _Job:
+    params: ParamsT
+    resources: Resources
+    run_id: str = ""
+    run_dir: str = ""
+    start_time: float = 0
+    cpus: Tuple[int, ...] = ()
+    attempt: int = 1
+    not_before: float = 0
+    timed_out: bool = False
+    # experiments started before this one although it was first in the queue
+    overtaken: int = 0
+    # file descriptor readable when the experiment ends, if supported
+    pidfd: Optional[int] = None
+
+
+def _load_average() -> float:
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 0.0
+
+
+@dataclass
+class ResourceRunner(Runner):
+    """Run experiments in parallel packing them on the available resources.
+
+    Each experiment requires some cores and memory, either fixed or computed
+    from its parameters by ``requirements``. Experiments are started as soon as
+    enough resources are free, looking ahead in the queue for experiments that
+    fit when the next one does not. Each experiment is pinned to the cores it
+    was given, whose number is also exported in ``thread_env`` variables.
+    An experiment can be overtaken by at most ``max_overtaken`` later ones,
+    then no other experiment starts until it does, so that large experiments
+    are not starved by small ones.
+
+    With ``max_load``, experiments are also not started while the load average
+    of the machine, counting the cores of the experiments already running,
+    would exceed it with their cores, e.g. when other users run jobs on the
+    same machine. One experiment is always allowed to run.
+
+    By default all the CPUs the process may run on and the whole physical
+    memory are used. Experiments waiting to be retried do not hold resources.
+    The runner waits for experiments to end through pidfds where available,
+    else polling them every ``poll_interval`` seconds.
+    """
+
+    requirements: Union[Resources, Callable[[ParamsT], Resources]] = Resources()
+    cores: Optional[int] = None
+    memory: Optional[float] = None
+    pin: bool = True
+    thread_env: Tuple[str, ...] = THREAD_ENV_VARS
+    lookahead: int = 64
+    max_overtaken: int = 64
+    max_load: Optional[float] = None
+    # seconds between the checks of the load average, or of the experiments
+    # when pidfds are not available
+    poll_interval: float = 0.01
+    # seconds after which experiments are killed
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    scratch: Optional[ScratchPolicy] = None
+
+    def _resources(self, params: ParamsT) -> Resources:
+        if isinstance(self.requirements, Resources):
+            return self.requirements
+        return self.requirements(params)
+
+    def _launch(self, script: List[str], data_dir: str, job: _Job) -> subprocess.Popen:
+        job.start_time = time.time()
+        command = script + self._options(job.params)
+        print(" ".join(command), file=sys.stderr)
+        job.run_id, job.run_dir = self._make_run_dir(data_dir, self.scratch)
+        run_dir = job.run_dir
+
+        env = dict(os.environ)
+        env.update({var: str(job.resources.cores) for var in self.thread_env})
+        preexec_fn = None
+        if self.pin and job.cpus and hasattr(os, "sched_setaffinity"):
+            preexec_fn = partial(os.sched_setaffinity, 0, job.cpus)
+
+        outfile = os.path.join(run_dir, "stdout")
+        errfile = os.path.join(run_dir, "stderr")
+        with open(outfile, "w") as stdout, open(errfile, "w") as stderr:
+            process = subprocess.Popen(
+                command,
+                cwd=run_dir,
+                env=env,
+                stdout=stdout,
+                stderr=stderr,
+                preexec_fn=preexec_fn,
+                start_new_session=self.timeout is not None,
+            )
+        job.pidfd = _open_pidfd(process.pid)
+        return process
+
+    @staticmethod
+    def _worker(job: _Job) -> str:
+        # the cores of an experiment are not given to any other at the same time
+        if not job.cpus:
+            return "no cores"
+        return "cores " + ",".join(map(str, job.cpus))
+
+    def _external_load(self, busy_cores: int) -> float:
+        # load not due to the experiments of the runner, which takes a while
+        # to show in the load average
+        if self.max_load is None:
+            return 0.0
+        return max(0.0, _load_average() - busy_cores)
+
+    def _next_event(
+        self,
+        queue: Deque[_Job],
+        running: Dict[subprocess.Popen, _Job],
+        blocked: List[_Job],
+    ) -> float:
+        # seconds until something other than the end of an experiment happens
+        now = time.time()
+        events = [job.not_before - now for job in queue if job.not_before > now]
+        if self.timeout is not None:
+            events += [
+                job.start_time + self.timeout - now
+                for job in running.values()
+                if not job.timed_out
+            ]
+        if blocked and self.max_load is not None:
+            events.append(self.poll_interval)
+        return max(0.0, min(events, default=3600.0))
+
+    def _wait(self, running: Dict[subprocess.Popen, _Job], timeout: float) -> None:
+        # block until an experiment ends, or at most timeout seconds
+        fds = [job.pidfd for job in running.values()]
+        if not running:
+            time.sleep(timeout)
+        elif None in fds:
+            time.sleep(min(timeout, self.poll_interval))
+        else:
+            select.select(fds, [], [], timeout)
+
+    @property
+    def concurrency(self) -> Optional[int]:
+        cores = self.cores or len(_available_cpus())
+        if isinstance(self.requirements, Resources):
+            return max(1, cores // max(1, self.requirements.cores))
+        return cores
+
+    def run_experiments(
+        self, script: List[str], data_dir: str, param_combinations: Iterable[ParamsT]
+    ) -> Iterable[Result]:
+        """Run several simulations in parallel within the available resources"""
+        cpus = _available_cpus()
+        if self.cores is not None:
+            cpus = cpus[: self.cores]
+        total_memory = _total_memory() if self.memory is None else self.memory
+        free_cpus, free_memory = list(cpus), total_memory
+
+        param_combinations = iter(param_combinations)
+        queue: Deque[_Job] = deque()
+        running: Dict[subprocess.Popen, _Job] = {}
+        monitor = _monitor.get()
+        try:
+            while True:
+                for params in itertools.islice(
+                    param_combinations, self.lookahead - len(queue)
+                ):
+                    resources = self._resources(params)
+                    if resources.cores > len(cpus) or resources.memory > total_memory:
+                        raise ValueError(
+                            f"Experiment {params} requires {resources}, "
+                            f"but only {len(cpus)} cores and {total_memory} MiB "
+                            "are available"
+                        )
+                    queue.append(_Job(params, resources))
+                if not queue and not running:
+                    break
+
+                # start the queued experiments that fit, in order
+                now = time.time()
+                busy_cores = len(cpus) - len(free_cpus)
+                load = self._external_load(busy_cores)
+                blocked: List[_Job] = []
+                for job in list(queue):
+                    cores, memory = job.resources.cores, job.resources.memory
+                    if job.not_before > now:
+                        continue
+                    fits = cores <= len(free_cpus) and memory <= free_memory
+                    if (
+                        fits
+                        and self.max_load is not None
+                        and running
+                        and load + busy_cores + cores > self.max_load
+                    ):
+                        fits = False
+                    if not fits:
+                        blocked.append(job)
+                        continue
+                    if any(b.overtaken >= self.max_overtaken for b in blocked):
+                        # the resources are kept for an experiment waiting too long
+                        break
+                    for b in blocked:
+                        b.overtaken += 1
+                    queue.remove(job)
+                    job.cpus = tuple(free_cpus[:cores])
+                    free_cpus = free_cpus[cores:]
+                    free_memory -= memory
+                    busy_cores += cores
+                    running[self._launch(script, data_dir, job)] = job
+                    if monitor is not None:
+                        monitor.run_started(self._worker(job))
+
+                if self.timeout is not None:
+                    now = time.time()
+                    for process, job in running.items():
+                        if not job.timed_out and now - job.start_time > self.timeout:
+                            _kill(process.pid, group=True)
+                            job.timed_out = True
+
+                finished = []
+                for process in running:
+                    usage = poll_usage(process)
+                    if usage is not None:
+                        finished.append((process, usage))
+                if not finished:
+                    self._wait(running, self._next_event(queue, running, blocked))
+                for process, usage in finished:
+                    job = running.pop(process)
+                    if job.pidfd is not None:
+                        os.close(job.pidfd)
+                        job.pidfd = None
+                    free_cpus = sorted(free_cpus + list(job.cpus))
+                    free_memory += job.resources.memory
+                    self._publish(data_dir, job.run_id, job.run_dir, self.scratch)
+                    tot_time = time.time() - job.start_time
+                    if monitor is not None:
+                        monitor.run_ended(self._worker(job), tot_time)
+                    exitcode = TIMEOUT_EXITCODE if job.timed_out else process.returncode
+                    result = Result(job.run_id, tot_time, exitcode, job.params, **usage)
+                    if self.retry.should_retry(exitcode, job.attempt):
+                        self._discard(data_dir, result)
+                        job.not_before = time.time() + self.retry.delay(job.attempt)
+                        job.attempt += 1
+                        job.timed_out = False
+                        queue.appendleft(job)
+                    else:
+                        yield result
+        finally:
+            for process, job in running.items():
+                if process.poll() is None:
+                    _kill(process.pid, group=self.timeout is not None)
+                process.wait()
+                if job.pidfd is not None:
+                    os.close(job.pidfd)
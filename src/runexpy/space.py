@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import itertools
+import random
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+from runexpy.utils import DefaultParamsT, ParamsT, to_abs_if_path
+
+ConstraintT = Callable[[ParamsT], bool]
+AxisKeyT = Union[str, Tuple[str, ...]]
+
+
+def _normalize(values: Any) -> Sequence:
+    # ranges only contain numbers, other values are normalized once each
+    if isinstance(values, range):
+        return values
+    if not isinstance(values, list):
+        values = [values]
+    return [to_abs_if_path(v) for v in values]
+
+
+class _Axis:
+    # values taken together by one or more (zipped) parameters
+    def __init__(self, names: Tuple[str, ...], values: Sequence):
+        self.names = names
+        self.zipped = len(names) > 1
+        if self.zipped:
+            values = [tuple(map(to_abs_if_path, v)) for v in values]
+            if any(len(v) != len(names) for v in values):
+                raise ValueError(f"Zipped values of {names} must have one per name")
+        else:
+            values = _normalize(values)
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ParamSpace:
+    """Space of parameter combinations, enumerated lazily.
+
+    ``axes`` maps parameter names to a value, a list or a range of values, the
+    space being their product. A tuple of names maps to a list of tuples of
+    values which are taken together (zipped). Combinations which do not satisfy
+    all the ``constraints`` are skipped, so checking them never requires
+    building the whole space.
+
+    Combinations are numbered in the same order as ``itertools.product``:
+    indexing and slicing work on this numbering (constraints are only applied
+    when iterating or sampling), so slices are spaces themselves.
+    """
+
+    def __init__(
+        self,
+        axes: Mapping[AxisKeyT, Any],
+        constraints: Sequence[ConstraintT] = (),
+    ):
+        self._axes = [
+            _Axis(key if isinstance(key, tuple) else (key,), values)
+            for key, values in axes.items()
+        ]
+        # parameters set to None rather than to a list of values
+        self._unset = {
+            key
+            for key, values in axes.items()
+            if values is None and not isinstance(key, tuple)
+        }
+        self._constraints = list(constraints)
+        self._order: Optional[List[str]] = None
+        self._indices = range(self.size)
+        names = self.names
+        if len(set(names)) != len(names):
+            raise ValueError("Parameters appear in more than one axis")
+
+    def _copy(self) -> ParamSpace:
+        space = ParamSpace.__new__(ParamSpace)
+        space.__dict__.update(self.__dict__)
+        return space
+
+    @property
+    def names(self) -> List[str]:
+        return [name for axis in self._axes for name in axis.names]
+
+    @property
+    def size(self) -> int:
+        """Number of combinations in the whole space, ignoring constraints"""
+        size = 1
+        for axis in self._axes:
+            size *= len(axis)
+        return size
+
+    def with_defaults(self, default_params: DefaultParamsT) -> ParamSpace:
+        """Complete the space with the default value of missing parameters.
+
+        Parameters set to None in the space are set to their default too, while
+        an explicit ``[None]`` is kept. Unless the space was sliced, the axes
+        follow the order of ``default_params``, so that combinations are
+        enumerated as they were from a plain dict of ranges.
+        """
+        unknown = set(self.names) - default_params.keys()
+        if unknown:
+            raise ValueError(f"Unknown parameters: {unknown}")
+        space = self._copy()
+        axes = [axis for axis in self._axes if axis.names[0] not in self._unset]
+        set_names = {name for axis in axes for name in axis.names}
+        for param, default in default_params.items():
+            if param not in set_names:
+                if default is None:
+                    raise ValueError(f"Non-default field {param} has not been set")
+                # a single value does not change the numbering of combinations
+                axes.append(_Axis((param,), default))
+        if self._indices == range(self.size):
+            position = {name: i for i, name in enumerate(default_params)}
+            axes.sort(key=lambda axis: min(position[name] for name in axis.names))
+        space._axes = axes
+        space._order = list(default_params)
+        return space
+
+    def _make(self, values: Sequence[Any]) -> ParamsT:
+        params: ParamsT = {}
+        for axis, value in zip(self._axes, values):
+            if axis.zipped:
+                params.update(zip(axis.names, value))
+            else:
+                params[axis.names[0]] = value
+        if self._order is not None:
+            params = {name: params[name] for name in self._order}
+        return params
+
+    def _combination(self, index: int) -> ParamsT:
+        values = []
+        for axis in reversed(self._axes):
+            index, i = divmod(index, len(axis))
+            values.append(axis.values[i])
+        return self._make(values[::-1])
+
+    def _satisfies(self, params: ParamsT) -> bool:
+        return all(constraint(params) for constraint in self._constraints)
+
+    def __len__(self) -> int:
+        """Number of combinations in this space, ignoring constraints"""
+        return len(self._indices)
+
+    @overload
+    def __getitem__(self, key: int) -> ParamsT: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> ParamSpace: ...
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            space = self._copy()
+            space._indices = self._indices[key]
+            return space
+        return self._combination(self._indices[key])
+
+    def __iter__(self) -> Iterator[ParamsT]:
+        if self._indices == range(self.size):
+            combinations = map(
+                self._make, itertools.product(*(axis.values for axis in self._axes))
+            )
+        else:
+            combinations = map(self._combination, self._indices)
+        return filter(self._satisfies, combinations)
+
+    def sample(self, k: int, seed: Optional[int] = None) -> List[ParamsT]:
+        """Draw ``k`` distinct combinations satisfying the constraints.
+
+        Fewer combinations are returned if not enough of them exist.
+        """
+        rng = random.Random(seed)
+        drawn: Dict[int, None] = {}
+        samples = []
+        n = len(self._indices)
+        while len(samples) < k and len(drawn) < n:
+            i = rng.randrange(n)
+            if i in drawn:
+                continue
+            drawn[i] = None
+            params = self[i]
+            if self._satisfies(params):
+                samples.append(params)
+        return samples
+
+    def latin_hypercube(self, k: int, seed: Optional[int] = None) -> List[ParamsT]:
+        """Draw ``k`` combinations with a Latin hypercube design over the axes.
+
+        The values of each axis are split in ``k`` strata, each stratum being
+        used exactly once per axis. Combinations not satisfying the constraints
+        are discarded. Slicing is ignored.
+        """
+        rng = random.Random(seed)
+        columns = []
+        for axis in self._axes:
+            strata = list(range(k))
+            rng.shuffle(strata)
+            n = len(axis)
+            columns.append(
+                [axis.values[int((s + rng.random()) * n / k)] for s in strata]
+            )
+        combinations = map(self._make, zip(*columns))
+        return list(filter(self._satisfies, combinations))
@@ -0,0 +1,303 @@
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from runexpy.database import BaseDatabase, Database
+from runexpy.result import ParamsSchema, Result, ResultBatch
+from runexpy.utils import DefaultParamsT, ParamsKeyT, ParamsT, params_key
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+@dataclass
+class SQLiteDatabase(BaseDatabase):
+    """Campaign database stored in SQLite, with one column per parameter.
+
+    Unlike the TinyDB based ``Database``, results are not loaded in memory:
+    queries are answered by SQLite through indexes on the parameter columns.
+    Several processes can read and write the same campaign, each write being a
+    transaction which waits up to ``BUSY_TIMEOUT`` seconds for the others.
+    """
+
+    # public fields
+    conn: sqlite3.Connection = field(repr=False)
+    dir: str
+
+    # private fields
+    _config: Dict[str, Any] = field(init=False, repr=False)
+    _fields: Set[str] = field(init=False)
+    _schema: ParamsSchema = field(init=False, repr=False)
+    _names: List[str] = field(init=False, repr=False)
+
+    # seconds a write waits for the other processes writing the campaign
+    BUSY_TIMEOUT: ClassVar[float] = 60.0
+
+    # private class fields
+    _PARAM_PREFIX: ClassVar[str] = "params."
+    _RESULT_COLUMNS: ClassVar[List[str]] = [
+        f.name for f in fields(Result) if f.name != "params"
+    ]
+
+    def __post_init__(self):
+        rows = self.conn.execute(f"SELECT key, value FROM {self._T_CONFIG}")
+        self._config = {key: json.loads(value) for key, value in rows}
+        self._names = list(self.get_default_params().keys())
+        self._fields = set(self._names)
+        self._schema = ParamsSchema(self._names)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        # databases created by older versions lack the newer result fields
+        rows = self.conn.execute(f"PRAGMA table_info({self._T_RESULT})")
+        existing = {row[1] for row in rows}
+        missing = [c for c in self._RESULT_COLUMNS if c not in existing]
+        if missing:
+            with self._transaction():
+                # another process may have added them in the meantime
+                rows = self.conn.execute(f"PRAGMA table_info({self._T_RESULT})")
+                existing = {row[1] for row in rows}
+                missing = [c for c in missing if c not in existing]
+                for column in missing:
+                    self.conn.execute(
+                        f"ALTER TABLE {self._T_RESULT} ADD COLUMN {_quote(column)}"
+                    )
+
+    @staticmethod
+    def _name(dir: str) -> str:
+        return f"{os.path.basename(dir)}.sqlite"
+
+    @classmethod
+    def exists(cls, campaign_dir: str) -> bool:
+        return Path(campaign_dir, cls._name(campaign_dir)).exists()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # take the write lock at the start, so that the transaction waits for
+        # the other writers instead of failing when it first writes
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            yield
+
+    @classmethod
+    def _connect(cls, filepath: str) -> sqlite3.Connection:
+        # results may be written by the thread flushing them on time
+        conn = sqlite3.connect(
+            filepath, timeout=cls.BUSY_TIMEOUT, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @classmethod
+    def _param_column(cls, name: str) -> str:
+        return _quote(cls._PARAM_PREFIX + name)
+
+    @classmethod
+    def _create(
+        cls, campaign_dir: str, config: Dict[str, Any], filepath: Optional[str] = None
+    ) -> "SQLiteDatabase":
+        if filepath is None:
+            filepath = os.path.join(campaign_dir, cls._name(campaign_dir))
+        conn = cls._connect(filepath)
+        param_columns = [cls._param_column(name) for name in config[cls._F_PARAMS]]
+        columns = list(map(_quote, cls._RESULT_COLUMNS)) + param_columns
+        with conn:
+            conn.execute(
+                f"CREATE TABLE {cls._T_CONFIG} (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            conn.executemany(
+                f"INSERT INTO {cls._T_CONFIG} VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in config.items()],
+            )
+            # columns are left untyped so values keep the type they are given
+            conn.execute(
+                f"CREATE TABLE {cls._T_RESULT} ({', '.join(columns)}, "
+                f"UNIQUE ({_quote('id')}))"
+            )
+            if param_columns:
+                # the composite index also serves lookups on its first column
+                conn.execute(
+                    f"CREATE INDEX result_params ON {cls._T_RESULT} "
+                    f"({', '.join(param_columns)})"
+                )
+            for i, column in enumerate(param_columns[1:], 1):
+                conn.execute(
+                    f"CREATE INDEX result_param_{i} ON {cls._T_RESULT} ({column})"
+                )
+        return cls(conn, campaign_dir)
+
+    @classmethod
+    def new(
+        cls,
+        script: List[str],
+        default_params: DefaultParamsT,
+        campaign_dir: str,
+        overwrite: bool,
+    ):
+        cls._prepare_dir(campaign_dir, overwrite)
+        config = cls._make_config(script, default_params, campaign_dir)
+        return cls._create(campaign_dir, config)
+
+    @classmethod
+    def load(cls, campaign_dir: str):
+        # Verify file exists
+        if not Path(campaign_dir).exists():
+            raise ValueError("Directory does not exist")
+
+        if not cls.exists(campaign_dir):
+            return cls.migrate(campaign_dir)
+
+        filepath = os.path.join(campaign_dir, cls._name(campaign_dir))
+        return cls(cls._connect(filepath), campaign_dir)
+
+    @classmethod
+    def migrate(cls, campaign_dir: str) -> "SQLiteDatabase":
+        """Create the SQLite database of a campaign stored in TinyDB.
+
+        The TinyDB database is left untouched. The SQLite database only appears
+        once all the results are copied, so an interrupted migration is simply
+        done again on the next load.
+        """
+        if cls.exists(campaign_dir):
+            raise FileExistsError("The campaign already has a SQLite database")
+        if not Path(campaign_dir, Database._name(campaign_dir)).exists():
+            raise ValueError("No database found in the campaign directory")
+
+        old_db = Database.load(campaign_dir)
+        filepath = os.path.join(campaign_dir, cls._name(campaign_dir))
+        tmp_path = f"{filepath}.{uuid.uuid4()}.tmp"
+        try:
+            db = cls._create(campaign_dir, dict(old_db.get_config()), tmp_path)
+            try:
+                with db.conn:
+                    db._insert(old_db.get_results_for({}))
+            finally:
+                # also checkpoints the write-ahead log into the file
+                db.conn.close()
+            # unlike a rename, a link never replaces the database of a
+            # concurrent migration, which may be in use already
+            try:
+                os.link(tmp_path, filepath)
+            except FileExistsError:
+                pass
+        finally:
+            for path in (tmp_path, f"{tmp_path}-wal", f"{tmp_path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        return cls(cls._connect(filepath), campaign_dir)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self._config
+
+    def _where(self, problem: ParamsT) -> Tuple[str, List[Any]]:
+        if not problem:
+            return "", []
+        conditions = [f"{self._param_column(name)} = ?" for name in problem]
+        return " WHERE " + " AND ".join(conditions), list(problem.values())
+
+    def count_results_for(self, problem: ParamsT) -> int:
+        if not set(problem).issubset(self._fields):
+            return 0
+        where, values = self._where(problem)
+        query = f"SELECT COUNT(*) FROM {self._T_RESULT}{where}"
+        return self.conn.execute(query, values).fetchone()[0]
+
+    def count_all_results(
+        self, fingerprint: Optional[str] = None, successful_only: bool = False
+    ) -> Dict[ParamsKeyT, int]:
+        columns = ", ".join(self._param_column(name) for name in self._names)
+        conditions, values = [], []
+        if fingerprint is not None:
+            conditions.append(f"{_quote('fingerprint')} = ?")
+            values.append(fingerprint)
+        if successful_only:
+            conditions.append(f"{_quote('exitcode')} = 0")
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if not self._names:
+            # a campaign without parameters has a single combination
+            query = f"SELECT COUNT(*) FROM {self._T_RESULT}{where}"
+            count = self.conn.execute(query, values).fetchone()[0]
+            return {(): count} if count else {}
+        query = (
+            f"SELECT {columns}, COUNT(*) FROM {self._T_RESULT}{where} "
+            f"GROUP BY {columns}"
+        )
+        return {
+            params_key(dict(zip(self._names, row))): row[-1]
+            for row in self.conn.execute(query, values)
+        }
+
+    def mean_time(self) -> Optional[float]:
+        query = (
+            f"SELECT AVG({_quote('time')}) FROM {self._T_RESULT} "
+            f"WHERE {_quote('exitcode')} = 0"
+        )
+        return self.conn.execute(query).fetchone()[0]
+
+    def _select(self, problem: ParamsT) -> Iterator[Tuple[Any, ...]]:
+        # rows with the result columns followed by the parameters
+        if not set(problem).issubset(self._fields):
+            return iter(())
+        where, values = self._where(problem)
+        columns = list(map(_quote, self._RESULT_COLUMNS))
+        columns += [self._param_column(name) for name in self._names]
+        query = (
+            f"SELECT {', '.join(columns)} FROM {self._T_RESULT}{where} ORDER BY rowid"
+        )
+        return self.conn.execute(query, values)
+
+    def iter_results_for(self, problem: ParamsT) -> Iterator[Result]:
+        # the result columns are id, time, exitcode and the optional fields
+        n = len(self._RESULT_COLUMNS)
+        for row in self._select(problem):
+            params = dict(zip(self._schema.names, row[n:]))
+            yield Result(*row[:3], params, *row[3:n])
+
+    def get_result_batch(self, problem: ParamsT) -> ResultBatch:
+        n = len(self._RESULT_COLUMNS)
+        batch = ResultBatch(self._schema)
+        for row in self._select(problem):
+            batch.append(row[0], row[1], row[2], row[n:], row[3:n])
+        return batch
+
+    def _insert(self, results: Iterable[Result]) -> None:
+        rows = []
+        for result in results:
+            self._check_structure(result)
+            row = [getattr(result, column) for column in self._RESULT_COLUMNS]
+            rows.append(row + [result.params[name] for name in self._names])
+        columns = list(map(_quote, self._RESULT_COLUMNS))
+        columns += [self._param_column(name) for name in self._names]
+        placeholders = ", ".join("?" * len(columns))
+        try:
+            self.conn.executemany(
+                f"INSERT INTO {self._T_RESULT} ({', '.join(columns)}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError("An entry with the same id is present")
+
+    def insert_results(self, results: Iterable[Result]) -> None:
+        with self._transaction():
+            self._insert(results)
+
+    def flush(self) -> None:
+        self.conn.commit()
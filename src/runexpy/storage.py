@@ -0,0 +1,186 @@
+import itertools
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from tinydb.storages import Storage
+
+DataT = Dict[str, Dict[str, Any]]
+RecordT = Dict[str, Any]
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identity and version of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class JournalStorage(Storage):
+    """TinyDB storage made of a JSON snapshot plus an append-only journal.
+
+    The snapshot has the same format used by ``JSONStorage``. Every write only
+    appends the documents inserted since the previous one to the journal, one
+    JSON record per line, so the amount of data written does not depend on the
+    database size.
+    The journal is folded into the snapshot every ``compact_every`` records.
+
+    Several processes can share the storage as long as writes are serialized
+    (``Database`` holds a file lock): ``read_new`` returns the records appended
+    by the other processes since the last access.
+
+    Only insertions are journaled: if a table shrinks or disappears the whole
+    snapshot is rewritten, while in-place updates of existing documents are
+    not detected.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_every: int = 10000,
+        fsync: bool = True,
+        **kwargs,
+    ):
+        self._path = path
+        self._journal_path = self.journal_path(path)
+        self._compact_every = compact_every
+        self._fsync = fsync
+        self.kwargs = kwargs
+
+        # number of documents per table already on disk
+        self._persisted: Dict[str, int] = {}
+        self._journal_records = 0
+        # journal bytes already read or written, and snapshot they refer to
+        self._offset = 0
+        self._snapshot = file_stamp(path)
+
+    @staticmethod
+    def journal_path(path: str) -> str:
+        return f"{path}.journal"
+
+    def read(self) -> Optional[DataT]:
+        self._snapshot = file_stamp(self._path)
+        data: Optional[DataT] = None
+        if os.path.exists(self._path) and os.path.getsize(self._path):
+            with open(self._path) as f:
+                data = json.load(f)
+
+        records = self._replay_journal()
+        if records:
+            data = data if data is not None else {}
+            for record in records:
+                table = data.setdefault(record["table"], {})
+                table[record["id"]] = record["doc"]
+
+        self._persisted = {name: len(docs) for name, docs in (data or {}).items()}
+        self._journal_records = len(records)
+        return data
+
+    def _replay_journal(self) -> List[RecordT]:
+        self._offset = 0
+        if not os.path.exists(self._journal_path):
+            return []
+        records = []
+        valid_size = 0
+        with open(self._journal_path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # torn record left by a crash while appending
+                    break
+                valid_size += len(line)
+        if valid_size != os.path.getsize(self._journal_path):
+            with open(self._journal_path, "r+b") as f:
+                f.truncate(valid_size)
+        self._offset = valid_size
+        return records
+
+    def position(self) -> Tuple[Optional[Tuple[int, int, int]], int]:
+        """Snapshot version and journal offset of the data last read or written"""
+        return self._snapshot, self._offset
+
+    def seek(self, position: Tuple[Optional[Tuple[int, ...]], int]) -> None:
+        """Make ``read_new`` return the records appended after ``position``"""
+        self._snapshot, self._offset = position
+
+    def read_new(self) -> Optional[List[RecordT]]:
+        """Records appended by other processes since the last read or write.
+
+        Returns None if the data has to be read again from scratch, because the
+        journal has been compacted or ends with a torn record in the meantime.
+        """
+        if file_stamp(self._path) != self._snapshot:
+            return None
+        try:
+            size = os.path.getsize(self._journal_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self._offset:
+            return None
+        if size == self._offset:
+            return []
+        with open(self._journal_path, "rb") as f:
+            f.seek(self._offset)
+            lines = f.read(size - self._offset).splitlines(keepends=True)
+        if not lines[-1].endswith(b"\n"):
+            return None
+        try:
+            records = [json.loads(line) for line in lines]
+        except ValueError:
+            return None
+        for record in records:
+            table = record["table"]
+            self._persisted[table] = self._persisted.get(table, 0) + 1
+        self._journal_records += len(records)
+        self._offset = size
+        return records
+
+    def write(self, data: DataT) -> None:
+        if set(self._persisted) - set(data) or any(
+            len(data[name]) < count for name, count in self._persisted.items()
+        ):
+            self.compact(data)
+            return
+
+        lines = []
+        for name, docs in data.items():
+            persisted = self._persisted.get(name, 0)
+            # documents are kept in insertion order, new ones are at the end
+            for doc_id, doc in itertools.islice(docs.items(), persisted, None):
+                record = {"table": name, "id": doc_id, "doc": doc}
+                lines.append(json.dumps(record) + "\n")
+            self._persisted[name] = len(docs)
+        if not lines:
+            return
+
+        with open(self._journal_path, "a") as f:
+            f.writelines(lines)
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+            self._offset = f.tell()
+        self._journal_records += len(lines)
+
+        if self._journal_records >= self._compact_every:
+            self.compact(data)
+
+    def compact(self, data: DataT) -> None:
+        """Write ``data`` as the new snapshot and empty the journal."""
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, **self.kwargs)
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+        # replaying the journal over the new snapshot is idempotent, so a crash
+        # before truncating it does not lose nor duplicate documents
+        with open(self._journal_path, "w"):
+            pass
+        self._snapshot = file_stamp(self._path)
+        self._offset = 0
+        self._persisted = {name: len(docs) for name, docs in data.items()}
+        self._journal_records = 0
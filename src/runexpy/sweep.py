@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from runexpy.adaptive import MetricT
+from runexpy.cache import ResultCache
+from runexpy.runner import Runner
+from runexpy.space import ParamSpace
+from runexpy.utils import ParamsKeyT, ParamsT, params_key
+
+if TYPE_CHECKING:
+    from runexpy.campaign import Campaign, ParamRangesT
+
+
+def _explicit_space(combinations: Sequence[ParamsT]) -> ParamSpace:
+    # the given combinations only, their values taken as they are
+    names = tuple(combinations[0])
+    return ParamSpace({names: [tuple(c[n] for n in names) for c in combinations]})
+
+
+@dataclass
+class Rung:
+    """Combinations run with one budget, and those promoted to the next one"""
+
+    budget: Any
+    # mean score of each combination, None if none of its runs succeeded
+    scores: List[Tuple[ParamsT, Optional[float]]]
+    promoted: List[ParamsT]
+
+
+@dataclass
+class SuccessiveHalving:
+    """Sweep running the best combinations with increasing budgets.
+
+    Every combination is first run with the first of the ``budgets``, the value
+    of the ``budget_param`` parameter (e.g. a number of iterations). Runs are
+    scored with ``score`` and, for each rung of budgets, only the best ``keep``
+    fraction of the combinations (by mean score over ``count`` runs, the
+    lowest unless ``maximize``) is run with the next budget.
+
+    Every rung is stored as normal results, so resuming a sweep only runs what
+    is missing and promotes the same combinations.
+    """
+
+    budget_param: str
+    budgets: Sequence[Any]
+    score: MetricT
+    keep: float = 1 / 3
+    maximize: bool = False
+    count: int = 1
+
+    def __post_init__(self):
+        if not self.budgets:
+            raise ValueError("At least one budget is needed")
+        if not 0 < self.keep < 1:
+            raise ValueError("The fraction of combinations kept must be in (0, 1)")
+
+    def _mean_score(
+        self, campaign: Campaign, comb: ParamsT, fingerprint: Optional[str]
+    ) -> Optional[float]:
+        scores = [
+            self.score(result, campaign.db.get_run_files(result))
+            for result in campaign.db.iter_results_for(comb)
+            if result.exitcode == 0
+            and (fingerprint is None or result.fingerprint == fingerprint)
+        ]
+        return sum(scores) / len(scores) if scores else None
+
+    def _promote(self, scores: List[Tuple[ParamsT, Optional[float]]]) -> List[ParamsT]:
+        scored = [(comb, score) for comb, score in scores if score is not None]
+        # stable, ties are broken by the order of the combinations
+        scored.sort(key=lambda s: -s[1] if self.maximize else s[1])
+        n = max(1, int(len(scores) * self.keep))
+        return [comb for comb, _ in scored[:n]]
+
+    def run(
+        self,
+        campaign: Campaign,
+        runner: Runner,
+        param_combinations: ParamRangesT,
+        longest_first: bool = False,
+        cache: Optional[ResultCache] = None,
+    ) -> List[Rung]:
+        """Run the sweep and return its rungs, the last one holding the best"""
+        if self.budget_param not in campaign.db.get_default_params():
+            raise ValueError(f"Unknown budget parameter {self.budget_param}")
+        fingerprint = None
+        if cache is not None:
+            fingerprint = cache.fingerprint(campaign.db.get_script())
+
+        # the budget set in the combinations is replaced by the one of the rung
+        unique: Dict[ParamsKeyT, ParamsT] = {}
+        for comb in campaign.list_param_combinations(param_combinations):
+            comb = {**comb, self.budget_param: self.budgets[0]}
+            unique.setdefault(params_key(comb), comb)
+        candidates = list(unique.values())
+        rungs: List[Rung] = []
+        for budget in self.budgets:
+            if not candidates:
+                break
+            rung_combs = [{**c, self.budget_param: budget} for c in candidates]
+            campaign.run_missing_experiments(
+                runner, _explicit_space(rung_combs), self.count, longest_first, cache
+            )
+            scores = [
+                (comb, self._mean_score(campaign, comb, fingerprint))
+                for comb in rung_combs
+            ]
+            promoted = self._promote(scores)
+            rungs.append(Rung(budget, scores, promoted))
+            candidates = promoted
+        return rungs
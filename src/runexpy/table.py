@@ -0,0 +1,203 @@
+import hashlib
+import os
+import pickle
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from runexpy.files import RunFile
+from runexpy.result import ParamsSchema, Result, ResultBatch
+
+# parse an output file, given as a RunFile, into named fields
+LoaderT = Callable[[str], Mapping[str, Any]]
+# signature of a parsed file: modification time and size
+StampT = Tuple[int, int]
+
+
+def _code_parts(code: Any) -> Tuple[Any, ...]:
+    # nested code objects (e.g. lambdas) are printed with their address
+    consts = tuple(
+        _code_parts(c) if hasattr(c, "co_code") else c for c in code.co_consts
+    )
+    return code.co_code, consts, code.co_names
+
+
+def _loader_parts(loader: Any) -> Tuple[Any, ...]:
+    if isinstance(loader, partial):
+        return (
+            _loader_parts(loader.func),
+            loader.args,
+            sorted(loader.keywords.items()),
+        )
+    code = getattr(loader, "__code__", None)
+    if code is None:
+        # other callables, e.g. instances of classes defining __call__
+        return (pickle.dumps(loader),)
+    cells = tuple(cell.cell_contents for cell in loader.__closure__ or ())
+    return (
+        loader.__module__,
+        loader.__qualname__,
+        _code_parts(code),
+        loader.__defaults__,
+        loader.__kwdefaults__,
+        cells,
+    )
+
+
+def _loader_key(filename: str, loader: LoaderT) -> Optional[str]:
+    """Key of the parsed files cache, None if the loader cannot be identified.
+
+    The key covers the code of the loader and the values it is called with:
+    its defaults, the contents of its closure and the arguments of a
+    ``functools.partial``, which must be picklable. The globals it uses are not
+    covered.
+    """
+    try:
+        parts = pickle.dumps((filename, _loader_parts(loader)), protocol=4)
+    except Exception:
+        return None
+    return hashlib.sha1(parts).hexdigest()
+
+
+class _LoaderCache:
+    # fields parsed from a file of each run, by run id
+    def __init__(self, path: Optional[str]):
+        self._path = path
+        self._entries: Dict[str, Tuple[StampT, Mapping[str, Any]]] = {}
+        self._modified = False
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                self._entries = pickle.load(f)
+
+    def get(self, run_id: str, stamp: StampT) -> Optional[Mapping[str, Any]]:
+        entry = self._entries.get(run_id)
+        if entry is None or entry[0] != stamp:
+            return None
+        return entry[1]
+
+    def put(self, run_id: str, stamp: StampT, fields: Mapping[str, Any]) -> None:
+        self._entries[run_id] = (stamp, fields)
+        self._modified = True
+
+    def save(self) -> None:
+        if self._path is None or not self._modified:
+            return
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._entries, f)
+        os.replace(tmp_path, self._path)
+        self._modified = False
+
+
+def _stamp(path: str) -> Optional[StampT]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ResultTable:
+    """Results stored by column, one list of values per column."""
+
+    def __init__(self, columns: Dict[str, List[Any]]):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), []))
+
+    def __getitem__(self, name: str) -> List[Any]:
+        return self.columns[name]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.columns)}, rows={len(self)})"
+
+    def to_numpy(self):
+        """Convert to a NumPy structured array"""
+        import numpy as np
+
+        arrays = [np.asarray(values) for values in self.columns.values()]
+        dtype = [(name, a.dtype) for name, a in zip(self.columns, arrays)]
+        table = np.empty(len(self), dtype=dtype)
+        for name, a in zip(self.columns, arrays):
+            table[name] = a
+        return table
+
+    def to_pandas(self):
+        """Convert to a pandas DataFrame"""
+        import pandas as pd
+
+        return pd.DataFrame(self.columns)
+
+    def to_arrow(self):
+        """Convert to a PyArrow Table"""
+        import pyarrow as pa
+
+        return pa.table(self.columns)
+
+
+def build_table(
+    results: Iterable[Result],
+    data_dir: str,
+    param_names: List[str],
+    loaders: Mapping[str, LoaderT],
+    cache_dir: Optional[str] = None,
+    executor: Optional[Executor] = None,
+) -> ResultTable:
+    """Gather the results and the fields parsed from their files by column.
+
+    ``loaders`` maps the name of an output file to a function parsing it into
+    fields, which become columns of the table. Files compressed by an
+    ``OutputPolicy`` are found by their original name, loaders should read
+    them with ``RunFile.open``. Files are parsed by ``executor``, by default a
+    thread pool, and the parsed fields are cached in ``cache_dir``, keyed by
+    run and by modification time and size of the file.
+    The cache is not used for loaders capturing values which cannot be
+    pickled, e.g. in their closure or as arguments of a ``functools.partial``.
+    """
+    if not isinstance(results, ResultBatch):
+        results = ResultBatch.from_results(results, ParamsSchema(param_names))
+    ids = results.ids
+    columns: Dict[str, List[Any]] = {
+        name: results.column(name) for name in ["id", "time", "exitcode"]
+    }
+    for name in param_names:
+        columns[name] = results.column(name)
+
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor()
+    try:
+        for filename, loader in loaders.items():
+            cache_path = None
+            key = _loader_key(filename, loader)
+            if cache_dir is not None and key is not None:
+                cache_path = os.path.join(cache_dir, key)
+            cache = _LoaderCache(cache_path)
+
+            paths = [RunFile.find(os.path.join(data_dir, id), filename) for id in ids]
+            stamps = list(map(_stamp, paths))
+            parsed: List[Optional[Mapping[str, Any]]] = [
+                None if stamp is None else cache.get(id, stamp)
+                for id, stamp in zip(ids, stamps)
+            ]
+            missing = [
+                i for i, p in enumerate(parsed) if p is None and stamps[i] is not None
+            ]
+            loaded = executor.map(loader, [paths[i] for i in missing])
+            for i, fields in zip(missing, loaded):
+                parsed[i] = fields
+                cache.put(ids[i], stamps[i], fields)
+            cache.save()
+
+            names: Dict[str, None] = {}
+            for fields in parsed:
+                names.update(dict.fromkeys(fields or ()))
+            for name in names:
+                if name in columns:
+                    raise ValueError(f"Column {name} of {filename} is already used")
+                columns[name] = [(fields or {}).get(name) for fields in parsed]
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return ResultTable(columns)
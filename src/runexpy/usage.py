@@ -0,0 +1,168 @@
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from runexpy.result import Result
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+# resources used by a run, stored as optional fields of its result
+USAGE_FIELDS = (
+    "user_time",
+    "system_time",
+    "max_rss",
+    "voluntary_switches",
+    "involuntary_switches",
+    "read_bytes",
+    "write_bytes",
+)
+
+UsageT = Dict[str, Any]
+
+
+def _read_proc_io(pid: str) -> Optional[Tuple[int, int]]:
+    # bytes read and written through system calls, including reaped children
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except (OSError, ValueError):
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+def _max_rss_bytes(max_rss: int) -> int:
+    # bytes on macOS, KiB elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _usage(rusage, io: Optional[Tuple[int, int]]) -> UsageT:
+    return {
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        "max_rss": _max_rss_bytes(rusage.ru_maxrss),
+        "voluntary_switches": rusage.ru_nvcsw,
+        "involuntary_switches": rusage.ru_nivcsw,
+        "read_bytes": None if io is None else io[0],
+        "write_bytes": None if io is None else io[1],
+    }
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _reap(process: subprocess.Popen, block: bool) -> Optional[UsageT]:
+    if hasattr(os, "waitid"):
+        # wait without reaping, so that the I/O counters can still be read
+        options = os.WEXITED | os.WNOWAIT | (0 if block else os.WNOHANG)
+        if os.waitid(os.P_PID, process.pid, options) is None:
+            return None
+        io = _read_proc_io(str(process.pid))
+        _, status, rusage = os.wait4(process.pid, 0)
+    else:
+        pid, status, rusage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return None
+        io = None
+    process.returncode = _exit_code(status)
+    return _usage(rusage, io)
+
+
+def wait_exit(process: subprocess.Popen) -> None:
+    """Wait for a process to end, without reaping it where possible.
+
+    Until it is reaped by ``wait_usage`` or ``poll_usage``, the pid of the
+    process cannot be reused, so that it can still be killed safely.
+    """
+    if hasattr(os, "waitid") and process.returncode is None:
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    else:
+        process.wait()
+
+
+def wait_usage(process: subprocess.Popen) -> UsageT:
+    """Wait for a process to end and return the resources it used.
+
+    The CPU times, peak RSS and context switches come from ``wait4`` and the
+    bytes read and written from ``/proc``, both include the subprocesses which
+    have been waited for. Fields which cannot be measured are None, and no
+    field is returned where ``wait4`` is not available.
+    """
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        process.wait()
+        return {}
+    usage = _reap(process, block=True)
+    assert usage is not None
+    return usage
+
+
+def poll_usage(process: subprocess.Popen) -> Optional[UsageT]:
+    """Return the resources used by a process if it has ended, else None"""
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        return None if process.poll() is None else {}
+    return _reap(process, block=False)
+
+
+def self_usage() -> Optional[Tuple[Any, Optional[Tuple[int, int]]]]:
+    """Snapshot of the resources used by the current process"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF), _read_proc_io("self")
+
+
+def usage_since(snapshot: Optional[Tuple[Any, Optional[Tuple[int, int]]]]) -> UsageT:
+    """Resources used by the current process since ``snapshot``.
+
+    The peak RSS is the one of the whole life of the process.
+    """
+    if snapshot is None:
+        return {}
+    before, io_before = snapshot
+    after, io_after = self_usage()  # type: ignore
+    io = None
+    if io_before is not None and io_after is not None:
+        io = (io_after[0] - io_before[0], io_after[1] - io_before[1])
+    usage = _usage(after, io)
+    usage["user_time"] -= before.ru_utime
+    usage["system_time"] -= before.ru_stime
+    usage["voluntary_switches"] -= before.ru_nvcsw
+    usage["involuntary_switches"] -= before.ru_nivcsw
+    return usage
+
+
+@dataclass
+class UsageSummary:
+    """Resources used by a group of runs, summed except the peak RSS"""
+
+    runs: int = 0
+    time: float = 0.0
+    user_time: float = 0.0
+    system_time: float = 0.0
+    max_rss: int = 0
+    voluntary_switches: int = 0
+    involuntary_switches: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+    def add(self, result: Result) -> None:
+        self.runs += 1
+        self.time += result.time
+        for name in USAGE_FIELDS:
+            value = getattr(result, name)
+            if value is None:
+                continue
+            if name == "max_rss":
+                self.max_rss = max(self.max_rss, value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
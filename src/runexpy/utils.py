@@ -1,12 +1,13 @@
 # typings
 import os
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 ParamsT = Dict[str, Union[int, str, float]]
 DefaultParamsT = Dict[str, Optional[Union[int, str, float]]]
 IterParamsT = Dict[
     str, Optional[Union[int, str, float, List[int], List[str], List[float]]]
 ]
+ParamsKeyT = Tuple[Tuple[str, Any], ...]
 
 
 def to_abs_if_path(item: Any) -> str:
@@ -14,3 +15,17 @@ def to_abs_if_path(item: Any) -> str:
         return os.path.abspath(item)
     else:
         return item
+
+
+def freeze_value(value: Any) -> Any:
+    # JSON storages turn tuples into lists, make them hashable again
+    if isinstance(value, (list, tuple)):
+        return tuple(map(freeze_value, value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_value(v)) for k, v in value.items()))
+    return value
+
+
+def params_key(params: ParamsT) -> ParamsKeyT:
+    """Canonical hashable key of a parameter combination."""
+    return tuple(sorted((k, freeze_value(v)) for k, v in params.items()))
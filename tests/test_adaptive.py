@@ -0,0 +1,89 @@
+import math
+import os
+
+import pytest
+
+from runexpy.adaptive import ConvergencePolicy, t_quantile
+from runexpy.campaign import Campaign
+from runexpy.result import Result
+from runexpy.runner import ParallelRunner
+
+
+@pytest.mark.parametrize(
+    "p, df, expected",
+    [
+        (0.975, 1, 12.70620474),
+        (0.975, 2, 4.30265273),
+        (0.975, 3, 3.18244631),
+        (0.995, 3, 5.84090931),
+        (0.975, 4, 2.77644511),
+        (0.995, 4, 4.60409487),
+        (0.975, 10, 2.22813885),
+        (0.995, 5, 4.03214298),
+        (0.95, 30, 1.69726089),
+        (0.975, 100, 1.98397152),
+        (0.975, 10000, 1.96020124),
+        (0.025, 10, -2.22813885),
+    ],
+)
+def test_t_quantile(p, df, expected):
+    assert t_quantile(p, df) == pytest.approx(expected, rel=1e-8)
+
+
+def _time(result, files):
+    return result.time
+
+
+def test_estimate():
+    policy = ConvergencePolicy(_time, rel_width=0.1, min_runs=3)
+    estimate = policy.estimate([], 2)
+    assert not estimate.converged and estimate.mean is None
+    assert policy.missing_runs(estimate) == 3
+
+    estimate = policy.estimate([1.0, 1.0], 2)
+    assert not estimate.converged and estimate.rel_width == 0
+    assert policy.missing_runs(estimate) == 1
+
+    estimate = policy.estimate([1.0, 1.0, 1.0], 3)
+    assert estimate.converged
+    assert policy.missing_runs(estimate) == 0
+
+    estimate = policy.estimate([9.0, 10.0, 11.0], 3)
+    assert estimate.mean == 10.0
+    assert estimate.half_width == pytest.approx(4.303 / math.sqrt(3), rel=1e-3)
+    assert (estimate.low, estimate.high) == (
+        10 - estimate.half_width,
+        10 + estimate.half_width,
+    )
+    assert not estimate.converged
+
+    policy = ConvergencePolicy(_time, max_runs=4)
+    assert policy.missing_runs(policy.estimate([1.0, 2.0, 3.0], 4)) == 0
+    with pytest.raises(ValueError):
+        ConvergencePolicy(_time, min_runs=1)
+
+
+def _read_value(result, files):
+    with files["stdout"].open() as f:
+        return float(f.read())
+
+
+def test_run_until_converged(campaign_dir):
+    command = """import random, sys
+print(1 + float(sys.argv[-1]) * random.random())
+"""
+    script = ["python3", "-c", command]
+    c = Campaign.new(script, campaign_dir, {"noise": 0.0})
+    os.makedirs(os.path.join(c.db.get_data_dir(), "stored"))
+    with open(os.path.join(c.db.get_data_dir(), "stored", "stdout"), "w") as f:
+        f.write("1.0\n")
+    c.write_result(Result("stored", 0.01, 0, {"noise": 0.0}))
+    policy = ConvergencePolicy(_read_value, rel_width=0.01, min_runs=3, max_runs=6)
+    estimates = c.run_until_converged(ParallelRunner(2), {"noise": [0.0, 1.0]}, policy)
+
+    (p1, e1), (p2, e2) = estimates
+    assert p1 == {"noise": 0.0} and p2 == {"noise": 1.0}
+    # the stored result counts as the first run
+    assert e1.converged and e1.runs == 3 and e1.mean == 1.0
+    assert not e2.converged and e2.runs == 6
+    assert c.db.count_results_for({"noise": 1.0}) == 6
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from runexpy.cache import ResultCache, script_fingerprint
+from runexpy.campaign import Campaign
+from runexpy.result import Result
+from runexpy.runner import SimpleRunner
+from runexpy.sqlite import SQLiteDatabase
+from runexpy.utils import params_key
+
+
+class CountingRunner(SimpleRunner):
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+
+    def run_experiments(self, script, data_dir, param_combinations):
+        for result in super().run_experiments(script, data_dir, param_combinations):
+            self.runs += 1
+            yield result
+
+
+@pytest.fixture()
+def script_file(tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text("print('v1')\n")
+    return str(path)
+
+
+def test_script_fingerprint(script_file, tmp_path):
+    data = tmp_path / "data.txt"
+    data.write_text("a")
+    fingerprint = script_fingerprint(["python3", script_file], [str(data)])
+    assert fingerprint == script_fingerprint(["python3", script_file], [str(data)])
+    assert fingerprint != script_fingerprint(["python3", script_file])
+    data.write_text("b")
+    assert fingerprint != script_fingerprint(["python3", script_file], [str(data)])
+
+
+def test_cache_shared_among_campaigns(script_file, default_params, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    script = ["python3", script_file]
+    runs = {"p3": [1, 2]}
+
+    c1 = Campaign.new(script, str(tmp_path / "c1"), default_params)
+    runner = CountingRunner()
+    c1.run_missing_experiments(runner, runs, count=2, cache=cache)
+    assert runner.runs == 4
+
+    c2 = Campaign.new(script, str(tmp_path / "c2"), default_params)
+    runner = CountingRunner()
+    c2.run_missing_experiments(runner, runs, count=3, cache=cache)
+    assert runner.runs == 2
+    results = c2.get_results_for(runs)
+    assert len(results) == 6
+    for result, files in results:
+        with open(files["stdout"]) as f:
+            assert f.read() == "v1\n"
+
+    # results of the old script are stale
+    with open(script_file, "w") as f:
+        f.write("print('v2')\n")
+    runner = CountingRunner()
+    c1.run_missing_experiments(runner, runs, cache=cache)
+    assert runner.runs == 2
+    assert len(c1.get_results_for(runs)) == 6
+
+
+def test_cache_skips_runs_in_campaign(script_file, default_params, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    script = ["python3", script_file]
+    runs = {"p3": 1}
+    c1 = Campaign.new(script, str(tmp_path / "c1"), default_params)
+    c1.run_missing_experiments(SimpleRunner(), runs, cache=cache)
+
+    # a run of c2, through another cache, stored after the one of c1
+    c2 = Campaign.new(script, str(tmp_path / "c2"), default_params)
+    c2.run_missing_experiments(
+        SimpleRunner(), runs, cache=ResultCache(str(tmp_path / "other"))
+    )
+    [(result, files)] = c2.get_results_for(runs)
+    cache.store(result, os.path.dirname(files["stdout"]))
+
+    runner = CountingRunner()
+    c2.run_missing_experiments(runner, runs, count=2, cache=cache)
+    assert runner.runs == 0
+    ids = {result.id for result, _ in c2.get_results_for(runs)}
+    assert ids == {result.id for result, _ in c1.get_results_for(runs)} | {result.id}
+
+
+def test_restore_keeps_all_fields(default_params, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    (run_dir / "stdout").write_text("out\n")
+    params = {**default_params, "p3": 1}
+    result = Result(
+        "exp", 0.5, 0, params, "f" * 8, user_time=0.25, max_rss=1024, read_bytes=10
+    )
+    cache.store(result, str(run_dir))
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    [entry] = cache.entries(result.fingerprint, params)
+    restored = cache.restore(entry, str(data_dir), params)
+    assert restored == result
+    assert restored.params is params
+    assert (data_dir / "exp" / "stdout").read_text() == "out\n"
+
+
+def test_sqlite_adds_missing_columns(script, default_params, campaign_dir):
+    db = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    # the result table of the versions without the fingerprint column
+    columns = ['"id"', '"time"', '"exitcode"']
+    columns += [f'"params.{name}"' for name in default_params]
+    with db.conn:
+        db.conn.execute("DROP TABLE result")
+        db.conn.execute(f"CREATE TABLE result ({', '.join(columns)}, UNIQUE (id))")
+    db = SQLiteDatabase.load(campaign_dir)
+    result = Result("exp", 0.1, 0, {**default_params, "p3": 1}, "abc")
+    db.insert_result(result)
+    assert SQLiteDatabase.load(campaign_dir).get_results_for({}) == [result]
+    assert db.count_all_results("abc") == {params_key(result.params): 1}
@@ -1,7 +1,15 @@
+import asyncio
+import itertools
+import multiprocessing
+import signal
+import time
+
 import pytest
 
-from runexpy.campaign import Campaign
-from runexpy.runner import SimpleRunner
+from runexpy.campaign import Campaign, FlushPolicy, _exit_on_sigterm
+from runexpy.progress import ProgressListener
+from runexpy.runner import AsyncRunner, SimpleRunner
+from runexpy.storage import JournalStorage
 
 
 def test_new_campaign(script, default_params, campaign_dir):
@@ -36,6 +44,33 @@ def test_new_campaign_same_dir_diff_params_no_overwrite(
         Campaign.new(script, campaign_dir, default_params, False)
 
 
+def _new_from_process(script, campaign_dir, default_params, barrier, p3):
+    barrier.wait()
+    c = Campaign.new(script, campaign_dir, default_params, storage=JournalStorage)
+    c.run_missing_experiments(SimpleRunner(), {"p3": [p3]})
+
+
+def test_new_campaign_concurrently(script, default_params, campaign_dir):
+    barrier = multiprocessing.Barrier(4)
+    processes = [
+        multiprocessing.Process(
+            target=_new_from_process,
+            args=(script, campaign_dir, default_params, barrier, p3),
+        )
+        for p3 in range(4)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    # the campaign was created once, with the results of every process
+    c = Campaign.load(campaign_dir)
+    assert len(c.db._config_table()) == 1
+    assert sorted(r.params["p3"] for r, _ in c.get_all_results()) == [0, 1, 2, 3]
+
+
 def test_load_campaign(script, default_params, campaign_dir):
     c1 = Campaign.new(script, campaign_dir, default_params, False)
     c2 = Campaign.load(campaign_dir)
@@ -136,3 +171,181 @@ def test_get_results(script, default_params, campaign_dir):
         {"p1": 0, "p2": default_params["p2"], "p3": [1, 2]}
     )
     assert len(partial_results) == 2
+
+
+class FailingRunner(SimpleRunner):
+    def run_experiments(self, script, data_dir, param_combinations):
+        yield from itertools.islice(
+            super().run_experiments(script, data_dir, param_combinations), 3
+        )
+        raise RuntimeError("runner failure")
+
+
+def test_flush_policy(script, default_params, campaign_dir, monkeypatch):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.flush_policy = FlushPolicy(every=2)
+    batches = []
+    insert_results = c.db.insert_results
+
+    def spy(results):
+        batches.append(len(results))
+        insert_results(results)
+
+    monkeypatch.setattr(c.db, "insert_results", spy)
+    c.run_missing_experiments(SimpleRunner(), {"p3": [1, 2, 3, 4, 5]})
+    assert batches == [2, 2, 1]
+    assert len(c.get_all_results()) == 5
+
+
+class SlowRunner(SimpleRunner):
+    # results are followed by a long wait, reporting what is stored meanwhile
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.stored = []
+
+    def run_experiments(self, script, data_dir, param_combinations):
+        for result in super().run_experiments(script, data_dir, param_combinations):
+            yield result
+            time.sleep(0.5)
+            self.stored.append(self.db.count_results_for({}))
+
+
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+def test_flush_interval(script, default_params, campaign_dir, backend):
+    c = Campaign.new(script, campaign_dir, default_params, False, backend=backend)
+    c.flush_policy = FlushPolicy(every=None, interval=0.1)
+    runner = SlowRunner(c.db)
+    c.run_missing_experiments(runner, {"p3": [1, 2, 3]})
+    assert runner.stored == [1, 2, 3]
+
+
+def test_flush_pending_on_failure(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.flush_policy = FlushPolicy(every=None, interval=3600)
+    with pytest.raises(RuntimeError):
+        c.run_missing_experiments(FailingRunner(), {"p3": [1, 2, 3, 4, 5]})
+    assert len(Campaign.load(campaign_dir).get_all_results()) == 3
+
+
+def test_async_run_missing_experiments(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    runs = {"p3": list(range(10))}
+    asyncio.run(c.arun_missing_experiments(AsyncRunner(3), runs))
+    assert len(c.get_results_for(runs)) == 10
+    assert list(c.get_missing_experiments(runs)) == []
+
+
+def test_iter_results(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    runs = {"p1": 0, "p3": [1, 2, 3]}
+    c.run_missing_experiments(SimpleRunner(), runs)
+
+    results = c.iter_results_for({"p1": 0, "p3": [1, 2]})
+    result, files = next(results)
+    assert result.params["p3"] == 1
+    assert files["out.txt"].endswith("out.txt")
+    with pytest.raises(KeyError):
+        files["missing.txt"]
+    assert dict(files) == c.db.get_files_for(result)
+    assert len(list(results)) == 1
+
+    all_results = c.get_all_results()
+    assert [(r, dict(f)) for r, f in c.iter_all_results()] == all_results
+
+
+def test_plan_missing_experiments(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.run_missing_experiments(SimpleRunner(), {"p3": [1, 2]}, count=2)
+    c.run_missing_experiments(SimpleRunner(), {"p3": 3})
+
+    plan = c.plan_missing_experiments([{"p3": [1, 2, 3, 4]}, {"p3": 4}], count=2)
+    assert plan.missing == [
+        ({**default_params, "p3": 3}, 1),
+        ({**default_params, "p3": 4}, 2),
+    ]
+    assert (plan.requested, plan.complete, plan.stored, len(plan)) == (4, 2, 5, 3)
+    assert plan.summary() == (
+        "3 runs to execute for 2 of 4 combinations (2 complete, 5 of 8 runs stored)"
+    )
+    assert list(plan) == list(c.get_missing_experiments({"p3": [1, 2, 3, 4]}, 2))
+
+
+def test_rerun_failed_experiments(default_params, campaign_dir, tmp_path):
+    # fail on the first run only
+    marker = str(tmp_path / "failed")
+    command = f"""import os, sys
+if not os.path.exists({marker!r}):
+    open({marker!r}, "w").close()
+    sys.exit(1)
+"""
+    c = Campaign.new(["python3", "-c", command], campaign_dir, default_params)
+    runs = {"p3": 1}
+    c.run_missing_experiments(SimpleRunner(), runs)
+    assert [r.exitcode for r, _ in c.get_results_for(runs)] == [1]
+    assert list(c.get_missing_experiments(runs)) == []
+    assert len(list(c.get_missing_experiments(runs, successful_only=True))) == 1
+
+    c.run_missing_experiments(SimpleRunner(), runs, successful_only=True)
+    assert sorted(r.exitcode for r, _ in c.get_results_for(runs)) == [0, 1]
+    assert list(c.get_missing_experiments(runs, successful_only=True)) == []
+
+
+def test_usage_summary(script, default_params, campaign_dir):
+    for backend in ["tinydb", "sqlite"]:
+        c = Campaign.new(script, campaign_dir, default_params, True, backend=backend)
+        c.run_missing_experiments(SimpleRunner(), {"p1": ["a", "b"], "p3": [1, 2]})
+        summaries = c.usage_summary(group_by=["p1"])
+        assert sorted(summaries) == [("a",), ("b",)]
+        results = [r for r, _ in c.get_results_for({"p1": "a", "p3": [1, 2]})]
+        summary = summaries[("a",)]
+        assert summary.runs == 2
+        assert summary.cpu_time == pytest.approx(
+            sum(r.user_time + r.system_time for r in results)
+        )
+        assert summary.max_rss == max(r.max_rss for r in results)
+        assert c.usage_summary({"p1": ["a", "b"], "p3": 1})[()].runs == 2
+
+
+def test_sigterm_kills_forked_processes():
+    # the processes forked during a run do not inherit the SIGTERM handler
+    with _exit_on_sigterm():
+        p = multiprocessing.get_context("fork").Process(target=time.sleep, args=(10,))
+        p.start()
+        p.terminate()
+        p.join(5)
+    assert p.exitcode == -signal.SIGTERM
+
+
+def test_flusher_serialized_with_reads(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.run_missing_experiments(SimpleRunner(), {"p3": [0]})
+    c.flush_policy = FlushPolicy(every=None, interval=0.01)
+    active = []
+    overlaps = []
+
+    def exclusive(method):
+        def wrapper(*args, **kwargs):
+            overlaps.append(bool(active))
+            active.append(method)
+            time.sleep(0.02)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                active.pop()
+
+        return wrapper
+
+    for name in ["insert_results", "get_results_for", "count_all_results"]:
+        setattr(c.db, name, exclusive(getattr(c.db, name)))
+
+    class Reader(ProgressListener):
+        # reads the campaign while the results are flushed on time
+        def on_result(self, result, progress):
+            for _ in range(5):
+                c.get_all_results()
+
+    c.listeners = [Reader()]
+    c.run_missing_experiments(SimpleRunner(), {"p3": [1, 2, 3]}, longest_first=True)
+    assert len(c.get_all_results()) == 4
+    assert overlaps and not any(overlaps)
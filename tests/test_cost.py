@@ -0,0 +1,59 @@
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.cost import CostModel
+from runexpy.result import Result
+from runexpy.runner import SimpleRunner
+
+
+def _result(i, time, exitcode=0, **params):
+    return Result(f"exp_{i}", time, exitcode, params)
+
+
+def test_cost_model_exact_mean():
+    model = CostModel(
+        [
+            _result(0, 1.0, algo="a", n=10),
+            _result(1, 3.0, algo="a", n=10),
+            _result(2, 100.0, 1, algo="a", n=10),
+        ]
+    )
+    assert model.predict({"algo": "a", "n": 10}) == pytest.approx(2.0)
+
+
+def test_cost_model_regression():
+    model = CostModel(
+        [
+            _result(0, 1.0, algo="a", n=10),
+            _result(1, 2.0, algo="a", n=20),
+            _result(2, 3.0, algo="a", n=30),
+            _result(3, 7.0, algo="b", n=10),
+        ]
+    )
+    assert model.predict({"algo": "a", "n": 100}) == pytest.approx(10.0)
+    # a single experiment is run with this algorithm
+    assert model.predict({"algo": "b", "n": 50}) == pytest.approx(7.0)
+    # nothing is known about this algorithm, use the overall mean
+    assert model.predict({"algo": "c", "n": 10}) == pytest.approx(13 / 4)
+
+
+def test_cost_model_no_results():
+    assert CostModel([]).predict({"n": 1}) == 0.0
+
+
+def test_sort_by_expected_time(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    for i, time in enumerate([1.0, 2.0, 3.0]):
+        params = {**default_params, "p3": i}
+        c.write_result(Result(f"exp_{i}", time, 0, params))
+    experiments = [{**default_params, "p3": i} for i in [0, 5, 1, 2]]
+    assert [p["p3"] for p in c.sort_by_expected_time(experiments)] == [5, 2, 1, 0]
+
+
+def test_run_longest_first(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.write_result(Result("exp_0", 1.0, 0, {**default_params, "p3": 0}))
+    c.write_result(Result("exp_1", 2.0, 0, {**default_params, "p3": 1}))
+    c.run_missing_experiments(SimpleRunner(), {"p3": [0, 1, 2, 3]}, 2, True)
+    new_results = c.db.get_results_for({})[2:]
+    assert [r.params["p3"] for r in new_results] == [3, 3, 2, 2, 1, 0]
@@ -1,9 +1,14 @@
+import json
+import multiprocessing
 import os
 
 import pytest
+from tinydb.storages import JSONStorage
 
 from runexpy.database import Database
 from runexpy.result import Result
+from runexpy.storage import JournalStorage
+from runexpy.utils import params_key
 
 
 def test_new_db(script, default_params, campaign_dir):
@@ -113,3 +118,215 @@ def test_retrieve_files(script, default_params, campaign_dir):
         with open(filepath) as f:
             expected_content = f"{filename}\n{check_str}\n"
             assert f.read() == expected_content
+
+
+def test_count_partial_results(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    for i, (p1, p3) in enumerate([("a", 1), ("a", 2), ("b", 1), ("b", 1)]):
+        params = {**default_params, "p1": p1, "p3": p3}
+        db.insert_result(Result(f"exp_{i}", 0.01, 0, params))
+    assert db.count_results_for({}) == 4
+    assert db.count_results_for({"p1": "b", "p2": 3, "p3": 1}) == 2
+    assert db.count_results_for({"p1": "a"}) == 2
+    assert db.count_results_for({"p1": "a", "p3": 1}) == 1
+    assert db.count_results_for({"p1": "c"}) == 0
+    assert db.count_results_for({"p4": "a"}) == 0
+    assert [r.id for r in db.get_results_for({"p3": 1})] == ["exp_0", "exp_2", "exp_3"]
+    assert db.count_all_results() == {
+        params_key({**default_params, "p1": "a", "p3": 1}): 1,
+        params_key({**default_params, "p1": "a", "p3": 2}): 1,
+        params_key({**default_params, "p1": "b", "p3": 1}): 2,
+    }
+
+
+def test_index_rebuilt_on_load(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    params = {**default_params, "p3": 1}
+    result = Result("exp_1", 0.01, 0, params)
+    db.insert_result(result)
+    db = Database.load(campaign_dir)
+    assert db.count_results_for(params) == 1
+    assert db.get_results_for({"p3": 1}) == [result]
+    with pytest.raises(ValueError):
+        db.insert_result(result)
+
+
+def test_insert_results(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    results = [
+        Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}) for i in range(3)
+    ]
+    db.insert_results(results)
+    assert Database.load(campaign_dir).get_results_for({}) == results
+
+    # the whole batch is rejected
+    new = Result("exp_new", 0.01, 0, default_params)
+    with pytest.raises(ValueError):
+        db.insert_results([new, results[0]])
+    with pytest.raises(ValueError):
+        db.insert_results([new, new])
+    assert db.count_results_for({}) == 3
+
+
+def test_insert_keeps_next_id(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False, JournalStorage)
+    other = Database.load(campaign_dir)
+    db.insert_result(Result("exp_0", 0.01, 0, {**default_params, "p3": 0}))
+    table = db._result_table()
+    assert table._next_id == 2
+    # nothing new to read
+    db.refresh()
+    assert table._next_id == 2
+    # the results of other processes move it forward
+    other.insert_result(Result("exp_1", 0.01, 0, {**default_params, "p3": 1}))
+    db.refresh()
+    assert table._next_id == 3
+    db.insert_result(Result("exp_2", 0.01, 0, {**default_params, "p3": 2}))
+    assert sorted(doc.doc_id for doc in table) == [1, 2, 3]
+    assert len(Database.load(campaign_dir).get_results_for({})) == 3
+
+
+def _insert_from_process(campaign_dir, worker, n):
+    db = Database.load(campaign_dir)
+    for i in range(n):
+        params = {**db.get_default_params(), "p1": worker, "p3": i}
+        db.insert_result(Result(f"exp_{worker}_{i}", 0.01, 0, params))
+
+
+@pytest.mark.parametrize("storage", [JSONStorage, JournalStorage])
+def test_concurrent_writers(script, default_params, campaign_dir, storage):
+    db = Database.new(script, default_params, campaign_dir, False, storage)
+    processes = [
+        multiprocessing.Process(target=_insert_from_process, args=(campaign_dir, w, 20))
+        for w in range(4)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    # the results written by the other processes are seen without reloading
+    assert db.count_results_for({}) == 80
+    assert all(db.count_results_for({"p1": w}) == 20 for w in range(4))
+    db = Database.load(campaign_dir)
+    assert db.count_results_for({}) == 80
+    doc_ids = [doc.doc_id for doc in db._result_table()]
+    assert len(set(doc_ids)) == 80
+
+
+@pytest.mark.parametrize("storage", [JSONStorage, JournalStorage])
+def test_reader_sees_new_results(script, default_params, campaign_dir, storage):
+    writer = Database.new(script, default_params, campaign_dir, False, storage)
+    reader = Database.load(campaign_dir)
+    results = [
+        Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}) for i in range(5)
+    ]
+    writer.insert_results(results[:2])
+    assert reader.get_results_for({}) == results[:2]
+    # both write, ids assigned by TinyDB do not clash
+    reader.insert_result(results[2])
+    writer.insert_result(results[3])
+    assert writer.get_results_for({}) == results[:4]
+    with pytest.raises(ValueError):
+        writer.insert_result(results[2])
+    if storage is JournalStorage:
+        # the journal is folded into the snapshot by the writer
+        writer._storage().compact(writer.db.storage.read())
+    reader.insert_result(results[4])
+    assert reader.get_results_for({}) == results
+    assert writer.get_results_for({}) == results
+    assert Database.load(campaign_dir).get_results_for({}) == results
+
+
+def test_get_result_batch(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    results = [
+        Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}, user_time=0.1 * i)
+        for i in range(3)
+    ]
+    db.insert_results(results)
+    db = Database.load(campaign_dir)
+    assert list(db.get_result_batch({})) == results
+    assert list(db.get_result_batch({"p3": 1})) == results[1:2]
+    assert db.get_results_for({}) == results
+    # parameters are plain dictionaries, not the documents of the database
+    params = db.get_results_for({})[0].params
+    assert type(params) is dict and json.loads(json.dumps(params)) == params
+    params["p1"] = "changed"
+    assert db.get_results_for({})[0].params == results[0].params
+
+
+def _index_results(default_params):
+    return [
+        Result(
+            f"exp_{i}",
+            0.01 * (i + 1),
+            i % 3 - 1,
+            {**default_params, "p1": p1, "p3": [i % 2]},
+            "fp" if i % 2 else None,
+        )
+        for i, p1 in enumerate("aabbbc")
+    ]
+
+
+def _queries(db):
+    problems = [{}, {"p1": "b"}, {"p3": [1]}, {"p1": "b", "p3": [1]}, {"p1": "d"}]
+    problems += [{**db.get_default_params(), "p1": "b", "p3": [0]}, {"p4": 0}]
+    counts = [
+        db.count_all_results(fingerprint, successful_only)
+        for fingerprint in [None, "fp", "other"]
+        for successful_only in [False, True]
+    ]
+    mean_time = round(db.mean_time(), 9)
+    return [db.count_results_for(p) for p in problems], counts, mean_time
+
+
+@pytest.mark.parametrize("storage", [JSONStorage, JournalStorage])
+def test_load_from_index(script, default_params, campaign_dir, storage):
+    db = Database.new(script, default_params, campaign_dir, False, storage)
+    results = _index_results(default_params)
+    db.insert_results(results)
+    expected = _queries(db)
+    assert expected[-1] == 0.035
+    # the index is written with the results, loads only read its header
+    db = Database.load(campaign_dir)
+    assert db._snapshot is not None
+    assert db.get_script() == script
+    assert db.get_default_params() == default_params
+    assert _queries(db) == expected
+    assert db.db.storage.cache is None
+    # results are read from the database
+    assert db.get_results_for({}) == results
+    assert db._snapshot is None
+    assert _queries(db) == expected
+
+
+@pytest.mark.parametrize("storage", [JSONStorage, JournalStorage])
+def test_load_from_stale_index(script, default_params, campaign_dir, storage):
+    writer = Database.new(script, default_params, campaign_dir, False, storage)
+    results = _index_results(default_params)
+    writer.insert_results(results[:3])
+    Database.load(campaign_dir)
+    reader = Database.load(campaign_dir)
+    writer.insert_results(results[3:])
+    db = Database.load(campaign_dir)
+    # the index is kept up to date by the writer, results appended to the
+    # journal are read on top of it
+    assert db._snapshot is not None
+    assert (len(db._tail) == 3) == (storage is JournalStorage)
+    assert _queries(db) == _queries(writer)
+    assert _queries(reader) == _queries(writer)
+    reader.insert_result(Result("exp_new", 0.01, 0, default_params))
+    assert reader.get_results_for({}) == writer.get_results_for({})
+
+
+def test_load_from_bad_index(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    db.insert_results(_index_results(default_params))
+    Database.load(campaign_dir)
+    with open(db._index_path(), "r+b") as f:
+        f.truncate(50)
+    db = Database.load(campaign_dir)
+    assert db._snapshot is None
+    assert db.count_results_for({"p1": "b"}) == 3
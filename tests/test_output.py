@@ -0,0 +1,69 @@
+import gzip
+import importlib.util
+import os
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.output import OutputPolicy
+from runexpy.runner import SimpleRunner
+
+
+def test_compress_and_dedup(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.output_policy = OutputPolicy(compress=["std*", "*.txt"], dedup=True)
+    c.run_missing_experiments(SimpleRunner(), {"p3": [1, 2, 3]})
+
+    results = c.get_all_results()
+    for result, files in results:
+        # files are found by their original name, the path of a compressed
+        # file tells how it was compressed
+        assert set(files) == {"out.txt", "stdout", "stderr"}
+        assert files["out.txt"].endswith("out.txt.gz")
+        with gzip.open(files["out.txt"], "rt") as f:
+            assert f.read() == "file\n"
+        with files["out.txt"].open() as f:
+            assert f.read() == "file\n"
+        with files["stdout"].open("rb") as f:
+            assert f.read() == b"stdout\n"
+        run_files = c.db.get_run_files(result)
+        assert run_files["out.txt"] == files["out.txt"]
+        assert dict(run_files) == files
+    paths = [files["out.txt"] for _, files in results]
+    assert all(os.path.samefile(paths[0], path) for path in paths[1:])
+    assert os.stat(paths[0]).st_nlink == 4
+
+    def load(path):
+        with path.open() as f:
+            return {"content": f.read()}
+
+    table = c.to_table(loaders={"out.txt": load})
+    assert table["content"] == ["file\n"] * 3
+
+
+def test_compress_zstd(script, default_params, campaign_dir):
+    zstandard = pytest.importorskip("zstandard")
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.output_policy = OutputPolicy(compress=["*.txt"], compression="zstd")
+    c.run_missing_experiments(SimpleRunner(), {"p3": [1, 2]})
+
+    for _, files in c.get_all_results():
+        with open(files["out.txt"], "rb") as f:
+            assert zstandard.ZstdDecompressor().stream_reader(f).read() == b"file\n"
+        with files["out.txt"].open() as f:
+            assert f.read() == "file\n"
+        with files["stdout"].open() as f:
+            assert f.read() == "stdout\n"
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        OutputPolicy(compression="rar")
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("zstandard") is not None, reason="zstandard installed"
+)
+def test_zstd_requires_zstandard():
+    with pytest.raises(ImportError):
+        OutputPolicy(compression="zstd")
@@ -0,0 +1,155 @@
+import io
+import os
+import socket
+import urllib.request
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.distributed import DistributedRunner
+from runexpy.progress import (
+    Progress,
+    ProgressListener,
+    ProgressTracker,
+    PrometheusServer,
+    PrometheusTextFile,
+    TerminalProgress,
+    format_prometheus,
+)
+from runexpy.runner import AsyncRunner, ParallelRunner, ResourceRunner, SimpleRunner
+
+
+class RecordingListener(ProgressListener):
+    def __init__(self):
+        self.events = []
+
+    def on_start(self, progress):
+        self.events.append(("start", progress))
+
+    def on_result(self, result, progress):
+        self.events.append(("result", progress))
+
+    def on_end(self, progress):
+        self.events.append(("end", progress))
+
+
+def test_progress_estimates():
+    p = Progress(10, concurrency=2, completed=4, busy_time=8.0, elapsed=4.0)
+    assert (p.remaining, p.running, p.worker_utilization) == (6, None, {})
+    assert p.throughput == 1.0
+    assert p.mean_time == 2.0
+    assert p.eta == 6.0
+    assert p.utilization == 1.0
+    assert Progress(10, expected_time=3.0, concurrency=3).eta == 10.0
+    assert Progress(10).eta is None
+    p = Progress(10, elapsed=4.0, running=1, worker_busy=(("a", 4.0), ("b", 1.0)))
+    assert p.worker_utilization == {"a": 1.0, "b": 0.25}
+
+
+def test_tracker_runs():
+    tracker = ProgressTracker([], 3, concurrency=2)
+    tracker.run_started("a")
+    tracker.run_started("b")
+    tracker.run_ended("a", 2.0)
+    tracker.run_started("a")
+    tracker.end()
+    progress = tracker.progress
+    assert progress.running == 2
+    workers = dict(progress.worker_busy)
+    assert workers["a"] >= 2.0 and workers["b"] >= 0.0
+    tracker.run_ended("a", 1.0)
+    tracker.run_ended("b", 1.5)
+    tracker.end()
+    progress = tracker.progress
+    assert (progress.running, progress.worker_busy) == (0, (("a", 3.0), ("b", 1.5)))
+
+
+@pytest.mark.parametrize(
+    "runner, kind",
+    [
+        (SimpleRunner(), "pid"),
+        (ParallelRunner(2), "pid"),
+        (AsyncRunner(2), "slot"),
+        (ResourceRunner(cores=1), "cores"),
+    ],
+)
+def test_campaign_reports_runs(script, default_params, campaign_dir, runner, kind):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    recorder = RecordingListener()
+    c.listeners = [recorder]
+    c.run_missing_experiments(runner, {"p3": [1, 2, 3, 4]})
+
+    start = recorder.events[0][1]
+    assert (start.running, start.worker_busy) == (None, ())
+    results = [progress for name, progress in recorder.events if name == "result"]
+    assert all(0 <= p.running <= runner.concurrency for p in results)
+    end = recorder.events[-1][1]
+    assert end.running == 0
+    assert {worker.split()[0] for worker, _ in end.worker_busy} == {kind}
+    assert len(end.worker_busy) <= runner.concurrency
+    busy = sum(busy for _, busy in end.worker_busy)
+    assert busy == pytest.approx(end.busy_time, rel=0.5)
+    assert all(0 < u <= 1 for u in end.worker_utilization.values())
+    assert 'runexpy_worker_busy_ratio{worker="' in format_prometheus(end)
+
+
+def test_campaign_listeners(script, default_params, campaign_dir, tmp_path):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    recorder = RecordingListener()
+    stream = io.StringIO()
+    metrics = tmp_path / "runexpy.prom"
+    c.listeners = [recorder, TerminalProgress(stream), PrometheusTextFile(metrics)]
+    c.run_missing_experiments(ParallelRunner(2), {"p3": [1, 2, 3, 4]})
+
+    kinds = [kind for kind, _ in recorder.events]
+    assert kinds == ["start"] + ["result"] * 4 + ["end"]
+    start, end = recorder.events[0][1], recorder.events[-1][1]
+    assert (start.planned, start.completed, start.concurrency) == (4, 0, 2)
+    assert (end.completed, end.failed, end.remaining, end.eta) == (4, 0, 0, 0.0)
+    assert end.busy_time > 0
+    assert 0 < end.utilization <= 1
+    assert end.bookkeeping_time > 0
+
+    assert "4/4 done, 0 failed" in stream.getvalue()
+    assert stream.getvalue().endswith("\n")
+    assert "runexpy_runs_completed_total 4\n" in metrics.read_text()
+
+    # the expected time comes from the stored results
+    c.run_missing_experiments(SimpleRunner(), {"p3": [5]})
+    assert recorder.events[-1][1].expected_time == pytest.approx(
+        sum(r.time for r, _ in c.get_all_results()[:4]) / 4
+    )
+
+
+def test_distributed_runner_reports_runs(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    recorder = RecordingListener()
+    c.listeners = [recorder]
+    runner = DistributedRunner(local_workers=2, poll_interval=0.02)
+    c.run_missing_experiments(runner, {"p3": [1, 2, 3, 4]})
+
+    end = recorder.events[-1][1]
+    assert end.running == 0
+    assert 1 <= len(end.worker_busy) <= 2
+    for worker, busy in end.worker_busy:
+        assert worker.startswith(f"{socket.gethostname()}:") and busy > 0
+    # the claims of the collected experiments are removed
+    assert os.listdir(os.path.join(campaign_dir, "queue", "claimed")) == []
+
+
+def test_prometheus_server():
+    server = PrometheusServer(port=0)
+    progress = Progress(3, concurrency=1, completed=1, elapsed=1.0)
+    server.on_start(progress)
+    try:
+        url = f"http://127.0.0.1:{server.port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == format_prometheus(progress)
+    finally:
+        server.on_end(progress)
+    assert "runexpy_runs_running" not in format_prometheus(progress)
+    progress = Progress(3, running=1, elapsed=1.0, worker_busy=(('a "b"', 0.5),))
+    assert "runexpy_runs_running 1\n" in format_prometheus(progress)
+    assert 'runexpy_worker_busy_ratio{worker="a \\"b\\""} 0.5\n' in format_prometheus(
+        progress
+    )
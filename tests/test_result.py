@@ -0,0 +1,55 @@
+import json
+import pickle
+
+import pytest
+
+from runexpy.result import ParamsSchema, ParamsView, Result, ResultBatch
+
+
+def test_params_view():
+    schema = ParamsSchema(["a", "b"])
+    view = schema.view({"b": [1], "a": "x"})
+    assert isinstance(view, ParamsView)
+    assert view == {"a": "x", "b": [1]} and {"a": "x", "b": [1]} == view
+    assert list(view) == ["a", "b"] and len(view) == 2
+    assert "a" in view and "c" not in view
+    assert view.get("c") is None
+    with pytest.raises(KeyError):
+        view["c"]
+    # views of the same schema share it
+    assert schema.view(view)._values is view._values
+    assert pickle.loads(pickle.dumps(view)) == view
+
+    result = Result("r", 0.1, 0, view)
+    assert result.to_json()["params"] == {"a": "x", "b": [1]}
+    assert type(result.to_json()["params"]) is dict
+    assert Result.from_json(result.to_json()) == result
+    assert pickle.loads(pickle.dumps(result)) == result
+
+
+def test_result_batch():
+    schema = ParamsSchema(["a", "b"])
+    results = [
+        Result("r0", 0.1, 0, {"a": 0, "b": "x"}),
+        Result("r1", 0.2, 1, {"b": "y", "a": 1}, user_time=0.05),
+        Result("r2", 0.3, -9, {"a": 2, "b": "z"}, max_rss=1024),
+    ]
+    batch = ResultBatch.from_results(results, schema)
+    assert len(batch) == 3
+    assert list(batch) == results
+    assert batch[-1] == results[-1] and batch[1:] == results[1:]
+    assert batch.column("time") == [0.1, 0.2, 0.3]
+    assert batch.column("exitcode") == [0, 1, -9]
+    assert batch.column("b") == ["x", "y", "z"]
+    assert batch.column("user_time") == [None, 0.05, None]
+    assert batch.column("max_rss") == [None, None, 1024]
+    assert batch.column("fingerprint") == [None] * 3
+
+    # results built from the batch have plain parameters
+    assert type(batch[0].params) is dict
+    assert json.dumps(batch[1].params) == '{"a": 1, "b": "y"}'
+    assert batch.params_view(1) == {"a": 1, "b": "y"}
+
+    other = ResultBatch(ParamsSchema(["b", "a"]))
+    other.extend(batch)
+    assert list(other) == results
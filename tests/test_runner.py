@@ -1,13 +1,46 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from functools import partial
 from typing import List
 
 import pytest
 
 from runexpy.database import Database
-from runexpy.runner import ParallelRunner, SimpleRunner
+from runexpy.distributed import (
+    LOST_EXITCODE,
+    DistributedRunner,
+    WorkQueue,
+    run_worker,
+)
+from runexpy.runner import (
+    TIMEOUT_EXITCODE,
+    AsyncRunner,
+    ParallelRunner,
+    PythonFunctionRunner,
+    ResourceRunner,
+    Resources,
+    RetryPolicy,
+    Runner,
+    ScratchPolicy,
+    SimpleRunner,
+    _wait,
+)
 from runexpy.utils import ParamsT
 
 
-@pytest.fixture(scope="module", params=[SimpleRunner(), ParallelRunner(4)])
+@pytest.fixture(
+    scope="module",
+    params=[
+        SimpleRunner(),
+        ParallelRunner(4),
+        AsyncRunner(2),
+        ResourceRunner(),
+        DistributedRunner(local_workers=2, poll_interval=0.05),
+    ],
+)
 def runner(request):
     return request.param
 
@@ -42,3 +75,489 @@ def test_runners(runner, script, default_params, campaign_dir):
         assert "out.txt" in created_files
         with open(created_files["out.txt"]) as f:
             assert f.read() == "file\n"
+
+
+def test_runners_exitcode(runner, default_params, campaign_dir):
+    script = ["python3", "-c", "import sys; sys.exit(int(sys.argv[-1]))"]
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations = [{"p1": 0, "p2": 0, "p3": i} for i in range(3)]
+    results = runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    assert sorted(r.exitcode for r in results) == [0, 1, 2]
+
+
+def test_runners_usage(runner, default_params, campaign_dir):
+    command = "import sys; sys.stdout.write('x' * 100000); sum(range(10**6))"
+    script = ["python3", "-c", command]
+    db = Database.new(script, default_params, campaign_dir, False)
+    (result,) = runner.run_experiments(
+        script, db.get_data_dir(), [{"p1": 0, "p2": 0, "p3": 0}]
+    )
+    assert result.user_time + result.system_time > 0
+    assert result.max_rss > 2**20
+    assert result.voluntary_switches >= 0
+    assert result.involuntary_switches >= 0
+    if os.path.isdir("/proc"):
+        assert result.write_bytes >= 100000
+        assert result.read_bytes > 0
+
+
+@pytest.mark.parametrize("pidfd", [True, False])
+def test_async_runner_waits_in_loop(pidfd, default_params, campaign_dir, monkeypatch):
+    # the experiments are waited for by the event loop, not by threads
+    if not pidfd:
+        monkeypatch.setattr("runexpy.runner._open_pidfd", lambda pid: None)
+    script = ["python3", "-c", "import time; time.sleep(0.2)"]
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations = [{"p1": 0, "p2": 0, "p3": i} for i in range(4)]
+    threads = threading.active_count()
+    runner = AsyncRunner(4)
+    for result in runner.run_experiments(script, db.get_data_dir(), param_combinations):
+        assert threading.active_count() == threads
+        assert result.exitcode == 0
+        assert result.user_time is not None
+
+
+def test_wait_joins_timer():
+    # the timer killing the experiment must be gone once it is reaped
+    process = subprocess.Popen(["true"], start_new_session=True)
+    threads = threading.active_count()
+    assert _wait(process, 10)[0] == 0
+    assert threading.active_count() == threads
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="requires /proc")
+@pytest.mark.parametrize(
+    "timeout_runner",
+    [
+        SimpleRunner(timeout=0.5),
+        ParallelRunner(2, timeout=0.5),
+        AsyncRunner(2, timeout=0.5),
+        ResourceRunner(timeout=0.5),
+    ],
+)
+def test_timeout(timeout_runner, default_params, campaign_dir, tmp_path):
+    # the child process must be killed too
+    script = ["sh", "-c", f"sleep 30 & echo $! > {tmp_path}/child; wait"]
+    db = Database.new(script, default_params, campaign_dir, False)
+    start = time.time()
+    (result,) = timeout_runner.run_experiments(
+        script, db.get_data_dir(), [{"p1": 0, "p2": 0, "p3": 0}]
+    )
+    assert time.time() - start < 10
+    assert result.exitcode == TIMEOUT_EXITCODE
+    child = (tmp_path / "child").read_text().strip()
+    for _ in range(100):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                # killed but not reaped yet
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    break
+        except FileNotFoundError:
+            break
+        time.sleep(0.01)
+    else:
+        pytest.fail("child process still running")
+
+
+@pytest.mark.parametrize(
+    "retry_runner",
+    [
+        SimpleRunner(retry=RetryPolicy(3, backoff=0.01)),
+        ParallelRunner(2, retry=RetryPolicy(3, backoff=0.01)),
+        AsyncRunner(2, retry=RetryPolicy(3, backoff=0.01)),
+        ResourceRunner(retry=RetryPolicy(3, backoff=0.01)),
+    ],
+)
+def test_retry(retry_runner, default_params, campaign_dir, tmp_path):
+    # fail twice, then succeed
+    command = f"""import os, sys
+counter = {str(tmp_path / "attempts")!r}
+attempts = len(open(counter).read()) if os.path.exists(counter) else 0
+open(counter, "a").write("x")
+sys.exit(0 if attempts == 2 else 3)
+"""
+    script = ["python3", "-c", command]
+    db = Database.new(script, default_params, campaign_dir, False)
+    (result,) = retry_runner.run_experiments(
+        script, db.get_data_dir(), [{"p1": 0, "p2": 0, "p3": 0}]
+    )
+    assert result.exitcode == 0
+    assert os.listdir(db.get_data_dir()) == [result.id]
+
+    os.remove(tmp_path / "attempts")
+    runner = SimpleRunner(retry=RetryPolicy(3, exitcodes=(1, 2)))
+    (result,) = runner.run_experiments(
+        script, db.get_data_dir(), [{"p1": 0, "p2": 0, "p3": 0}]
+    )
+    assert result.exitcode == 3
+    assert (tmp_path / "attempts").read_text() == "x"
+
+
+@pytest.mark.parametrize(
+    "make_runner",
+    [
+        SimpleRunner,
+        partial(ParallelRunner, 2),
+        partial(AsyncRunner, 2),
+        ResourceRunner,
+        partial(DistributedRunner, local_workers=1, poll_interval=0.05),
+    ],
+)
+def test_scratch(make_runner, script, default_params, campaign_dir, tmp_path):
+    # the script also writes a file which is not kept, and its directory
+    command = script[-1] + 'open("cwd.txt", "w").write(os.getcwd())\n'
+    script = script[:-1] + ["import os\n" + command]
+    scratch_dir = tmp_path / "scratch"
+    runner = make_runner(scratch=ScratchPolicy(str(scratch_dir), keep=("out.*",)))
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations = [{"p1": 0, "p2": 0, "p3": i} for i in range(3)]
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    assert sorted(os.listdir(db.get_data_dir())) == sorted(r.id for r in results)
+    assert os.listdir(scratch_dir) == []
+    for result in results:
+        assert result.exitcode == 0
+        files = db.get_files_for(result)
+        assert set(files) == {"stdout", "stderr", "out.txt"}
+        with open(files["out.txt"]) as f:
+            assert f.read() == "file\n"
+
+    # everything is kept by default
+    runner = make_runner(scratch=ScratchPolicy(str(scratch_dir)))
+    (result,) = runner.run_experiments(script, db.get_data_dir(), [default_params])
+    with open(db.get_files_for(result)["cwd.txt"]) as f:
+        assert f.read() == str(scratch_dir / result.id)
+
+
+@pytest.fixture()
+def python_module(tmp_path):
+    module = tmp_path / "experiment_module.py"
+    module.write_text(f"""import sys
+from argparse import ArgumentParser
+
+with open({str(tmp_path / "imports.log")!r}, "a") as f:
+    f.write("imported\\n")
+
+
+def main():
+    ap = ArgumentParser()
+    for p in ["p1", "p2", "p3"]:
+        ap.add_argument(f"--{{p}}", type=int)
+    args = ap.parse_args()
+    print("stdout")
+    print("stderr", file=sys.stderr)
+    with open("out.txt", "w") as f:
+        f.write(f"{{args.p1 + args.p2 + args.p3}}\\n")
+    sys.exit(args.p1)
+
+
+def run(p1, p2, p3):
+    print(p1, p2, p3)
+""")
+    return str(module)
+
+
+def test_python_function_runner(python_module, default_params, campaign_dir):
+    script = ["python3", python_module]
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations: List[ParamsT] = [
+        {"p1": 0, "p2": 1, "p3": 2},
+        {"p1": 3, "p2": 4, "p3": 5},
+        {"p1": 6, "p2": 7, "p3": 8},
+    ]
+    runner = PythonFunctionRunner(1)
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    assert len(results) == len(param_combinations)
+
+    # the module is imported once by the only worker
+    log = os.path.join(os.path.dirname(python_module), "imports.log")
+    with open(log) as f:
+        assert f.read() == "imported\n"
+
+    for result in results:
+        assert result.exitcode == result.params["p1"]
+        created_files = db.get_files_for(result)
+        assert set(created_files) == {"stdout", "stderr", "out.txt"}
+        with open(created_files["stdout"]) as f:
+            assert f.read() == "stdout\n"
+        with open(created_files["stderr"]) as f:
+            assert f.read() == "stderr\n"
+        with open(created_files["out.txt"]) as f:
+            assert f.read() == f"{sum(result.params.values())}\n"
+
+
+def test_python_function_runner_kwargs(python_module, default_params, campaign_dir):
+    db = Database.new(["python3"], default_params, campaign_dir, False)
+    runner = PythonFunctionRunner(2, python_module, "run", use_argv=False)
+    params: ParamsT = {"p1": 0, "p2": 1, "p3": 2}
+    (result,) = runner.run_experiments([], db.get_data_dir(), [params])
+    assert result.exitcode == 0
+    with open(db.get_files_for(result)["stdout"]) as f:
+        assert f.read() == "0 1 2\n"
+
+
+def test_python_function_runner_scratch(
+    python_module, default_params, campaign_dir, tmp_path
+):
+    script = ["python3", python_module]
+    db = Database.new(script, default_params, campaign_dir, False)
+    scratch = ScratchPolicy(str(tmp_path / "scratch"), keep=())
+    runner = PythonFunctionRunner(1, scratch=scratch)
+    params: ParamsT = {"p1": 0, "p2": 1, "p3": 2}
+    (result,) = runner.run_experiments(script, db.get_data_dir(), [params])
+    assert result.exitcode == 0
+    assert set(db.get_files_for(result)) == {"stdout", "stderr"}
+    assert os.listdir(tmp_path / "scratch") == []
+
+
+def test_resource_runner(default_params, campaign_dir):
+    command = """import json, os, time
+start = time.time()
+time.sleep(0.05)
+affinity = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+with open("out.json", "w") as f:
+    json.dump([start, time.time(), affinity, os.environ["OMP_NUM_THREADS"]], f)
+"""
+    script = ["python3", "-c", command]
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations: List[ParamsT] = [{"p1": i, "p2": 0, "p3": 0} for i in range(3)]
+    # only one experiment fits in memory at a time
+    runner = ResourceRunner(Resources(1, 60), memory=100)
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    assert len(results) == 3
+
+    intervals = []
+    for result in results:
+        assert result.exitcode == 0
+        with open(db.get_files_for(result)["out.json"]) as f:
+            start, end, affinity, threads = json.load(f)
+        assert len(affinity) <= 1
+        assert threads == "1"
+        intervals.append((start, end))
+    intervals.sort()
+    for (_, end), (start, _) in zip(intervals, intervals[1:]):
+        assert end <= start
+
+    with pytest.raises(ValueError):
+        list(
+            ResourceRunner(Resources(1, 200), memory=100).run_experiments(
+                script, db.get_data_dir(), param_combinations
+            )
+        )
+
+
+def _run_intervals(runner, db, script, param_combinations):
+    intervals = []
+    for result in runner.run_experiments(script, db.get_data_dir(), param_combinations):
+        assert result.exitcode == 0
+        with open(db.get_files_for(result)["out.json"]) as f:
+            start, end = json.load(f)[:2]
+        intervals.append((start, end, result.params["p1"]))
+    return sorted(intervals)
+
+
+def test_resource_runner_reservation(default_params, campaign_dir):
+    command = """import json, sys, time
+start = time.time()
+time.sleep(0.3 if sys.argv[-5] == "0" else 0.05)
+with open("out.json", "w") as f:
+    json.dump([start, time.time()], f)
+"""
+    script = ["python3", "-c", command]
+    db = Database.new(script, default_params, campaign_dir, False)
+    # the second experiment needs all the memory, the others half of it
+    param_combinations: List[ParamsT] = [{"p1": i, "p2": 0, "p3": 0} for i in range(4)]
+    requirements = lambda p: Resources(0, 100 if p["p1"] == 1 else 50)  # noqa
+    runner = ResourceRunner(requirements, memory=100, max_overtaken=0)
+    intervals = _run_intervals(runner, db, script, param_combinations)
+    assert [p1 for *_, p1 in intervals[:2]] == [0, 1]
+    # the others wait for the large one to end, then run together
+    assert all(start >= intervals[1][1] for start, *_ in intervals[2:])
+    # small experiments overtake the large one by default
+    runner = ResourceRunner(requirements, memory=100)
+    order = [p1 for *_, p1 in _run_intervals(runner, db, script, param_combinations)]
+    assert order.index(1) == 3
+
+
+def test_resource_runner_max_load(default_params, campaign_dir, monkeypatch):
+    command = """import json, time
+start = time.time()
+time.sleep(0.05)
+with open("out.json", "w") as f:
+    json.dump([start, time.time()], f)
+"""
+    script = ["python3", "-c", command]
+    db = Database.new(script, default_params, campaign_dir, False)
+    param_combinations: List[ParamsT] = [{"p1": i, "p2": 0, "p3": 0} for i in range(3)]
+    # the machine is busy, only one experiment runs at a time
+    monkeypatch.setattr("runexpy.runner._load_average", lambda: 8.0)
+    runner = ResourceRunner(cores=4, max_load=4)
+    intervals = _run_intervals(runner, db, script, param_combinations)
+    assert len(intervals) == 3
+    for (_, end, _), (start, _, _) in zip(intervals, intervals[1:]):
+        assert end <= start
+
+
+def test_distributed_runner_requeue(script, default_params, campaign_dir, tmp_path):
+    db = Database.new(script, default_params, campaign_dir, False)
+    queue_dir = str(tmp_path / "queue")
+    claimed = []
+
+    def worker():
+        # claim the first experiment and die without completing it
+        queue = WorkQueue(queue_dir)
+        item = None
+        while item is None:
+            item = queue.claim()
+            time.sleep(0.01)
+        claimed.append(item)
+        # then behave as a healthy worker
+        run_worker(queue_dir, 0.05, idle_timeout=1)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    runner = DistributedRunner(queue_dir, lease_timeout=0.3, poll_interval=0.05)
+    param_combinations = [{"p1": i, "p2": 0, "p3": 0} for i in range(2)]
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    thread.join()
+
+    ((_, task),) = claimed
+    assert task["params"] == param_combinations[0]
+    assert sorted(r.params["p1"] for r in results) == [0, 1]
+    assert len(os.listdir(db.get_data_dir())) == 2
+
+
+def test_distributed_runner_lost(script, default_params, campaign_dir, tmp_path):
+    db = Database.new(script, default_params, campaign_dir, False)
+    queue_dir = str(tmp_path / "queue")
+    stop = threading.Event()
+
+    def worker():
+        # the first experiment always crashes the worker running it
+        queue = WorkQueue(queue_dir)
+        while not stop.is_set():
+            item = queue.claim()
+            if item is None:
+                time.sleep(0.01)
+                continue
+            name, task = item
+            if task["params"]["p1"] != 0:
+                result = Runner._run_experiment(
+                    task["script"], task["data_dir"], task["params"]
+                )
+                queue.complete(name, result.to_json())
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    runner = DistributedRunner(
+        queue_dir, lease_timeout=0.2, poll_interval=0.02, max_expirations=2
+    )
+    param_combinations = [{"p1": i, "p2": 0, "p3": 0} for i in range(2)]
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    stop.set()
+    thread.join()
+
+    results.sort(key=lambda r: r.params["p1"])
+    assert [r.exitcode for r in results] == [LOST_EXITCODE, 0]
+    with open(db.get_files_for(results[0])["stderr"]) as f:
+        assert "expired 2 times" in f.read()
+
+
+def test_distributed_runner_late_result(script, default_params, campaign_dir, tmp_path):
+    db = Database.new(script, default_params, campaign_dir, False)
+    queue_dir = str(tmp_path / "queue")
+
+    def run(queue, item):
+        _, task = item
+        return Runner._run_experiment(task["script"], task["data_dir"], task["params"])
+
+    def worker():
+        queue = WorkQueue(queue_dir)
+        item = None
+        while item is None:
+            item = queue.claim()
+        # too slow, the experiment is published again and run twice
+        late = run(queue, item)
+        while not os.listdir(os.path.join(queue_dir, "pending")) or (
+            sorted(os.listdir(os.path.join(queue_dir, "pending")))[0] != item[0]
+        ):
+            time.sleep(0.01)
+        again = queue.claim()
+        assert again is not None and again[0] == item[0]
+        for result in [run(queue, again), late]:
+            queue.complete(item[0], result.to_json())
+            while os.listdir(os.path.join(queue_dir, "done")):
+                time.sleep(0.01)
+        run_worker(queue_dir, 0.01, idle_timeout=0.5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    runner = DistributedRunner(queue_dir, lease_timeout=0.2, poll_interval=0.02)
+    param_combinations = [{"p1": i, "p2": 0, "p3": 0} for i in range(2)]
+    results = list(
+        runner.run_experiments(script, db.get_data_dir(), param_combinations)
+    )
+    thread.join()
+
+    assert sorted(r.params["p1"] for r in results) == [0, 1]
+    # the run directory of the discarded result is removed
+    assert sorted(os.listdir(db.get_data_dir())) == sorted(r.id for r in results)
+
+
+def test_distributed_runners_share_queue(
+    script, default_params, campaign_dir, tmp_path
+):
+    db = Database.new(script, default_params, campaign_dir, False)
+    queue_dir = str(tmp_path / "queue")
+    results = {}
+
+    def coordinator(shard):
+        runner = DistributedRunner(queue_dir, poll_interval=0.02)
+        param_combinations = [{"p1": shard, "p2": 0, "p3": i} for i in range(5)]
+        results[shard] = list(
+            runner.run_experiments(script, db.get_data_dir(), param_combinations)
+        )
+
+    threads = [
+        threading.Thread(target=coordinator, args=(s,), daemon=True) for s in range(2)
+    ]
+    threads.append(
+        threading.Thread(target=run_worker, args=(queue_dir, 0.01, 1), daemon=True)
+    )
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+
+    # each runner collects the results of its own experiments only
+    for shard in range(2):
+        assert sorted(r.params["p3"] for r in results[shard]) == list(range(5))
+        assert all(r.params["p1"] == shard for r in results[shard])
+    ids = sorted(r.id for shard in range(2) for r in results[shard])
+    assert sorted(os.listdir(db.get_data_dir())) == ids
+
+
+def test_python_function_runner_timeout(default_params, campaign_dir, tmp_path):
+    module = tmp_path / "slow_module.py"
+    module.write_text("import time\n\n\ndef main():\n    time.sleep(30)\n")
+    script = ["python3", str(module)]
+    db = Database.new(script, default_params, campaign_dir, False)
+    runner = PythonFunctionRunner(1, timeout=0.5, retry=RetryPolicy(2))
+    start = time.time()
+    (result,) = runner.run_experiments(
+        script, db.get_data_dir(), [{"p1": 0, "p2": 0, "p3": 0}]
+    )
+    assert time.time() - start < 10
+    assert result.exitcode == TIMEOUT_EXITCODE
+    assert os.listdir(db.get_data_dir()) == [result.id]
+    assert result.user_time is not None
@@ -0,0 +1,99 @@
+import itertools
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.space import ParamSpace
+
+
+def test_product_order():
+    space = ParamSpace({"a": [1, 2], "b": range(3), "c": "x"})
+    expected = [
+        {"a": a, "b": b, "c": "x"} for a, b in itertools.product([1, 2], range(3))
+    ]
+    assert len(space) == 6
+    assert list(space) == expected
+    assert [space[i] for i in range(len(space))] == expected
+    assert space[-1] == expected[-1]
+
+
+def test_slicing():
+    space = ParamSpace({"a": range(10), "b": range(10)})
+    part = space[15:40:5]
+    assert len(part) == 5
+    assert list(part) == [{"a": i // 10, "b": i % 10} for i in range(15, 40, 5)]
+    assert part[1:3][0] == {"a": 2, "b": 0}
+
+
+def test_zipped_axes_and_constraints():
+    space = ParamSpace(
+        {("lower", "upper"): [(0, 1), (1, 3)], "x": [0, 2]},
+        constraints=[lambda p: p["x"] < p["upper"]],
+    )
+    assert list(space) == [
+        {"lower": 0, "upper": 1, "x": 0},
+        {"lower": 1, "upper": 3, "x": 0},
+        {"lower": 1, "upper": 3, "x": 2},
+    ]
+    with pytest.raises(ValueError):
+        ParamSpace({("lower", "upper"): [(0, 1, 2)]})
+
+
+def test_huge_space_is_lazy():
+    space = ParamSpace({"a": range(10**9), "b": range(10**9)})
+    assert len(space) == 10**18
+    assert space[10**18 - 1] == {"a": 10**9 - 1, "b": 10**9 - 1}
+    assert len(space.sample(5, seed=0)) == 5
+
+
+def test_sample():
+    space = ParamSpace({"a": range(10), "b": range(10)}, [lambda p: p["a"] < p["b"]])
+    samples = space.sample(20, seed=1)
+    assert samples == space.sample(20, seed=1)
+    assert len(samples) == 20
+    assert all(p["a"] < p["b"] for p in samples)
+    assert len({(p["a"], p["b"]) for p in samples}) == 20
+    assert len(space.sample(100)) == 45
+
+
+def test_latin_hypercube():
+    space = ParamSpace({"a": range(10), "b": range(100)})
+    samples = space.latin_hypercube(10, seed=0)
+    assert len(samples) == 10
+    assert sorted(p["a"] for p in samples) == list(range(10))
+    assert sorted(p["b"] // 10 for p in samples) == list(range(10))
+
+
+def test_campaign_with_space(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    space = ParamSpace({"p1": [0, 1], "p3": range(3)}, [lambda p: p["p1"] <= p["p3"]])
+    combinations = list(c.list_param_combinations([space, {"p1": 5, "p3": 7}]))
+    expected = [
+        {**default_params, "p1": p1, "p3": p3}
+        for p1, p3 in [(0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (5, 7)]
+    ]
+    assert combinations == expected
+    with pytest.raises(ValueError):
+        list(c.list_param_combinations(ParamSpace({"unknown": 1})))
+
+
+def test_defaults_order_and_none(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    # enumerated in the order of the default parameters, as before spaces
+    combinations = list(c.list_param_combinations({"p3": [1, 2], "p1": [0, 1]}))
+    expected = [
+        {**default_params, "p1": p1, "p3": p3}
+        for p1, p3 in itertools.product([0, 1], [1, 2])
+    ]
+    assert combinations == expected
+    # None stands for the default, an explicit [None] is kept
+    assert list(c.list_param_combinations({"p1": None, "p3": [None]})) == [
+        {**default_params, "p3": None}
+    ]
+    with pytest.raises(ValueError):
+        list(c.list_param_combinations({"p3": None}))
+    # a sliced space keeps its own numbering
+    space = ParamSpace({"p3": [1, 2], "p1": [0, 1]})[1:3]
+    assert list(c.list_param_combinations(space)) == [
+        {**default_params, "p1": p1, "p3": p3} for p3, p1 in [(1, 1), (2, 0)]
+    ]
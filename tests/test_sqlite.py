@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.database import Database
+from runexpy.result import Result
+from runexpy.runner import SimpleRunner
+from runexpy.sqlite import SQLiteDatabase
+from runexpy.utils import params_key
+
+
+def test_new_sqlite_db(script, default_params, campaign_dir):
+    _ = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    db = SQLiteDatabase.load(campaign_dir)
+    assert db.get_script() == script
+    assert db.get_campaign_dir() == campaign_dir
+    assert db.get_default_params() == default_params
+
+
+def test_sqlite_insert_and_query(script, default_params, campaign_dir):
+    db = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    results = [
+        Result(f"exp_{i}", 0.01 * i, 0, {**default_params, "p1": p1, "p3": p3})
+        for i, (p1, p3) in enumerate([("a", 1), ("a", 2), ("b", 1), ("b", 1)])
+    ]
+    for result in results:
+        db.insert_result(result)
+
+    assert db.count_results_for({}) == 4
+    assert db.count_results_for({"p1": "b", "p2": 3, "p3": 1}) == 2
+    assert db.count_results_for({"p1": "a"}) == 2
+    assert db.count_results_for({"p1": "a", "p3": "1"}) == 0
+    assert db.count_results_for({"p4": "a"}) == 0
+    assert db.get_results_for({"p3": 1}) == [results[0], results[2], results[3]]
+    assert db.count_all_results() == {
+        params_key(results[0].params): 1,
+        params_key(results[1].params): 1,
+        params_key(results[2].params): 2,
+    }
+    assert SQLiteDatabase.load(campaign_dir).get_results_for({}) == results
+    assert type(db.get_results_for({})[0].params) is dict
+    assert list(db.get_result_batch({"p3": 1})) == [results[0], results[2], results[3]]
+
+
+def test_sqlite_mean_time(script, default_params, campaign_dir):
+    db = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    assert db.mean_time() is None
+    db.insert_results(
+        Result(f"exp_{i}", float(i), i // 2, default_params) for i in range(3)
+    )
+    # failed runs are not counted
+    assert db.mean_time() == 0.5
+
+
+def test_sqlite_insert_bad_results(script, default_params, campaign_dir):
+    db = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    result = Result("exp_1", 0.01, 0, default_params)
+    db.insert_result(result)
+    with pytest.raises(ValueError):
+        db.insert_result(result)
+    with pytest.raises(ValueError):
+        db.insert_result(Result("exp_2", 0.01, 0, {"a": 0}))
+    assert db.count_results_for({}) == 1
+
+
+def test_migrate_from_tinydb(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False)
+    results = [
+        Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}) for i in range(3)
+    ]
+    for result in results:
+        db.insert_result(result)
+
+    c = Campaign.load(campaign_dir, backend="sqlite")
+    assert isinstance(c.db, SQLiteDatabase)
+    assert c.db.get_results_for({}) == results
+    # the SQLite database is picked up from now on
+    assert isinstance(Campaign.load(campaign_dir).db, SQLiteDatabase)
+    with pytest.raises(FileExistsError):
+        SQLiteDatabase.migrate(campaign_dir)
+
+
+def test_interrupted_migration(script, default_params, campaign_dir, monkeypatch):
+    db = Database.new(script, default_params, campaign_dir, False)
+    results = [
+        Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}) for i in range(3)
+    ]
+    for result in results:
+        db.insert_result(result)
+
+    def interrupt(self, results):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(SQLiteDatabase, "_insert", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            SQLiteDatabase.migrate(campaign_dir)
+    # no partial database is left behind, the next load migrates again
+    assert not SQLiteDatabase.exists(campaign_dir)
+    assert not [name for name in os.listdir(campaign_dir) if ".sqlite" in name]
+    assert SQLiteDatabase.load(campaign_dir).get_results_for({}) == results
+
+
+def test_sqlite_campaign(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, backend="sqlite")
+    runs = {"p1": 0, "p3": [1, 2, 3]}
+    c.run_missing_experiments(SimpleRunner(), runs)
+    assert len(c.get_results_for(runs)) == 3
+    assert list(c.get_missing_experiments(runs)) == []
+
+    c = Campaign.new(script, campaign_dir, default_params)
+    assert isinstance(c.db, SQLiteDatabase)
+    c = Campaign.new(script, campaign_dir, default_params, True, backend="tinydb")
+    assert isinstance(c.db, Database)
+
+
+def test_sqlite_no_params(script, campaign_dir):
+    db = SQLiteDatabase.new(script, {}, campaign_dir, False)
+    assert db.count_all_results() == {}
+    db.insert_result(Result("exp_0", 0.01, 0, {}))
+    db.insert_result(Result("exp_1", 0.01, 1, {}))
+    assert db.count_all_results() == {(): 2}
+    assert db.count_all_results(successful_only=True) == {(): 1}
+
+    c = Campaign.new(script, campaign_dir, {}, True, backend="sqlite")
+    c.run_missing_experiments(SimpleRunner(), {})
+    assert len(c.get_results_for({})) == 1
+    assert list(c.get_missing_experiments({})) == []
+
+
+def _insert_from_process(campaign_dir, worker, n):
+    db = SQLiteDatabase.load(campaign_dir)
+    for i in range(n):
+        params = {**db.get_default_params(), "p1": worker, "p3": i}
+        db.insert_result(Result(f"exp_{worker}_{i}", 0.01, 0, params))
+
+
+def test_sqlite_concurrent_writers(script, default_params, campaign_dir):
+    db = SQLiteDatabase.new(script, default_params, campaign_dir, False)
+    processes = [
+        multiprocessing.Process(target=_insert_from_process, args=(campaign_dir, w, 20))
+        for w in range(4)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+    assert db.count_results_for({}) == 80
+    assert all(db.count_results_for({"p1": w}) == 20 for w in range(4))
@@ -0,0 +1,70 @@
+import os
+
+from tinydb.storages import MemoryStorage
+
+from runexpy.database import Database
+from runexpy.result import Result
+from runexpy.storage import JournalStorage
+
+
+def _results(default_params, n):
+    return [Result(f"exp_{i}", 0.01, 0, {**default_params, "p3": i}) for i in range(n)]
+
+
+def test_journal_db_roundtrip(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False, JournalStorage)
+    results = _results(default_params, 5)
+    for result in results:
+        db.insert_result(result)
+
+    db_path = os.path.join(campaign_dir, f"{os.path.basename(campaign_dir)}.json")
+    journal = JournalStorage.journal_path(db_path)
+    with open(journal) as f:
+        # one record for the configuration and one per result
+        assert len(f.readlines()) == 1 + len(results)
+
+    db = Database.load(campaign_dir)
+    assert isinstance(db.db.storage.storage, JournalStorage)
+    assert db.get_default_params() == default_params
+    assert db.get_results_for({}) == results
+
+
+def test_journal_compaction(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False, JournalStorage)
+    db.db.storage.storage._compact_every = 3
+    results = _results(default_params, 7)
+    for result in results:
+        db.insert_result(result)
+
+    db_path = os.path.join(campaign_dir, f"{os.path.basename(campaign_dir)}.json")
+    with open(JournalStorage.journal_path(db_path)) as f:
+        assert len(f.readlines()) == 2
+    assert os.path.getsize(db_path) > 0
+
+    db = Database.load(campaign_dir)
+    assert db.get_results_for({}) == results
+
+
+def test_journal_torn_record(script, default_params, campaign_dir):
+    db = Database.new(script, default_params, campaign_dir, False, JournalStorage)
+    results = _results(default_params, 2)
+    for result in results:
+        db.insert_result(result)
+
+    db_path = os.path.join(campaign_dir, f"{os.path.basename(campaign_dir)}.json")
+    with open(JournalStorage.journal_path(db_path), "a") as f:
+        f.write('{"table": "result", "id": "3", "do')
+
+    db = Database.load(campaign_dir)
+    assert db.get_results_for({}) == results
+    result = Result("exp_new", 0.01, 0, {**default_params, "p3": 10})
+    db.insert_result(result)
+    assert Database.load(campaign_dir).get_results_for({}) == results + [result]
+
+
+def test_other_storage(script, default_params, campaign_dir):
+    # storages without the keywords of the JSON ones
+    db = Database.new(script, default_params, campaign_dir, False, MemoryStorage)
+    results = _results(default_params, 3)
+    db.insert_results(results)
+    assert db.get_results_for({}) == results
@@ -0,0 +1,51 @@
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.runner import ParallelRunner
+from runexpy.sweep import SuccessiveHalving
+
+
+def _read_score(result, files):
+    with files["stdout"].open() as f:
+        return float(f.read())
+
+
+@pytest.fixture()
+def sweep_campaign(campaign_dir):
+    # the score is the distance of x from 5, measured more precisely with more n
+    command = """import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+x, n = int(args["--x"]), int(args["--n"])
+print(abs(x - 5) + 1 / n)
+"""
+    script = ["python3", "-c", command]
+    return Campaign.new(script, campaign_dir, {"x": None, "n": 1})
+
+
+def test_successive_halving(sweep_campaign):
+    c = sweep_campaign
+    sweep = SuccessiveHalving("n", [1, 2, 4], _read_score, keep=1 / 3)
+    rungs = sweep.run(c, ParallelRunner(2), {"x": list(range(9))})
+
+    assert [r.budget for r in rungs] == [1, 2, 4]
+    assert len(rungs[0].scores) == 9
+    assert [p["x"] for p in rungs[0].promoted] == [5, 4, 6]
+    assert [p["x"] for p in rungs[1].promoted] == [5]
+    assert rungs[2].scores == [({"x": 5, "n": 4}, 0.25)]
+    assert c.db.count_results_for({}) == 9 + 3 + 1
+
+    # resuming runs nothing and promotes the same combinations
+    assert sweep.run(c, ParallelRunner(2), {"x": list(range(9))}) == rungs
+    assert c.db.count_results_for({}) == 9 + 3 + 1
+
+
+def test_successive_halving_maximize(sweep_campaign):
+    sweep = SuccessiveHalving("n", [1, 2], _read_score, keep=0.5, maximize=True)
+    rungs = sweep.run(sweep_campaign, ParallelRunner(2), {"x": [0, 5, 7, 8]})
+    assert [p["x"] for p in rungs[0].promoted] == [0, 8]
+    assert [p["x"] for p in rungs[1].promoted] == [0]
+
+    with pytest.raises(ValueError):
+        SuccessiveHalving("m", [1], _read_score).run(
+            sweep_campaign, ParallelRunner(2), {"x": [0]}
+        )
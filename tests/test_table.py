@@ -0,0 +1,119 @@
+import os
+import threading
+from functools import partial
+
+import pytest
+
+from runexpy.campaign import Campaign
+from runexpy.runner import SimpleRunner
+
+
+@pytest.fixture()
+def campaign(script, default_params, campaign_dir):
+    c = Campaign.new(script, campaign_dir, default_params, False)
+    c.run_missing_experiments(SimpleRunner(), {"p1": ["a", "b"], "p3": [1, 2]})
+    return c
+
+
+def read_out(path):
+    with open(path) as f:
+        return {"content": f.read().strip(), "size": os.path.getsize(path)}
+
+
+def test_to_table(campaign):
+    table = campaign.to_table({"p1": "a", "p3": [1, 2]}, {"out.txt": read_out})
+    assert len(table) == 2
+    assert list(table.columns) == [
+        "id",
+        "time",
+        "exitcode",
+        "p1",
+        "p2",
+        "p3",
+        "content",
+        "size",
+    ]
+    assert table["p3"] == [1, 2]
+    assert table["content"] == ["file", "file"]
+
+    # missing files give empty fields
+    table = campaign.to_table(loaders={"out.txt": read_out, "none.txt": read_out})
+    assert len(table) == 4
+    assert table["size"] == [5] * 4
+
+
+calls = []
+
+
+def loader(path):
+    calls.append(path)
+    return read_out(path)
+
+
+def test_to_table_cache(campaign):
+    calls.clear()
+    campaign.to_table(loaders={"out.txt": loader})
+    assert len(calls) == 4
+    campaign.to_table(loaders={"out.txt": loader})
+    assert len(calls) == 4
+
+    # modified files are parsed again
+    result, files = campaign.get_all_results()[0]
+    with open(files["out.txt"], "w") as f:
+        f.write("changed\n")
+    table = campaign.to_table(loaders={"out.txt": loader})
+    assert calls[4:] == [files["out.txt"]]
+    assert table["content"][0] == "changed"
+
+    campaign.to_table(loaders={"out.txt": loader}, cache=False)
+    assert len(calls) == 9
+
+
+def test_to_table_cache_loader_values(campaign):
+    def make_loader(suffix):
+        def loader(path):
+            return {"content": read_out(path)["content"] + suffix}
+
+        return loader
+
+    def add_suffix(path, suffix="!"):
+        return {"content": read_out(path)["content"] + suffix}
+
+    # loaders differing only by the values they capture are cached separately
+    table = campaign.to_table(loaders={"out.txt": make_loader("1")})
+    assert table["content"][0] == "file1"
+    table = campaign.to_table(loaders={"out.txt": make_loader("2")})
+    assert table["content"][0] == "file2"
+    table = campaign.to_table(loaders={"out.txt": partial(add_suffix, suffix="?")})
+    assert table["content"][0] == "file?"
+    table = campaign.to_table(loaders={"out.txt": partial(add_suffix, suffix="*")})
+    assert table["content"][0] == "file*"
+    table = campaign.to_table(loaders={"out.txt": add_suffix})
+    assert table["content"][0] == "file!"
+
+    # loaders capturing values which cannot be pickled are not cached
+    lock = threading.Lock()
+
+    def locked_loader(path):
+        with lock:
+            calls.append(path)
+            return read_out(path)
+
+    calls.clear()
+    campaign.to_table(loaders={"out.txt": locked_loader})
+    campaign.to_table(loaders={"out.txt": locked_loader})
+    assert len(calls) == 8
+
+
+def test_to_numpy(campaign):
+    np = pytest.importorskip("numpy")
+    array = campaign.to_table(loaders={"out.txt": read_out}).to_numpy()
+    assert array.shape == (4,)
+    assert array["size"].dtype == np.dtype(int)
+    assert list(array["p1"]) == ["a", "a", "b", "b"]
+
+
+def test_to_pandas(campaign):
+    pytest.importorskip("pandas")
+    df = campaign.to_table(loaders={"out.txt": read_out}).to_pandas()
+    assert df.groupby("p1")["size"].sum().to_dict() == {"a": 10, "b": 10}